@@ -0,0 +1,174 @@
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+import logging
+
+import numpy as np
+
+from app.config import settings
+from app.embedding_cache import normalize_text
+from app.models import QueryResponse
+
+logger = logging.getLogger(__name__)
+
+def normalize_query(query: str) -> str:
+    """Normalize a query for exact matching: case, whitespace and trailing punctuation"""
+    return normalize_text(query).lower().rstrip("?!. ")
+
+class AnswerCacheEntry:
+    __slots__ = ("key", "embedding", "source_ids", "document_ids", "response", "expires_at")
+
+    def __init__(
+        self,
+        key: Tuple[str, int],
+        embedding: np.ndarray,
+        source_ids: Tuple[str, ...],
+        document_ids: frozenset,
+        response: QueryResponse,
+        expires_at: float
+    ):
+        self.key = key
+        self.embedding = embedding
+        self.source_ids = source_ids
+        self.document_ids = document_ids
+        self.response = response
+        self.expires_at = expires_at
+
+class AnswerCache:
+    """Cache of generated answers in front of query_knowledge_base.
+
+    Lookups first try the normalized query text, then any cached query whose
+    embedding is within the cosine similarity threshold and whose retrieval
+    returned the same source chunks. Entries expire after a TTL, the least
+    recently used are evicted beyond max_entries, and entries are dropped
+    when one of their source documents changes. Used from the event loop only.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = None,
+        ttl_seconds: float = None,
+        similarity_threshold: float = None
+    ):
+        self.max_entries = max_entries or settings.ANSWER_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or settings.ANSWER_CACHE_TTL_SECONDS
+        self.similarity_threshold = similarity_threshold or settings.ANSWER_CACHE_SIMILARITY_THRESHOLD
+
+        self._entries: "OrderedDict[Tuple[str, int], AnswerCacheEntry]" = OrderedDict()
+        self._by_document: Dict[str, set] = {}
+
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def lookup_exact(self, query: str, max_chunks: int) -> Optional[QueryResponse]:
+        """Cached response for the same normalized query, if any"""
+        entry = self._entries.get((normalize_query(query), max_chunks))
+        if entry is None or self._expire_if_stale(entry):
+            return None
+        self._entries.move_to_end(entry.key)
+        self.exact_hits += 1
+        return entry.response
+
+    def lookup_similar(
+        self,
+        query_embedding: List[float],
+        source_ids: List[str],
+        max_chunks: int
+    ) -> Optional[QueryResponse]:
+        """Cached response for a near-identical query that retrieved the same chunks"""
+        source_ids = tuple(source_ids)
+        query_vector = self._unit(query_embedding)
+        best_entry, best_similarity = None, self.similarity_threshold
+
+        for entry in list(self._entries.values()):
+            if entry.source_ids != source_ids or entry.key[1] != max_chunks:
+                continue
+            if self._expire_if_stale(entry):
+                continue
+            similarity = float(np.dot(entry.embedding, query_vector))
+            if similarity >= best_similarity:
+                best_entry, best_similarity = entry, similarity
+
+        if best_entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(best_entry.key)
+        self.similar_hits += 1
+        return best_entry.response
+
+    def store(self, query: str, max_chunks: int, query_embedding: List[float], response: QueryResponse):
+        """Cache a generated response"""
+        key = (normalize_query(query), max_chunks)
+        if key in self._entries:
+            self._remove(self._entries[key])
+
+        entry = AnswerCacheEntry(
+            key=key,
+            embedding=self._unit(query_embedding),
+            source_ids=tuple(chunk.id for chunk in response.sources),
+            document_ids=frozenset(chunk.document_id for chunk in response.sources),
+            response=response,
+            expires_at=time.monotonic() + self.ttl_seconds
+        )
+        self._entries[key] = entry
+        for document_id in entry.document_ids:
+            self._by_document.setdefault(document_id, set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries.values())))
+            self.evictions += 1
+
+    def invalidate_documents(self, document_ids: Iterable[str]) -> int:
+        """Drop every cached answer that used one of the given documents"""
+        removed = 0
+        for document_id in document_ids:
+            for key in list(self._by_document.get(document_id, ())):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._remove(entry)
+                    removed += 1
+        self.invalidations += removed
+        if removed:
+            logger.info(f"Invalidated {removed} cached answers")
+        return removed
+
+    def clear(self):
+        self._entries.clear()
+        self._by_document.clear()
+
+    def _expire_if_stale(self, entry: AnswerCacheEntry) -> bool:
+        if entry.expires_at > time.monotonic():
+            return False
+        self._remove(entry)
+        self.expirations += 1
+        return True
+
+    def _remove(self, entry: AnswerCacheEntry):
+        self._entries.pop(entry.key, None)
+        for document_id in entry.document_ids:
+            keys = self._by_document.get(document_id)
+            if keys is not None:
+                keys.discard(entry.key)
+                if not keys:
+                    del self._by_document[document_id]
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
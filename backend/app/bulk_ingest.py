@@ -0,0 +1,331 @@
+"""
+Bulk-ingest a directory tree into the knowledge base.
+
+Run from the backend directory, with the API server stopped (Chroma's
+persistent client must not be shared between processes):
+
+    python -m app.bulk_ingest ../data/sample_documents --tenant default
+
+Files are hashed, extracted and chunked in a pool of worker processes, one
+per core by default, so PDF parsing and tokenization are not bound by the
+GIL. The main process embeds the chunks of many files at a time through the
+embedding batcher and stores them with large Chroma adds. Each stored file's
+content hash is appended to a manifest, and files already in it are skipped,
+so an interrupted run resumes where it stopped. Files with identical content
+are ingested once.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterator, List, Optional
+import logging
+
+from app.config import settings
+from app.document_processor import document_processor, chunk_ids, hash_file, SUPPORTED_FILE_TYPES
+from app.models import Document
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MANIFEST = "bulk_ingest_manifest.jsonl"
+# Chunks embedded and stored together
+DEFAULT_BATCH_CHUNKS = 5000
+# Files being processed per worker, bounding memory held by finished results
+FILES_IN_FLIGHT_PER_WORKER = 4
+# Document IDs are derived from the content hash, so an interrupted batch
+# stores the same chunk IDs when it is retried
+DOCUMENT_ID_NAMESPACE = uuid.UUID("6f1c2a0e-3b8d-4c55-9a57-2d0f8e4b7c31")
+
+Embed = Callable[[List[str], List[int]], Awaitable[List[List[float]]]]
+
+class ProcessedFile:
+    """A file hashed, extracted and chunked by a worker"""
+    __slots__ = ("path", "size_bytes", "content_hash", "document_id", "chunks", "metadatas", "error")
+
+    def __init__(self, path: str, size_bytes: int, content_hash: str):
+        self.path = path
+        self.size_bytes = size_bytes
+        self.content_hash = content_hash
+        self.document_id: Optional[str] = None
+        self.chunks: Optional[List[str]] = None
+        self.metadatas: Optional[List[Dict[str, Any]]] = None
+        self.error: Optional[str] = None
+
+class IngestSummary:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.documents = 0
+        self.chunks = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.duplicates = 0
+        self.failed = 0
+        # Time the main process spent embedding and writing, while workers kept extracting
+        self.embed_seconds = 0.0
+        self.store_seconds = 0.0
+
+    def report(self) -> Dict[str, Any]:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "documents": self.documents,
+            "chunks": self.chunks,
+            "megabytes": round(self.bytes / 1e6, 2),
+            "skipped": self.skipped,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "seconds": round(elapsed, 2),
+            "embed_seconds": round(self.embed_seconds, 2),
+            "store_seconds": round(self.store_seconds, 2),
+            "docs_per_sec": round(self.documents / elapsed, 2),
+            "chunks_per_sec": round(self.chunks / elapsed, 1),
+            "mb_per_sec": round(self.bytes / 1e6 / elapsed, 2),
+        }
+
+def find_files(directory: str) -> Iterator[str]:
+    """Supported files under directory, in a stable order"""
+    for root, directories, files in os.walk(directory):
+        directories.sort()
+        for name in sorted(files):
+            if name.rsplit(".", 1)[-1].lower() in SUPPORTED_FILE_TYPES and not name.startswith("."):
+                yield os.path.join(root, name)
+
+def read_manifest(path: str, tenant_id: str) -> FrozenSet[str]:
+    """Content hashes of the files a previous run stored for tenant_id"""
+    if not os.path.exists(path):
+        return frozenset()
+    completed = set()
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by a crash; its batch is stored again
+                continue
+            if entry.get("tenant") == tenant_id:
+                completed.add(entry["content_hash"])
+    return frozenset(completed)
+
+# Set in each worker process by _init_worker
+_completed: FrozenSet[str] = frozenset()
+
+def _init_worker(completed: FrozenSet[str]):
+    global _completed
+    _completed = completed
+    # Workers report failures in their results; keep library logs quiet
+    logging.basicConfig(level=logging.WARNING)
+    # Files are already processed in parallel; extract each one serially
+    settings.EXTRACTION_PROCESSES = 1
+
+def _process_file(path: str) -> ProcessedFile:
+    """Hash a file and, unless a previous run stored it, extract and chunk it"""
+    processed = ProcessedFile(path, os.path.getsize(path), hash_file(path))
+    if processed.content_hash in _completed:
+        return processed
+    try:
+        filename = os.path.basename(path)
+        document_id = str(uuid.uuid5(DOCUMENT_ID_NAMESPACE, processed.content_hash))
+        _, chunks, metadatas = document_processor.process_document(
+            path, filename, filename.rsplit(".", 1)[-1].lower(), document_id
+        )
+        if metadatas:
+            metadatas[0]["size_bytes"] = processed.size_bytes
+            metadatas[0]["content_hash"] = processed.content_hash
+        processed.document_id = document_id
+        processed.chunks = chunks
+        processed.metadatas = metadatas
+    except Exception as e:
+        processed.error = str(e)
+    return processed
+
+async def ingest_directory(
+    directory: str,
+    store,
+    embed: Embed,
+    manifest_path: str = DEFAULT_MANIFEST,
+    workers: int = None,
+    batch_chunks: int = DEFAULT_BATCH_CHUNKS,
+    on_batch: Optional[Callable[[IngestSummary], None]] = None
+) -> IngestSummary:
+    """Ingest every supported file under directory into a tenant store (see the module docstring)"""
+    workers = workers or os.cpu_count() or 1
+    completed = read_manifest(manifest_path, store.tenant_id)
+    summary = IngestSummary()
+    seen_hashes = set(completed)
+    batch: List[ProcessedFile] = []
+    batch_size = 0
+    loop = asyncio.get_running_loop()
+
+    async def flush():
+        nonlocal batch, batch_size
+        if batch:
+            await _store_batch(store, embed, batch, manifest_path, summary)
+            for processed in batch:
+                summary.documents += 1
+                summary.chunks += len(processed.chunks)
+                summary.bytes += processed.size_bytes
+            if on_batch:
+                on_batch(summary)
+        batch, batch_size = [], 0
+
+    # Spawned workers only import the document processor, not the stores
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(completed,)) as pool:
+        paths = find_files(directory)
+        in_flight = set()
+        while True:
+            # Keep the pool busy while the main process embeds and stores
+            for path in paths:
+                in_flight.add(loop.run_in_executor(pool, _process_file, path))
+                if len(in_flight) >= workers * FILES_IN_FLIGHT_PER_WORKER:
+                    break
+            if not in_flight:
+                break
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                processed = future.result()
+                if processed.content_hash in completed:
+                    summary.skipped += 1
+                elif processed.error is not None:
+                    summary.failed += 1
+                    logger.error(f"Failed to process {processed.path}: {processed.error}")
+                elif processed.content_hash in seen_hashes:
+                    summary.duplicates += 1
+                    logger.info(f"Skipping {processed.path}: same content as a file already ingested")
+                elif processed.chunks:
+                    seen_hashes.add(processed.content_hash)
+                    batch.append(processed)
+                    batch_size += len(processed.chunks)
+                else:
+                    summary.failed += 1
+                    logger.warning(f"No text extracted from {processed.path}")
+            if batch_size >= batch_chunks:
+                await flush()
+    await flush()
+    if store.vector_db.lexical_index is not None:
+        store.vector_db.lexical_index.save()
+    return summary
+
+async def _store_batch(store, embed: Embed, batch: List[ProcessedFile], manifest_path: str, summary: IngestSummary):
+    """Embed and store the chunks of a batch of files, then record them in the manifest"""
+    vector_db = store.vector_db
+    ids, texts, metadatas = [], [], []
+    for processed in batch:
+        ids.extend(chunk_ids(processed.document_id, processed.metadatas))
+        texts.extend(processed.chunks)
+        metadatas.extend(processed.metadatas)
+
+    # Chunks a previous, interrupted run already stored keep their IDs
+    stored = set(vector_db.get_chunks(ids)["ids"])
+    new = [i for i, chunk_id in enumerate(ids) if chunk_id not in stored]
+    started = time.perf_counter()
+    embeddings = await embed([texts[i] for i in new], [metadatas[i]["token_count"] for i in new])
+    summary.embed_seconds += time.perf_counter() - started
+
+    started = time.perf_counter()
+    max_batch_size = vector_db.max_batch_size
+    for start in range(0, len(new), max_batch_size):
+        part = new[start:start + max_batch_size]
+        if not vector_db.add_documents(
+            [texts[i] for i in part],
+            [metadatas[i] for i in part],
+            [ids[i] for i in part],
+            embeddings=embeddings[start:start + max_batch_size]
+        ):
+            raise RuntimeError("Failed to store chunks in the vector database")
+
+    documents = []
+    for processed in batch:
+        filename = os.path.basename(processed.path)
+        first = processed.metadatas[0]
+        documents.append(Document(
+            id=processed.document_id,
+            filename=filename,
+            original_filename=filename,
+            file_type=first["file_type"],
+            upload_date=datetime.fromisoformat(first["upload_date"]),
+            chunk_count=len(processed.chunks),
+            size_bytes=processed.size_bytes,
+            content_hash=processed.content_hash
+        ))
+    store.catalog.upsert_many(documents)
+
+    now = datetime.now().isoformat()
+
+    with open(manifest_path, "a", encoding="utf-8") as manifest:
+        for processed in batch:
+            manifest.write(json.dumps({
+                "tenant": store.tenant_id,
+                "content_hash": processed.content_hash,
+                "document_id": processed.document_id,
+                "path": processed.path,
+                "chunks": len(processed.chunks),
+                "completed_at": now,
+            }) + "\n")
+        manifest.flush()
+        os.fsync(manifest.fileno())
+    summary.store_seconds += time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--tenant", default="default")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-chunks", type=int, default=DEFAULT_BATCH_CHUNKS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+
+    # Imported here: opening the stores must stay out of the worker processes
+    from app.openai_service import openai_service
+    from app.rag_service import rag_service
+    from app.tenants import validate_tenant_id
+
+    try:
+        tenant_id = validate_tenant_id(args.tenant)
+    except ValueError as e:
+        parser.error(str(e))
+
+    async def embed(texts: List[str], token_counts: List[int]) -> List[List[float]]:
+        return await openai_service.generate_embeddings(texts, token_counts=token_counts) if texts else []
+
+    def on_batch(summary: IngestSummary):
+        report = summary.report()
+        print(
+            f"{report['documents']} documents, {report['chunks']} chunks stored "
+            f"({report['chunks_per_sec']} chunks/sec)",
+            flush=True
+        )
+
+    store = rag_service.tenants.acquire(tenant_id)
+    try:
+        summary = asyncio.run(ingest_directory(
+            args.directory, store, embed, args.manifest, args.workers, args.batch_chunks, on_batch
+        ))
+    finally:
+        rag_service.tenants.release(store)
+        rag_service.tenants.close_all()
+
+    report = summary.report()
+    print(
+        f"Ingested {report['documents']} documents ({report['chunks']} chunks, {report['megabytes']} MB) "
+        f"in {report['seconds']}s: {report['docs_per_sec']} docs/sec, {report['chunks_per_sec']} chunks/sec, "
+        f"{report['mb_per_sec']} MB/sec"
+    )
+    print(f"Embedding took {report['embed_seconds']}s and storing {report['store_seconds']}s of the main process")
+    print(
+        f"Skipped {report['skipped']} already ingested, {report['duplicates']} duplicates, "
+        f"{report['failed']} failed"
+    )
+    sys.exit(1 if summary.failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import asyncio
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+import logging
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bounded pool for blocking work (Chroma, file parsing, tokenization) so it
+# never runs on the event loop
+_executor = ThreadPoolExecutor(
+    max_workers=settings.BLOCKING_WORKERS,
+    thread_name_prefix="rag-blocking"
+)
+
+# Worker processes for CPU-bound parsing (PDF page extraction), started on
+# first use so deployments that never need them pay nothing
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking function in the shared worker pool and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+def process_pool() -> ProcessPoolExecutor:
+    """The shared pool of EXTRACTION_PROCESSES worker processes.
+
+    Workers are spawned rather than forked: the server runs threads that a
+    fork would copy mid-operation.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=settings.EXTRACTION_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"Started {settings.EXTRACTION_PROCESSES} extraction worker processes")
+        return _process_pool
+
+def shutdown_process_pool():
+    """Stop the worker processes, if they were started"""
+    global _process_pool
+    with _process_pool_lock:
+        pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+def shutdown_executor():
+    """Wait for queued blocking work and stop the worker pools"""
+    _executor.shutdown(wait=True)
+    shutdown_process_pool()
@@ -23,19 +23,125 @@ class Settings:
     # API Keys
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     
+    # OpenAI Client
+    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "")
+    OPENAI_TIMEOUT: float = float(os.getenv("OPENAI_TIMEOUT", "60"))
+    OPENAI_MAX_CONNECTIONS: int = int(os.getenv("OPENAI_MAX_CONNECTIONS", "64"))
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "32"))
+    OPENAI_MAX_CONCURRENCY: int = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+    
+    # Worker threads for blocking work (vector database, document parsing)
+    BLOCKING_WORKERS: int = int(os.getenv("BLOCKING_WORKERS", "8"))
+    # Worker processes for CPU-bound extraction; PDFs with at least
+    # PDF_PARALLEL_MIN_PAGES pages have their pages extracted across them
+    EXTRACTION_PROCESSES: int = int(os.getenv("EXTRACTION_PROCESSES", str(os.cpu_count() or 1)))
+    PDF_PARALLEL_MIN_PAGES: int = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+    
     # Database Configuration
     CHROMA_PERSIST_DIRECTORY: str = os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_db")
+    # Vector backend: "chroma" (HNSW index in memory), "flat" (float32
+    # vectors in a memory-mapped file, searched exactly with NumPy) or
+    # "quantized" (int8 or product-quantized codes in memory-mapped files,
+    # scanned with NumPy, with the best QUANTIZED_RESCORE_FACTOR * k candidates
+    # rescored against the full vectors on disk). All keep their files under
+    # CHROMA_PERSIST_DIRECTORY. TENANT_VECTOR_BACKENDS picks the backend of
+    # non-default tenants, e.g. {"acme": "flat"}; the rest use VECTOR_BACKEND
+    VECTOR_BACKEND: str = os.getenv("VECTOR_BACKEND", "chroma")
+    TENANT_VECTOR_BACKENDS: dict = json.loads(os.getenv("TENANT_VECTOR_BACKENDS", "{}"))
+    QUANTIZATION: str = os.getenv("QUANTIZATION", "int8")
+    QUANTIZED_RESCORE_FACTOR: int = int(os.getenv("QUANTIZED_RESCORE_FACTOR", "50"))
+    PQ_SUBVECTOR_DIMENSIONS: int = int(os.getenv("PQ_SUBVECTOR_DIMENSIONS", "8"))
+    PQ_TRAINING_VECTORS: int = int(os.getenv("PQ_TRAINING_VECTORS", "20000"))
+    # Flat and quantized indexes are rewritten without their deleted rows once
+    # these many, and this fraction of all rows, are deleted
+    COMPACTION_MIN_TOMBSTONES: int = int(os.getenv("COMPACTION_MIN_TOMBSTONES", "1000"))
+    COMPACTION_TOMBSTONE_FRACTION: float = float(os.getenv("COMPACTION_TOMBSTONE_FRACTION", "0.2"))
+    # Vector database writes go through a write-ahead log in the persist
+    # directory and are applied in batches of up to WRITE_BATCH_MAX_CHUNKS
+    # chunks, at most WRITE_BATCH_MAX_DELAY_MS after they are logged
+    WRITE_COORDINATOR_ENABLED: bool = os.getenv("WRITE_COORDINATOR_ENABLED", "false").lower() == "true"
+    WRITE_BATCH_MAX_CHUNKS: int = int(os.getenv("WRITE_BATCH_MAX_CHUNKS", "2000"))
+    WRITE_BATCH_MAX_DELAY_MS: float = float(os.getenv("WRITE_BATCH_MAX_DELAY_MS", "50"))
+    WRITE_LOG_FSYNC: bool = os.getenv("WRITE_LOG_FSYNC", "true").lower() == "true"
     UPLOAD_DIRECTORY: str = os.getenv("UPLOAD_DIRECTORY", "../data/uploads")
+    DOCUMENT_CATALOG_PATH: str = os.getenv("DOCUMENT_CATALOG_PATH", "./document_catalog.db")
+    
+    # Tenants (X-Tenant-ID header) other than "default" keep their Chroma
+    # directory and catalog under TENANTS_DIRECTORY/<tenant>; idle tenants are
+    # unloaded when the estimated memory of loaded ones exceeds the budget
+    TENANTS_DIRECTORY: str = os.getenv("TENANTS_DIRECTORY", "./tenants")
+    TENANT_MEMORY_BUDGET_BYTES: int = int(os.getenv("TENANT_MEMORY_BUDGET_BYTES", str(1024 * 1024 * 1024)))
+    
+    # Background ingestion (jobs are stored in the document catalog database)
+    INGESTION_WORKERS: int = int(os.getenv("INGESTION_WORKERS", "2"))
+    INGESTION_MAX_ATTEMPTS: int = int(os.getenv("INGESTION_MAX_ATTEMPTS", "3"))
     
     # Document Processing
     CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "1000"))
     CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "200"))
+    # Uploads are extracted, embedded and stored this many chunks at a time,
+    # which bounds the memory a large file takes
+    INGEST_BATCH_CHUNKS: int = int(os.getenv("INGEST_BATCH_CHUNKS", "256"))
     MAX_RETRIEVAL_CHUNKS: int = int(os.getenv("MAX_RETRIEVAL_CHUNKS", "5"))
     MAX_CHUNKS: int = int(os.getenv("MAX_CHUNKS", "10"))
     
+    # Batch queries (/api/query/batch): at most BATCH_QUERY_MAX_QUERIES per
+    # request, with BATCH_QUERY_CONCURRENCY answers generated at a time
+    BATCH_QUERY_MAX_QUERIES: int = int(os.getenv("BATCH_QUERY_MAX_QUERIES", "100"))
+    BATCH_QUERY_CONCURRENCY: int = int(os.getenv("BATCH_QUERY_CONCURRENCY", "8"))
+    
+    # Queries scoped to documents with at most this many chunks in total are
+    # answered by exact search over cached per-document candidate lists
+    SCOPED_SEARCH_MAX_CHUNKS: int = int(os.getenv("SCOPED_SEARCH_MAX_CHUNKS", "5000"))
+    SCOPED_SEARCH_CACHE_CHUNKS: int = int(os.getenv("SCOPED_SEARCH_CACHE_CHUNKS", "50000"))
+    
+    # Prompt Context: retrieved chunks are merged, deduplicated and packed into a token budget
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+    CONTEXT_DUPLICATE_THRESHOLD: float = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+    
     # AI/ML Configuration
     EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    # "local" or "openai"; inferred from EMBEDDING_MODEL when unset
+    EMBEDDING_PROVIDER: str = os.getenv("EMBEDDING_PROVIDER", "")
+    
+    # Embedding Batching
+    EMBEDDING_BATCH_MAX_TOKENS: int = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "20000"))
+    EMBEDDING_BATCH_MAX_ITEMS: int = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "256"))
+    EMBEDDING_MAX_PARALLEL_BATCHES: int = int(os.getenv("EMBEDDING_MAX_PARALLEL_BATCHES", "4"))
+    EMBEDDING_MAX_RETRIES: int = int(os.getenv("EMBEDDING_MAX_RETRIES", "3"))
+    EMBEDDING_RETRY_BACKOFF: float = float(os.getenv("EMBEDDING_RETRY_BACKOFF", "0.5"))
+    
+    # Embedding Cache
+    EMBEDDING_CACHE_ENABLED: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_DIRECTORY: str = os.getenv("EMBEDDING_CACHE_DIRECTORY", "./embedding_cache")
+    EMBEDDING_CACHE_MEMORY_BYTES: int = int(os.getenv("EMBEDDING_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
     LLM_MODEL: str = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+    # Answer generator: "openai" (LLM_MODEL chat completion) or "extractive"
+    # (the best-matching context sentences, computed locally)
+    GENERATOR: str = os.getenv("GENERATOR", "openai")
+    EXTRACTIVE_MAX_SENTENCES: int = int(os.getenv("EXTRACTIVE_MAX_SENTENCES", "3"))
+    
+    # Hybrid Retrieval (BM25 lexical index fused with vector search)
+    HYBRID_SEARCH_ENABLED: bool = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+    HYBRID_DENSE_WEIGHT: float = float(os.getenv("HYBRID_DENSE_WEIGHT", "1.0"))
+    HYBRID_LEXICAL_WEIGHT: float = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "1.0"))
+    HYBRID_RRF_K: int = int(os.getenv("HYBRID_RRF_K", "60"))
+    HYBRID_CANDIDATES: int = int(os.getenv("HYBRID_CANDIDATES", "20"))
+    LEXICAL_MAX_SCAN_POSTINGS: int = int(os.getenv("LEXICAL_MAX_SCAN_POSTINGS", "1000"))
+    
+    # Reranking: over-fetch RERANK_CANDIDATES chunks and keep the best by a local model
+    # "" (off), "cross-encoder" (ONNX model in RERANKER_MODEL_PATH) or "embedding"
+    RERANKER: str = os.getenv("RERANKER", "")
+    RERANK_CANDIDATES: int = int(os.getenv("RERANK_CANDIDATES", "20"))
+    RERANKER_MODEL_PATH: str = os.getenv("RERANKER_MODEL_PATH", "./models/ms-marco-MiniLM-L-6-v2")
+    RERANKER_MAX_LENGTH: int = int(os.getenv("RERANKER_MAX_LENGTH", "512"))
+    RERANK_CACHE_MAX_ENTRIES: int = int(os.getenv("RERANK_CACHE_MAX_ENTRIES", "10000"))
+    
+    # Answer Cache
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_MAX_ENTRIES: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+    ANSWER_CACHE_TTL_SECONDS: float = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95"))
     
     # CORS Configuration
     CORS_ORIGINS: list = json.loads(os.getenv("CORS_ORIGINS", '["http://localhost:3000", "http://127.0.0.1:3000"]'))
@@ -0,0 +1,143 @@
+import re
+import math
+from typing import List, NamedTuple, Optional, Set
+import logging
+
+from app.config import settings
+from app.models import DocumentChunk
+
+logger = logging.getLogger(__name__)
+
+# Passages are compared as sets of word n-grams of this length
+SHINGLE_WORDS = 5
+
+WORD_PATTERN = re.compile(r"\w+")
+
+class BuiltContext(NamedTuple):
+    # Texts to put in the prompt, most relevant first
+    passages: List[str]
+    # The retrieved chunks the passages were built from, in passage order
+    sources: List[DocumentChunk]
+    token_count: int
+
+class _Passage:
+    __slots__ = ("document_id", "chunks", "text", "token_count", "rank")
+
+    def __init__(self, chunk: DocumentChunk, rank: int):
+        self.document_id = chunk.document_id
+        self.chunks = [chunk]
+        self.text = chunk.content
+        self.token_count = _token_count(chunk)
+        self.rank = rank
+
+    def extend(self, chunk: DocumentChunk, rank: int):
+        """Append the next chunk of the same document, without the text both share"""
+        previous = self.chunks[-1]
+        new_text = _strip_overlap(previous, chunk)
+        if new_text:
+            # Stored token counts cover whole chunks, so the kept part is prorated
+            self.token_count += math.ceil(_token_count(chunk) * len(new_text) / max(len(chunk.content), 1))
+            self.text = f"{self.text} {new_text}"
+        self.chunks.append(chunk)
+        self.rank = min(self.rank, rank)
+
+class ContextBuilder:
+    """Turns retrieved chunks into a bounded prompt context.
+
+    Chunks of one document with consecutive chunk_index are merged into a
+    single passage with their shared overlap removed. Passages are then
+    taken in order of their best-ranked chunk, skipping any that are
+    near-duplicates (word shingle Jaccard similarity) of one already taken,
+    until the token budget is full. Token counts come from the chunk
+    metadata stored at ingestion; nothing is re-tokenized.
+    """
+
+    def __init__(self, token_budget: int = None, duplicate_threshold: float = None):
+        self.token_budget = token_budget or settings.CONTEXT_TOKEN_BUDGET
+        self.duplicate_threshold = duplicate_threshold or settings.CONTEXT_DUPLICATE_THRESHOLD
+
+    def build(self, chunks: List[DocumentChunk]) -> BuiltContext:
+        """Build the context for chunks given in relevance order"""
+        passages = self._merge_adjacent(chunks)
+        passages.sort(key=lambda passage: passage.rank)
+
+        selected: List[_Passage] = []
+        selected_shingles: List[Set[int]] = []
+        token_count = 0
+        dropped_duplicates = 0
+        for passage in passages:
+            shingles = _shingles(passage.text)
+            if any(_jaccard(shingles, other) >= self.duplicate_threshold for other in selected_shingles):
+                dropped_duplicates += 1
+                continue
+            if token_count + passage.token_count > self.token_budget:
+                if selected:
+                    continue
+                # The best passage alone exceeds the budget: keep its beginning
+                passage.text = passage.text[:len(passage.text) * self.token_budget // passage.token_count]
+                passage.token_count = self.token_budget
+            selected.append(passage)
+            selected_shingles.append(shingles)
+            token_count += passage.token_count
+
+        sources = [chunk for passage in selected for chunk in passage.chunks]
+        if len(sources) < len(chunks):
+            logger.info(
+                f"Context: {len(sources)} of {len(chunks)} chunks in {len(selected)} passages, "
+                f"{token_count} tokens ({dropped_duplicates} near-duplicates dropped)"
+            )
+        return BuiltContext([passage.text for passage in selected], sources, token_count)
+
+    @staticmethod
+    def _merge_adjacent(chunks: List[DocumentChunk]) -> List[_Passage]:
+        ranks = {chunk.id: rank for rank, chunk in enumerate(chunks)}
+        ordered = sorted(chunks, key=lambda chunk: (chunk.document_id, chunk.chunk_index))
+
+        passages: List[_Passage] = []
+        for chunk in ordered:
+            current = passages[-1] if passages else None
+            if (
+                current is not None
+                and current.document_id == chunk.document_id
+                and current.chunks[-1].chunk_index + 1 == chunk.chunk_index
+            ):
+                current.extend(chunk, ranks[chunk.id])
+            else:
+                passages.append(_Passage(chunk, ranks[chunk.id]))
+        return passages
+
+def _token_count(chunk: DocumentChunk) -> int:
+    # Rough estimate for chunks stored without a token count
+    return chunk.metadata.get("token_count") or math.ceil(len(chunk.content) / 4)
+
+def _strip_overlap(previous: DocumentChunk, chunk: DocumentChunk) -> str:
+    """The part of chunk's text that does not repeat the end of the previous chunk"""
+    previous_end: Optional[int] = previous.metadata.get("end_char")
+    start: Optional[int] = chunk.metadata.get("start_char")
+    if previous_end is not None and start is not None:
+        # Character offsets into the source document locate the overlap exactly
+        return chunk.content[max(previous_end - start, 0):].strip()
+
+    # Without offsets, find the longest prefix of chunk that ends the previous text
+    text = chunk.content
+    probe = text[:min(len(text), 64)]
+    position = previous.content.find(probe, max(len(previous.content) - len(text), 0))
+    while position != -1:
+        if text.startswith(previous.content[position:]):
+            return text[len(previous.content) - position:].strip()
+        position = previous.content.find(probe, position + 1)
+    return text
+
+def _shingles(text: str) -> Set[int]:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return {hash(tuple(words))}
+    return {hash(tuple(words[i:i + SHINGLE_WORDS])) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+def _jaccard(a: Set[int], b: Set[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+# Global instance
+context_builder = ContextBuilder()
@@ -0,0 +1,205 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+import logging
+
+from app.config import settings
+from app.models import Document, QueryFilters
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    original_filename TEXT NOT NULL,
+    file_type TEXT NOT NULL,
+    upload_date TEXT NOT NULL,
+    chunk_count INTEGER NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_documents_file_type ON documents(file_type, upload_date);
+CREATE INDEX IF NOT EXISTS idx_documents_upload_date ON documents(upload_date);
+CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash);
+"""
+
+COLUMNS = "id, filename, original_filename, file_type, upload_date, chunk_count, size_bytes, content_hash"
+
+def open_sqlite(path: str, check_same_thread: bool = True) -> sqlite3.Connection:
+    """Autocommit connection in WAL mode, for stores shared between threads and workers"""
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=check_same_thread)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+class DocumentCatalog:
+    """Durable document catalog in SQLite (WAL mode), shared by all workers.
+
+    Each thread gets its own connection; WAL lets readers in other threads
+    and processes proceed while a write is in progress.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or settings.DOCUMENT_CATALOG_PATH
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = open_sqlite(self.path)
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _to_row(document: Document) -> tuple:
+        return (
+            document.id,
+            document.filename,
+            document.original_filename,
+            document.file_type,
+            document.upload_date.isoformat(),
+            document.chunk_count,
+            document.size_bytes,
+            document.content_hash,
+        )
+
+    @staticmethod
+    def _from_row(row: tuple) -> Document:
+        return Document(
+            id=row[0],
+            filename=row[1],
+            original_filename=row[2],
+            file_type=row[3],
+            upload_date=datetime.fromisoformat(row[4]),
+            chunk_count=row[5],
+            size_bytes=row[6],
+            content_hash=row[7],
+        )
+
+    def upsert(self, document: Document):
+        """Insert or replace a document row"""
+        self._connection().execute(
+            f"INSERT OR REPLACE INTO documents ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            self._to_row(document)
+        )
+
+    def upsert_many(self, documents: List[Document]):
+        """Insert or replace document rows in one transaction"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                f"INSERT OR REPLACE INTO documents ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._to_row(document) for document in documents]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def get(self, document_id: str) -> Optional[Document]:
+        row = self._connection().execute(
+            f"SELECT {COLUMNS} FROM documents WHERE id = ?", (document_id,)
+        ).fetchone()
+        return self._from_row(row) if row else None
+
+    def find_by_hash(self, content_hash: str) -> List[Document]:
+        """Documents with the given content hash"""
+        rows = self._connection().execute(
+            f"SELECT {COLUMNS} FROM documents WHERE content_hash = ?", (content_hash,)
+        ).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def delete(self, document_id: str) -> bool:
+        cursor = self._connection().execute("DELETE FROM documents WHERE id = ?", (document_id,))
+        return cursor.rowcount > 0
+
+    def list(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        file_type: Optional[str] = None,
+        uploaded_after: Optional[datetime] = None,
+        uploaded_before: Optional[datetime] = None
+    ) -> Tuple[List[Document], int]:
+        """A page of documents, newest first, and the total number matching the filters"""
+        clauses, params = [], []
+        if file_type:
+            clauses.append("file_type = ?")
+            params.append(file_type)
+        if uploaded_after:
+            clauses.append("upload_date >= ?")
+            params.append(_local_isoformat(uploaded_after))
+        if uploaded_before:
+            clauses.append("upload_date < ?")
+            params.append(_local_isoformat(uploaded_before))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        connection = self._connection()
+        total = connection.execute(f"SELECT COUNT(*) FROM documents {where}", params).fetchone()[0]
+        rows = connection.execute(
+            f"SELECT {COLUMNS} FROM documents {where} ORDER BY upload_date DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [self._from_row(row) for row in rows], total
+
+    def find_documents(self, filters: QueryFilters) -> Dict[str, int]:
+        """Chunk counts of the documents matching query filters, by document ID"""
+        clauses, params = [], []
+        for column, values in [
+            ("id", filters.document_ids),
+            ("file_type", [file_type.lower().lstrip(".") for file_type in filters.file_types or []]),
+            ("filename", filters.filenames),
+        ]:
+            if values:
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+        if filters.uploaded_after:
+            clauses.append("upload_date >= ?")
+            params.append(_local_isoformat(filters.uploaded_after))
+        if filters.uploaded_before:
+            clauses.append("upload_date <= ?")
+            params.append(_local_isoformat(filters.uploaded_before))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connection().execute(f"SELECT id, chunk_count FROM documents {where}", params)
+        return dict(rows.fetchall())
+
+    def total_chunks(self) -> int:
+        """Chunks of all documents, without the cost of counting the vector collection"""
+        return self._connection().execute("SELECT COALESCE(SUM(chunk_count), 0) FROM documents").fetchone()[0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Document count, chunk count and file types"""
+        connection = self._connection()
+        count, chunks = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(chunk_count), 0) FROM documents"
+        ).fetchone()
+        file_types = [row[0] for row in connection.execute("SELECT DISTINCT file_type FROM documents")]
+        return {"total_documents": count, "total_chunks": chunks, "document_types": file_types}
+
+    def replace_all(self, documents: List[Document]):
+        """Replace the whole catalog in one transaction"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM documents")
+            connection.executemany(
+                f"INSERT INTO documents ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._to_row(document) for document in documents]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+def _local_isoformat(value: datetime) -> str:
+    """ISO format of a datetime in local time, as upload dates are stored"""
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.isoformat()
@@ -1,15 +1,288 @@
 import os
 import uuid
-from typing import List, Dict, Any, Tuple
+import zlib
+import hashlib
+from bisect import bisect_right
+from collections import deque
+from typing import List, Dict, Any, Tuple, NamedTuple, Iterable, Iterator, Optional
 from datetime import datetime
 import PyPDF2
 import docx
 import tiktoken
 import logging
 from app.config import settings
+from app.concurrency import process_pool
+from app.metrics import timed_iter
 
 logger = logging.getLogger(__name__)
 
+# File types that can be uploaded, by extension
+SUPPORTED_FILE_TYPES = ("pdf", "txt", "md", "docx")
+
+# Chunks are split on sentence boundaries, matching the original '. ' delimiter
+SENTENCE_DELIMITER = '. '
+
+# Chunk boundaries are content-defined so an edit only changes the chunks
+# around it: once a chunk reaches BOUNDARY_MIN_FRACTION of chunk_size it ends
+# after the first "anchor" sentence, about one sentence in BOUNDARY_ANCHOR_RATE
+# selected by a hash of its text. Chunks following an edit then end on the
+# same anchors as before and get the same content
+BOUNDARY_MIN_FRACTION = 0.75
+BOUNDARY_ANCHOR_RATE = 8
+
+# Parallel PDF extraction hands each worker process this many pages at a time
+PDF_PAGES_PER_TASK = 8
+
+# Text files are read in blocks of this many characters
+TEXT_BLOCK_CHARS = 1024 * 1024
+
+# Explicit page breaks in DOCX paragraphs: <w:br w:type="page"/>
+DOCX_BREAK = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}br"
+DOCX_BREAK_TYPE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}type"
+
+class TextChunk(NamedTuple):
+    """A chunk of text with its character span in the source and its token count.
+
+    Sources with pages (PDF pages, DOCX page breaks) also give the pages of the
+    chunk's first and last characters.
+    """
+    text: str
+    start_char: int
+    end_char: int
+    token_count: int
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+
+def chunk_hash(text: str) -> str:
+    """Content hash identifying a chunk across re-ingestions of its document"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def hash_file(file_path: str) -> str:
+    """SHA-256 of a file, read in 1 MiB blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _next_chunk_id(document_id: str, digest: str, seen: Dict[str, int]) -> str:
+    occurrence = seen.get(digest, 0)
+    seen[digest] = occurrence + 1
+    return f"{document_id}_{digest}" if occurrence == 0 else f"{document_id}_{digest}_{occurrence}"
+
+def chunk_ids(document_id: str, metadatas: List[Dict[str, Any]]) -> List[str]:
+    """Stable chunk IDs derived from content hashes.
+
+    Repeated chunks within a document are told apart by their occurrence
+    number, so unchanged chunks keep their IDs when other parts change.
+    """
+    seen: Dict[str, int] = {}
+    return [_next_chunk_id(document_id, metadata["chunk_hash"][:16], seen) for metadata in metadatas]
+
+def chunk_document_id(chunk_id: str) -> str:
+    """ID of the document a chunk ID was derived from; document IDs are UUIDs without underscores"""
+    return chunk_id.split("_", 1)[0]
+
+# The last PDF opened by an extraction worker process, as (path, mtime, size, reader),
+# so the page ranges of one file sent to the same worker parse it once
+_worker_pdf: Optional[Tuple[str, float, int, PyPDF2.PdfReader]] = None
+
+def _extract_pdf_pages(file_path: str, first: int, last: int) -> List[str]:
+    """Text of pages first to last - 1 of a PDF; runs in an extraction worker process"""
+    global _worker_pdf
+    stat = os.stat(file_path)
+    if _worker_pdf is None or _worker_pdf[:3] != (file_path, stat.st_mtime, stat.st_size):
+        _worker_pdf = (file_path, stat.st_mtime, stat.st_size, PyPDF2.PdfReader(file_path))
+    reader = _worker_pdf[3]
+    return [reader.pages[i].extract_text() + "\n" for i in range(first, last)]
+
+class SentenceWindow:
+    """Incremental state of the chunker over text that arrives in segments.
+
+    Sentence i spans the source from bounds[i] to bounds[i + 1]. A boundary sits
+    right after the period of a '. ' delimiter, where the tokenizer also splits,
+    so per-sentence token counts add up to the token count of the whole text.
+    Sentences are tokenized as soon as the delimiter after them arrives, and
+    the text and sentences before the current window are dropped, so memory is
+    bounded by the window and the segment being read rather than the document.
+
+    Offsets in bounds are absolute in the concatenated text; the buffer holds
+    the text from `base` on.
+    """
+
+    # Dropping consumed sentences copies the buffer, so it is done in batches
+    DISCARD_SENTENCES = 256
+
+    def __init__(self, encoding, chunk_size: int, overlap: int):
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.min_tokens = int(chunk_size * BOUNDARY_MIN_FRACTION)
+        self.buffer = ""
+        self.base = 0
+        self.search_from = 0
+        self.bounds = [0]
+        self.token_positions = [0]
+        self.anchors: List[bool] = []
+        self.long_sentences: Dict[int, List[int]] = {}
+        self.page_starts: List[int] = []
+        self.page_numbers: List[int] = []
+        self.finished = False
+        self.start = 0
+        self.end = 0
+
+    def feed(self, page: Optional[int], text: str):
+        """Append a segment of text, found on page (None when the source has no pages)"""
+        if page is not None and (not self.page_numbers or self.page_numbers[-1] != page):
+            self.page_starts.append(self.base + len(self.buffer))
+            self.page_numbers.append(page)
+        self.buffer += text
+
+        ends = []
+        position = self.buffer.find(SENTENCE_DELIMITER, self.search_from)
+        while position != -1:
+            ends.append(position + 1)
+            position = self.buffer.find(SENTENCE_DELIMITER, position + 1)
+        # The last character may be the period of a delimiter completed by the next segment
+        self.search_from = max(self.search_from, len(self.buffer) - 1, ends[-1] if ends else 0)
+        self._add_sentences(ends)
+
+    def finish(self):
+        """Close the stream; the rest of the text is the last sentence"""
+        self._add_sentences([len(self.buffer)])
+        self.finished = True
+
+    def _add_sentences(self, ends: List[int]):
+        previous = self.bounds[-1] - self.base
+        sentences = []
+        for end in ends:
+            sentences.append(self.buffer[previous:end])
+            previous = end
+        for sentence, tokens, end in zip(sentences, self.encoding.encode_ordinary_batch(sentences), ends):
+            if len(tokens) > self.chunk_size:
+                self.long_sentences[len(self.anchors)] = tokens
+            self.bounds.append(self.base + end)
+            self.token_positions.append(self.token_positions[-1] + len(tokens))
+            self.anchors.append(zlib.crc32(sentence.strip().encode('utf-8')) % BOUNDARY_ANCHOR_RATE == 0)
+
+    def chunks(self) -> Iterator[TextChunk]:
+        """Yield the chunks that no later text can change.
+
+        Slides a sentence-aligned window of at most chunk_size tokens over the
+        sentences, ending each chunk at the first anchor sentence past the
+        minimum size. Until the stream is finished a window is only closed
+        once a sentence that does not fit it is known.
+        """
+        bounds, token_positions = self.bounds, self.token_positions
+        sentence_count = len(bounds) - 1
+        start, end = self.start, self.end
+
+        while start < sentence_count:
+            end = max(end, start)
+            while end < sentence_count and token_positions[end + 1] - token_positions[start] <= self.chunk_size:
+                end += 1
+            if end == sentence_count and not self.finished:
+                break
+
+            if end == start:
+                # A single sentence longer than chunk_size is split on token boundaries
+                yield from self._split_long_sentence(bounds[start], bounds[start + 1], self.long_sentences[start])
+                start += 1
+                continue
+
+            cut = end
+            if end < sentence_count:
+                for candidate in range(start + 1, end + 1):
+                    if self.anchors[candidate - 1] and token_positions[candidate] - token_positions[start] >= self.min_tokens:
+                        cut = candidate
+                        break
+
+            chunk = self._make_chunk(bounds[start], bounds[cut], token_positions[cut] - token_positions[start])
+            if chunk:
+                yield chunk
+            if cut == sentence_count:
+                start = cut
+                break
+
+            # Start the next window on the trailing sentences that fit in the overlap,
+            # but only if the window can still take the next sentence
+            next_start = start + 1
+            while next_start < cut and token_positions[cut] - token_positions[next_start] > self.overlap:
+                next_start += 1
+            if token_positions[cut + 1] - token_positions[next_start] > self.chunk_size:
+                next_start = cut
+            start = next_start
+
+        self.start, self.end = start, end
+        if start >= self.DISCARD_SENTENCES:
+            self._discard()
+
+    def _discard(self):
+        """Drop the sentences and text before the current window"""
+        start = self.start
+        new_base = self.bounds[start]
+        self.buffer = self.buffer[new_base - self.base:]
+        self.search_from -= new_base - self.base
+        self.base = new_base
+        self.bounds = self.bounds[start:]
+        self.token_positions = self.token_positions[start:]
+        self.anchors = self.anchors[start:]
+        self.long_sentences = {i - start: tokens for i, tokens in self.long_sentences.items() if i >= start}
+        # Keep the page the window starts on
+        first_page = max(bisect_right(self.page_starts, new_base) - 1, 0)
+        self.page_starts = self.page_starts[first_page:]
+        self.page_numbers = self.page_numbers[first_page:]
+        self.start = 0
+        self.end -= start
+
+    def _page_at(self, offset: int) -> Optional[int]:
+        index = bisect_right(self.page_starts, offset) - 1
+        return self.page_numbers[index] if index >= 0 else None
+
+    def _split_long_sentence(self, start_char: int, end_char: int, tokens: List[int]) -> Iterator[TextChunk]:
+        """Split one oversized sentence into overlapping token windows"""
+        step = max(self.chunk_size - self.overlap, 1)
+        windows = []
+        for window_start in range(0, len(tokens), step):
+            window_end = min(window_start + self.chunk_size, len(tokens))
+            windows.append((window_start, window_end))
+            if window_end == len(tokens):
+                break
+
+        # Map the token indices at window edges to character offsets in one pass.
+        # A character split across tokens counts as starting at its first byte.
+        sentence_bytes = self.buffer[start_char - self.base:end_char - self.base].encode('utf-8')
+        char_offsets = {}
+        token_bytes = aligned_bytes = chars = previous_index = 0
+        for index in sorted({edge for window in windows for edge in window}):
+            token_bytes += len(self.encoding.decode_bytes(tokens[previous_index:index]))
+            previous_index = index
+            cut = token_bytes
+            while 0 < cut < len(sentence_bytes) and sentence_bytes[cut] & 0xC0 == 0x80:
+                cut -= 1
+            chars += len(sentence_bytes[aligned_bytes:cut].decode('utf-8'))
+            aligned_bytes = cut
+            char_offsets[index] = chars
+
+        for window_start, window_end in windows:
+            window_end_char = end_char if window_end == len(tokens) else start_char + char_offsets[window_end]
+            chunk = self._make_chunk(start_char + char_offsets[window_start], window_end_char, window_end - window_start)
+            if chunk:
+                yield chunk
+
+    def _make_chunk(self, start_char: int, end_char: int, token_count: int) -> Optional[TextChunk]:
+        """Build a TextChunk for the text from start_char to end_char with surrounding whitespace trimmed"""
+        raw = self.buffer[start_char - self.base:end_char - self.base]
+        stripped = raw.strip()
+        if not stripped:
+            return None
+        start_char += len(raw) - len(raw.lstrip())
+        end_char = start_char + len(stripped)
+        return TextChunk(
+            stripped, start_char, end_char, token_count,
+            self._page_at(start_char), self._page_at(end_char - 1)
+        )
+
 class DocumentProcessor:
     def __init__(self):
         self.encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
@@ -20,40 +293,81 @@ class DocumentProcessor:
 
     def extract_text_from_file(self, file_path: str, file_type: str) -> str:
         """Extract text from various file types"""
+        return "".join(text for _, text in self.extract_segments(file_path, file_type))
+
+    def extract_segments(self, file_path: str, file_type: str) -> Iterator[Tuple[Optional[int], str]]:
+        """Yield the text of a file piece by piece as (page, text) pairs.
+
+        PDFs are read one page at a time and DOCX files one paragraph at a time,
+        so a large file is never held as a single string. Text files have no
+        pages and are read in blocks.
+        """
         try:
             if file_type.lower() == 'pdf':
-                return self._extract_from_pdf(file_path)
+                yield from self._extract_from_pdf(file_path)
             elif file_type.lower() in ['docx', 'doc']:
-                return self._extract_from_docx(file_path)
+                yield from self._extract_from_docx(file_path)
             elif file_type.lower() in ['txt', 'md']:
-                return self._extract_from_text(file_path)
+                yield from self._extract_from_text(file_path)
             else:
                 raise ValueError(f"Unsupported file type: {file_type}")
         except Exception as e:
             logger.error(f"Error extracting text from {file_path}: {str(e)}")
             raise
 
-    def _extract_from_pdf(self, file_path: str) -> str:
-        """Extract text from PDF file"""
-        text = ""
+    def _extract_from_pdf(self, file_path: str) -> Iterator[Tuple[Optional[int], str]]:
+        """Extract text from PDF file, page by page"""
         with open(file_path, 'rb') as file:
             pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        return text
+            page_count = len(pdf_reader.pages)
+            if settings.EXTRACTION_PROCESSES > 1 and page_count >= settings.PDF_PARALLEL_MIN_PAGES:
+                yield from self._extract_from_pdf_parallel(file_path, page_count)
+                return
+            for number, page in enumerate(pdf_reader.pages, start=1):
+                yield number, page.extract_text() + "\n"
+
+    def _extract_from_pdf_parallel(self, file_path: str, page_count: int) -> Iterator[Tuple[Optional[int], str]]:
+        """Extract page ranges of a PDF in the worker processes, yielding pages in order.
 
-    def _extract_from_docx(self, file_path: str) -> str:
-        """Extract text from DOCX file"""
+        Each worker opens the file itself. A few ranges per worker are in
+        flight at a time, so the workers stay busy while the caller chunks the
+        pages already extracted and memory stays bounded.
+        """
+        pool = process_pool()
+        window = settings.EXTRACTION_PROCESSES * 2
+        in_flight = deque()
+        try:
+            for first in range(0, page_count, PDF_PAGES_PER_TASK):
+                last = min(first + PDF_PAGES_PER_TASK, page_count)
+                in_flight.append((first, pool.submit(_extract_pdf_pages, file_path, first, last)))
+                if len(in_flight) >= window:
+                    yield from self._numbered_pages(*in_flight.popleft())
+            while in_flight:
+                yield from self._numbered_pages(*in_flight.popleft())
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+
+    def _numbered_pages(self, first: int, future) -> Iterator[Tuple[Optional[int], str]]:
+        for offset, text in enumerate(future.result()):
+            yield first + offset + 1, text
+
+    def _extract_from_docx(self, file_path: str) -> Iterator[Tuple[Optional[int], str]]:
+        """Extract text from DOCX file, paragraph by paragraph.
+
+        DOCX files have no fixed pages; they are counted from explicit page breaks.
+        """
         doc = docx.Document(file_path)
-        text = ""
+        page = 1
         for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text
+            yield page, paragraph.text + "\n"
+            page += len(paragraph._p.findall(f".//{DOCX_BREAK}[@{DOCX_BREAK_TYPE}='page']"))
 
-    def _extract_from_text(self, file_path: str) -> str:
-        """Extract text from text file"""
+    def _extract_from_text(self, file_path: str) -> Iterator[Tuple[Optional[int], str]]:
+        """Extract text from text file, in blocks"""
         with open(file_path, 'r', encoding='utf-8') as file:
-            return file.read()
+            for block in iter(lambda: file.read(TEXT_BLOCK_CHARS), ""):
+                yield None, block
 
     def chunk_text(
         self, 
@@ -62,77 +376,101 @@ class DocumentProcessor:
         overlap: int = None
     ) -> List[str]:
         """Split text into overlapping chunks"""
-        chunk_size = chunk_size or settings.CHUNK_SIZE
-        overlap = overlap or settings.CHUNK_OVERLAP
-        
-        # Split by sentences first, then by tokens
-        sentences = text.split('. ')
-        chunks = []
-        current_chunk = ""
-        
-        for sentence in sentences:
-            # Add sentence to current chunk
-            test_chunk = current_chunk + sentence + ". "
-            
-            # Check if adding this sentence would exceed chunk size
-            if self.count_tokens(test_chunk) > chunk_size and current_chunk:
-                # Save current chunk and start new one with overlap
-                chunks.append(current_chunk.strip())
-                
-                # Create overlap by taking last few sentences
-                overlap_text = self._create_overlap(current_chunk, overlap)
-                current_chunk = overlap_text + sentence + ". "
-            else:
-                current_chunk = test_chunk
-        
-        # Add the final chunk
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
-        
-        return chunks
+        return [chunk.text for chunk in self.split_text(text, chunk_size, overlap)]
 
-    def _create_overlap(self, text: str, overlap_tokens: int) -> str:
-        """Create overlap text with approximately overlap_tokens"""
-        sentences = text.strip().split('. ')
-        overlap_text = ""
-        
-        # Work backwards through sentences
-        for sentence in reversed(sentences):
-            test_overlap = sentence + ". " + overlap_text
-            if self.count_tokens(test_overlap) > overlap_tokens:
-                break
-            overlap_text = test_overlap
-        
-        return overlap_text
+    def split_text(
+        self,
+        text: str,
+        chunk_size: int = None,
+        overlap: int = None
+    ) -> List[TextChunk]:
+        """Split text into overlapping chunks with character offsets and token counts.
+
+        The text is tokenized once, sentence by sentence. Chunks are then chosen by
+        a sliding window over the cumulative token counts of the sentences, so the
+        cost is linear in the length of the document.
+        """
+        if not text.strip():
+            return []
+        return list(self.split_segments([(None, text)], chunk_size, overlap))
+
+    def split_segments(
+        self,
+        segments: Iterable[Tuple[Optional[int], str]],
+        chunk_size: int = None,
+        overlap: int = None
+    ) -> Iterator[TextChunk]:
+        """Chunk text arriving as (page, text) segments, yielding chunks as they are final.
+
+        Gives the same chunks as split_text on the concatenated segments, with
+        the pages they span.
+        """
+        window = SentenceWindow(self.encoding, chunk_size or settings.CHUNK_SIZE, overlap or settings.CHUNK_OVERLAP)
+        for page, text in segments:
+            window.feed(page, text)
+            yield from window.chunks()
+        window.finish()
+        yield from window.chunks()
+
+    def stream_document(
+        self,
+        file_path: str,
+        filename: str,
+        file_type: str,
+        document_id: str,
+        uploaded_at: datetime,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """Yield (chunk ID, text, metadata) for each chunk of a file while it is read.
+
+        Only the page being read and the chunk window are in memory, whatever
+        the size of the file. Document-level values known only at the end
+        (chunk_count) are left to the caller. With timings, the seconds spent
+        extracting text are added to timings["extract"].
+        """
+        seen: Dict[str, int] = {}
+        segments = self.extract_segments(file_path, file_type)
+        if timings is not None:
+            segments = timed_iter(segments, timings, "extract")
+        for i, chunk in enumerate(self.split_segments(segments)):
+            metadata = {
+                "document_id": document_id,
+                "filename": filename,
+                "file_type": file_type,
+                "chunk_index": i,
+                "upload_date": uploaded_at.isoformat(),
+                # Numeric copy of upload_date for range filters
+                "upload_timestamp": uploaded_at.timestamp(),
+                "token_count": chunk.token_count,
+                "start_char": chunk.start_char,
+                "end_char": chunk.end_char,
+                "chunk_hash": chunk_hash(chunk.text)
+            }
+            if chunk.page_start is not None:
+                metadata["page_start"] = chunk.page_start
+                metadata["page_end"] = chunk.page_end
+            yield _next_chunk_id(document_id, metadata["chunk_hash"][:16], seen), chunk.text, metadata
 
     def process_document(
         self, 
         file_path: str, 
         filename: str, 
-        file_type: str
+        file_type: str,
+        document_id: Optional[str] = None
     ) -> Tuple[str, List[str], List[Dict[str, Any]]]:
         """Process a document: extract text, chunk it, and create metadata"""
-        document_id = str(uuid.uuid4())
-        
-        # Extract text
-        text = self.extract_text_from_file(file_path, file_type)
-        
-        # Chunk text
-        chunks = self.chunk_text(text)
+        document_id = document_id or str(uuid.uuid4())
         
-        # Create metadata for each chunk
+        chunks = []
         metadatas = []
-        for i, chunk in enumerate(chunks):
-            metadata = {
-                "document_id": document_id,
-                "filename": filename,
-                "file_type": file_type,
-                "chunk_index": i,
-                "chunk_count": len(chunks),
-                "upload_date": datetime.now().isoformat(),
-                "token_count": self.count_tokens(chunk)
-            }
+        for _, text, metadata in self.stream_document(file_path, filename, file_type, document_id, datetime.now()):
+            chunks.append(text)
             metadatas.append(metadata)
+        # Document-level values that change with every version (chunk_count)
+        # live on the first chunk only, so an edit does not rewrite the
+        # metadata of every chunk
+        if metadatas:
+            metadatas[0]["chunk_count"] = len(chunks)
         
         logger.info(f"Processed document {filename}: {len(chunks)} chunks")
         return document_id, chunks, metadatas
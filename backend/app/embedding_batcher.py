@@ -0,0 +1,101 @@
+import asyncio
+import random
+from typing import List, Optional, Callable
+import logging
+
+from app.config import settings
+from app.embeddings import EmbeddingProvider
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[int, int], None]
+
+class EmbeddingBatcher:
+    """Packs texts into token-budgeted requests and embeds them concurrently.
+
+    Batches are dispatched with bounded parallelism, each retried with
+    exponential backoff on transient provider errors, and the results are
+    reassembled in input order.
+    """
+
+    def __init__(
+        self,
+        provider: EmbeddingProvider,
+        max_batch_tokens: int = None,
+        max_batch_items: int = None,
+        max_parallel: int = None,
+        max_retries: int = None,
+        retry_backoff: float = None
+    ):
+        self.provider = provider
+        self.max_batch_tokens = max_batch_tokens or settings.EMBEDDING_BATCH_MAX_TOKENS
+        self.max_batch_items = max_batch_items or settings.EMBEDDING_BATCH_MAX_ITEMS
+        self.max_parallel = max_parallel or settings.EMBEDDING_MAX_PARALLEL_BATCHES
+        self.max_retries = settings.EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_backoff = settings.EMBEDDING_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+
+    def pack(self, token_counts: List[int]) -> List[List[int]]:
+        """Group text indices into consecutive batches within the token and item budgets"""
+        batches = []
+        current = []
+        current_tokens = 0
+        for index, tokens in enumerate(token_counts):
+            if current and (
+                current_tokens + tokens > self.max_batch_tokens or len(current) >= self.max_batch_items
+            ):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            # A single text over the budget still gets a batch of its own
+            current.append(index)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def embed(
+        self,
+        texts: List[str],
+        token_counts: Optional[List[int]] = None,
+        progress_callback: Optional[ProgressCallback] = None
+    ) -> List[List[float]]:
+        """Embed texts in token-budgeted batches, returning vectors in input order"""
+        if not texts:
+            return []
+        if token_counts is None:
+            # Cheap upper-bound estimate when the caller has no token counts
+            token_counts = [len(text) // 3 + 1 for text in texts]
+
+        batches = self.pack(token_counts)
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        completed = 0
+
+        async def run_batch(indices: List[int]):
+            nonlocal completed
+            async with semaphore:
+                vectors = await self._embed_with_retry([texts[i] for i in indices])
+            for index, vector in zip(indices, vectors):
+                embeddings[index] = vector
+            completed += len(indices)
+            if progress_callback:
+                progress_callback(completed, len(texts))
+
+        await asyncio.gather(*(run_batch(indices) for indices in batches))
+        logger.info(f"Embedded {len(texts)} texts in {len(batches)} batches")
+        return embeddings
+
+    async def _embed_with_retry(self, batch: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                return await self.provider.aembed(batch)
+            except self.provider.retryable_errors as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.retry_backoff * (2 ** attempt) * (1 + random.random())
+                logger.warning(
+                    f"Embedding batch of {len(batch)} failed ({str(e)}); retrying in {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
@@ -0,0 +1,183 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry bookkeeping cost of the in-memory tier on top of the vector itself
+ENTRY_OVERHEAD_BYTES = 200
+
+def normalize_text(text: str) -> str:
+    """Normalize text before hashing so whitespace-only edits still hit the cache"""
+    return unicodedata.normalize("NFC", " ".join(text.split()))
+
+class EmbeddingCache:
+    """Content-addressed embedding cache for a single embedding model.
+
+    Entries are keyed by a hash of the model name and the normalized text.
+    Recently used vectors live in an in-memory LRU tier bounded by a byte
+    budget; every vector is also appended to an on-disk tier of float32 rows
+    that is memory-mapped for reads and survives restarts.
+    """
+
+    def __init__(self, directory: str, model_name: str, memory_budget_bytes: int):
+        self.model_name = model_name
+        self.memory_budget_bytes = memory_budget_bytes
+        self.directory = os.path.join(directory, re.sub(r"[^A-Za-z0-9._-]", "_", model_name))
+        self._lock = threading.Lock()
+
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+
+        self.dimension: Optional[int] = None
+        self._rows: Dict[bytes, int] = {}
+        self._vectors: Optional[np.memmap] = None
+        self._mapped_rows = 0
+        self._vector_file = None
+        self._key_file = None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_disk_tier()
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    @property
+    def _keys_path(self) -> str:
+        return os.path.join(self.directory, "keys.bin")
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.directory, "vectors.f32")
+
+    def _load_disk_tier(self):
+        """Index the rows already on disk"""
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, "r") as file:
+            self.dimension = json.load(file)["dimension"]
+
+        with open(self._keys_path, "rb") as file:
+            keys = file.read()
+        row_bytes = self.dimension * 4
+        # A crash between the two appends can leave one file a row ahead
+        row_count = min(len(keys) // 32, os.path.getsize(self._vectors_path) // row_bytes)
+        for row in range(row_count):
+            self._rows[keys[row * 32:(row + 1) * 32]] = row
+        for path, size in ((self._keys_path, row_count * 32), (self._vectors_path, row_count * row_bytes)):
+            if os.path.getsize(path) != size:
+                with open(path, "r+b") as file:
+                    file.truncate(size)
+        logger.info(f"Loaded {row_count} cached embeddings for {self.model_name}")
+
+    def key(self, text: str) -> bytes:
+        """Cache key for a text"""
+        return hashlib.sha256(f"{self.model_name}\0{normalize_text(text)}".encode("utf-8")).digest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up texts, returning None for each miss"""
+        results = []
+        with self._lock:
+            for text in texts:
+                vector = self._get(self.key(text))
+                results.append(vector.tolist() if vector is not None else None)
+        return results
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]):
+        """Store vectors for texts in both tiers"""
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                array = np.asarray(vector, dtype=np.float32)
+                if key not in self._rows:
+                    self._append_to_disk(key, array)
+                self._remember(key, array)
+            # Vectors before keys: a key on disk always has its row
+            if self._vector_file is not None:
+                self._vector_file.flush()
+                self._key_file.flush()
+
+    def _get(self, key: bytes) -> Optional[np.ndarray]:
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return vector
+
+        row = self._rows.get(key)
+        if row is not None:
+            if row >= self._mapped_rows:
+                self._remap()
+            vector = np.array(self._vectors[row])
+            self._remember(key, vector)
+            self.disk_hits += 1
+            return vector
+
+        self.misses += 1
+        return None
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        """Insert into the LRU tier, evicting the least recently used entries over budget"""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes + ENTRY_OVERHEAD_BYTES
+        while self._memory_bytes > self.memory_budget_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes + ENTRY_OVERHEAD_BYTES
+            self.evictions += 1
+
+    def _append_to_disk(self, key: bytes, vector: np.ndarray):
+        if self.dimension is None:
+            self.dimension = len(vector)
+            with open(self._meta_path, "w") as file:
+                json.dump({"model": self.model_name, "dimension": self.dimension}, file)
+        if len(vector) != self.dimension:
+            raise ValueError(
+                f"Embedding dimension {len(vector)} does not match cached dimension {self.dimension}"
+            )
+        if self._vector_file is None:
+            self._vector_file = open(self._vectors_path, "ab")
+            self._key_file = open(self._keys_path, "ab")
+        self._vector_file.write(vector.tobytes())
+        self._key_file.write(key)
+        self._rows[key] = len(self._rows)
+
+    def _remap(self):
+        """Re-map the vector file after rows were appended"""
+        self._mapped_rows = len(self._rows)
+        self._vectors = np.memmap(
+            self._vectors_path, dtype=np.float32, mode="r", shape=(self._mapped_rows, self.dimension)
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit, miss and eviction counters"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "model": self.model_name,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "disk_entries": len(self._rows),
+            }
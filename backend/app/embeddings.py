@@ -0,0 +1,165 @@
+from typing import List, Optional
+import logging
+
+import openai
+
+from app.config import settings
+from app.concurrency import run_blocking
+from app.embedding_cache import EmbeddingCache
+from app import openai_client
+
+logger = logging.getLogger(__name__)
+
+# Output sizes of the embedding models we know about, used to validate stored collections
+KNOWN_DIMENSIONS = {
+    "all-MiniLM-L6-v2": 384,
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+# Model Chroma used implicitly before collections recorded their embedding model
+LEGACY_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+class EmbeddingConfigurationError(RuntimeError):
+    """Raised when stored vectors were built with a different embedding model"""
+
+class EmbeddingProvider:
+    """Base class for the embedding backends shared by ingestion and querying.
+
+    Instances are also valid Chroma embedding functions, so a collection
+    opened with one never falls back to Chroma's built-in model.
+    """
+    name = "base"
+    # Exceptions worth retrying with backoff (rate limits, timeouts, 5xx)
+    retryable_errors: tuple = ()
+
+    def __init__(self, model_name: str, dimension: Optional[int] = None):
+        self.model_name = model_name
+        self.dimension = dimension or KNOWN_DIMENSIONS.get(model_name)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed a list of texts"""
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query string"""
+        return self.embed([text])[0]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """Embed a list of texts without blocking the event loop"""
+        return await run_blocking(self.embed, texts)
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.embed(list(input))
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Embeddings from the OpenAI embeddings API"""
+    name = "openai"
+    retryable_errors = (
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+        openai.InternalServerError,
+    )
+
+    def __init__(self, model_name: str, dimension: Optional[int] = None):
+        super().__init__(model_name, dimension)
+        # The synchronous client serves callers already running in a worker thread
+        self.client = openai.OpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL or None
+        )
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(model=self.model_name, input=texts)
+        return [item.embedding for item in response.data]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        async with openai_client.upstream_semaphore:
+            response = await openai_client.async_client.embeddings.create(
+                model=self.model_name, input=texts
+            )
+        return [item.embedding for item in response.data]
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """Embeddings from the ONNX all-MiniLM-L6-v2 model bundled with Chroma, run on CPU"""
+    name = "local"
+
+    def __init__(self, model_name: str = LEGACY_EMBEDDING_MODEL, dimension: Optional[int] = None):
+        super().__init__(model_name, dimension)
+        self._model = None
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if self._model is None:
+            # Imported lazily: the model is downloaded on first use
+            from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+            self._model = ONNXMiniLM_L6_V2()
+        return self._model(texts)
+
+class CachedEmbeddingProvider(EmbeddingProvider):
+    """Wraps a provider with an EmbeddingCache so unchanged texts are embedded once"""
+
+    def __init__(self, provider: EmbeddingProvider, cache: EmbeddingCache):
+        super().__init__(provider.model_name, provider.dimension)
+        self.name = provider.name
+        self.retryable_errors = provider.retryable_errors
+        self.provider = provider
+        self.cache = cache
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        embeddings, missing = self._lookup(texts)
+        if not missing:
+            return embeddings
+        return self._fill(texts, embeddings, missing, self.provider.embed(missing))
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        # Cache lookups and stores touch disk and share a lock with ingest threads
+        embeddings, missing = await run_blocking(self._lookup, texts)
+        if not missing:
+            return embeddings
+        computed = await self.provider.aembed(missing)
+        return await run_blocking(self._fill, texts, embeddings, missing, computed)
+
+    def _lookup(self, texts: List[str]):
+        """Cached vectors (None for misses) and the distinct texts still to embed"""
+        embeddings = self.cache.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, embeddings) if vector is None))
+        return embeddings, missing
+
+    def _fill(self, texts, embeddings, missing, computed_vectors):
+        """Cache freshly computed vectors and merge them into the lookup results"""
+        self.cache.put_many(missing, computed_vectors)
+        computed = dict(zip(missing, computed_vectors))
+        return [vector if vector is not None else computed[text] for text, vector in zip(texts, embeddings)]
+
+def create_embedding_provider(provider: str = None, model_name: str = None) -> EmbeddingProvider:
+    """Create the embedding provider selected by EMBEDDING_PROVIDER and EMBEDDING_MODEL"""
+    model_name = model_name or settings.EMBEDDING_MODEL
+    provider = provider or settings.EMBEDDING_PROVIDER
+    if not provider:
+        provider = "local" if model_name == LEGACY_EMBEDDING_MODEL else "openai"
+
+    if provider == "openai":
+        return OpenAIEmbeddingProvider(model_name)
+    elif provider == "local":
+        if model_name != LEGACY_EMBEDDING_MODEL:
+            raise ValueError(f"Local embedding provider only supports {LEGACY_EMBEDDING_MODEL}, got {model_name}")
+        return LocalEmbeddingProvider(model_name)
+    else:
+        raise ValueError(f"Unsupported embedding provider: {provider}")
+
+def create_cached_embedding_provider() -> EmbeddingProvider:
+    """Create the configured provider, behind the embedding cache when it is enabled"""
+    provider = create_embedding_provider()
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return provider
+    cache = EmbeddingCache(
+        settings.EMBEDDING_CACHE_DIRECTORY,
+        provider.model_name,
+        settings.EMBEDDING_CACHE_MEMORY_BYTES
+    )
+    return CachedEmbeddingProvider(provider, cache)
+
+# Global instance
+embedding_provider = create_cached_embedding_provider()
@@ -0,0 +1,191 @@
+import re
+import math
+from typing import List, AsyncIterator, Dict
+import logging
+
+from app.config import settings
+from app.lexical_index import tokenize
+from app import openai_client
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = """You are a helpful AI assistant that answers questions based on the provided context.
+
+Rules:
+1. Answer questions using ONLY the information provided in the context
+2. If the context doesn't contain enough information to answer the question, say so clearly
+3. Always cite which source(s) you used by referring to "Source X"
+4. Be concise and accurate
+5. If asked about something not in the context, politely explain you can only answer based on the provided documents
+
+Context:
+{context}"""
+
+# Sentence ends and paragraph breaks; single newlines are often line wraps in PDF text
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+# Question words and other terms that say nothing about which sentence answers
+QUERY_STOPWORDS = frozenset(
+    "a an and are as at be by can do does did for from how i in is it its me my of on or our "
+    "should the their there this to was we were what when where which who why will with you your".split()
+)
+# Longer sentences are cut, as text without punctuation can make one sentence of a whole chunk
+EXTRACTIVE_MAX_SENTENCE_CHARS = 400
+
+class Generator:
+    """Base class for answer generators, which write the answer to a query from its context passages.
+
+    Passages are cited as "Source 1", "Source 2", ... in the order given.
+    """
+    name = "base"
+
+    async def generate(
+        self,
+        query: str,
+        context_chunks: List[str],
+        conversation_history: List[dict] = None
+    ) -> str:
+        raise NotImplementedError
+
+    async def stream(
+        self,
+        query: str,
+        context_chunks: List[str],
+        conversation_history: List[dict] = None
+    ) -> AsyncIterator[str]:
+        """Yield the answer in fragments; by default the whole answer at once"""
+        yield await self.generate(query, context_chunks, conversation_history)
+
+class OpenAIGenerator(Generator):
+    """Answers with the LLM_MODEL chat completion"""
+    name = "openai"
+
+    def __init__(self):
+        # Async client on the shared, bounded connection pool
+        self.client = openai_client.async_client
+
+    def _build_messages(
+        self,
+        query: str,
+        context_chunks: List[str],
+        conversation_history: List[dict] = None
+    ) -> List[dict]:
+        """Build the chat messages for a query and its retrieved context"""
+        # Create context from chunks
+        context = "\n\n".join([f"Source {i+1}:\n{chunk}" for i, chunk in enumerate(context_chunks)])
+
+        # Prepare messages
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT.format(context=context)},
+        ]
+
+        # Add conversation history if provided
+        if conversation_history:
+            messages.extend(conversation_history[-6:])  # Last 3 exchanges
+
+        messages.append({"role": "user", "content": query})
+        return messages
+
+    async def generate(
+        self,
+        query: str,
+        context_chunks: List[str],
+        conversation_history: List[dict] = None
+    ) -> str:
+        messages = self._build_messages(query, context_chunks, conversation_history)
+        async with openai_client.upstream_semaphore:
+            response = await self.client.chat.completions.create(
+                model=settings.LLM_MODEL,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=500
+            )
+        return response.choices[0].message.content
+
+    async def stream(
+        self,
+        query: str,
+        context_chunks: List[str],
+        conversation_history: List[dict] = None
+    ) -> AsyncIterator[str]:
+        messages = self._build_messages(query, context_chunks, conversation_history)
+        # The upstream slot is held until the stream is fully consumed
+        async with openai_client.upstream_semaphore:
+            stream = await self.client.chat.completions.create(
+                model=settings.LLM_MODEL,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=500,
+                stream=True
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+class ExtractiveGenerator(Generator):
+    """Answers with the context sentences that best match the query, on the CPU and offline.
+
+    Sentences are scored by the query terms they contain, each weighted by
+    how rare it is among the context sentences. The best
+    EXTRACTIVE_MAX_SENTENCES are returned in context order with their
+    sources. Scoring a few passages takes well under a millisecond, so it
+    runs on the event loop.
+    """
+    name = "extractive"
+
+    def __init__(self, max_sentences: int = None):
+        self.max_sentences = max_sentences or settings.EXTRACTIVE_MAX_SENTENCES
+
+    async def generate(
+        self,
+        query: str,
+        context_chunks: List[str],
+        conversation_history: List[dict] = None
+    ) -> str:
+        return self.extract(query, context_chunks)
+
+    def extract(self, query: str, context_chunks: List[str]) -> str:
+        sentences = []
+        for source, passage in enumerate(context_chunks, start=1):
+            for sentence in SENTENCE_PATTERN.split(passage.strip()):
+                sentence = " ".join(sentence.split())
+                if sentence:
+                    sentences.append((source, sentence, set(tokenize(sentence))))
+        if not sentences:
+            return ""
+
+        query_terms = set(tokenize(query)) - QUERY_STOPWORDS
+        frequencies: Dict[str, int] = {}
+        for _, _, terms in sentences:
+            for term in query_terms & terms:
+                frequencies[term] = frequencies.get(term, 0) + 1
+        weights = {term: math.log(1 + len(sentences) / count) for term, count in frequencies.items()}
+
+        scored = [
+            (sum(weights[term] for term in query_terms & terms), position)
+            for position, (_, _, terms) in enumerate(sentences)
+        ]
+        best = sorted(
+            (position for score, position in scored if score > 0),
+            key=lambda position: -scored[position][0]
+        )[:self.max_sentences]
+        if not best:
+            # Nothing matches the query terms: fall back to the opening of the top passage
+            best = [0]
+
+        parts = []
+        for position in sorted(best):
+            source, sentence, _ = sentences[position]
+            if len(sentence) > EXTRACTIVE_MAX_SENTENCE_CHARS:
+                sentence = sentence[:EXTRACTIVE_MAX_SENTENCE_CHARS].rsplit(" ", 1)[0] + "..."
+            parts.append(f"{sentence} (Source {source})")
+        return " ".join(parts)
+
+def create_generator(kind: str = None) -> Generator:
+    """Create the answer generator selected by GENERATOR"""
+    kind = kind or settings.GENERATOR
+    if kind == "openai":
+        return OpenAIGenerator()
+    elif kind == "extractive":
+        return ExtractiveGenerator()
+    else:
+        raise ValueError(f"Unsupported generator: {kind}")
@@ -0,0 +1,247 @@
+import os
+import uuid
+import asyncio
+import threading
+from datetime import datetime
+from typing import List, Dict, Optional
+import logging
+
+from app.config import settings
+from app.concurrency import run_blocking
+from app.document_catalog import open_sqlite
+from app.models import IngestionJob
+from app.rag_service import rag_service
+from app.tenants import current_tenant
+from app.upload_spool import SpooledUpload
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STAGES = ("completed", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id TEXT PRIMARY KEY,
+    document_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    progress REAL NOT NULL,
+    chunks_total INTEGER,
+    chunks_embedded INTEGER NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    tenant_id TEXT NOT NULL DEFAULT 'default'
+);
+CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_stage ON ingestion_jobs(stage);
+"""
+
+COLUMNS = (
+    "id, document_id, filename, file_path, stage, progress, chunks_total, chunks_embedded, "
+    "size_bytes, content_hash, attempts, error, created_at, updated_at, tenant_id"
+)
+
+class JobStore:
+    """Ingestion jobs in SQLite, next to the document catalog by default"""
+
+    def __init__(self, path: str = None):
+        self.path = path or settings.DOCUMENT_CATALOG_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._local = threading.local()
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(ingestion_jobs)")}
+        if "tenant_id" not in columns:
+            # Jobs table from before tenants: all its jobs belong to the default tenant
+            connection.execute("ALTER TABLE ingestion_jobs ADD COLUMN tenant_id TEXT NOT NULL DEFAULT 'default'")
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = open_sqlite(self.path)
+            self._local.connection = connection
+        return connection
+
+    def save(self, job: IngestionJob):
+        """Insert or replace a job row"""
+        self._connection().execute(
+            f"INSERT OR REPLACE INTO ingestion_jobs ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job.id, job.document_id, job.filename, job.file_path, job.stage, job.progress,
+                job.chunks_total, job.chunks_embedded, job.size_bytes, job.content_hash,
+                job.attempts, job.error, job.created_at.isoformat(), job.updated_at.isoformat(), job.tenant_id,
+            )
+        )
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        row = self._connection().execute(
+            f"SELECT {COLUMNS} FROM ingestion_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return self._from_row(row) if row else None
+
+    def list_unfinished(self) -> List[IngestionJob]:
+        """Jobs that were queued or running when the process stopped, oldest first"""
+        rows = self._connection().execute(
+            f"SELECT {COLUMNS} FROM ingestion_jobs WHERE stage NOT IN (?, ?) ORDER BY created_at",
+            FINISHED_STAGES
+        ).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    @staticmethod
+    def _from_row(row: tuple) -> IngestionJob:
+        return IngestionJob(
+            id=row[0],
+            document_id=row[1],
+            filename=row[2],
+            file_path=row[3],
+            stage=row[4],
+            progress=row[5],
+            chunks_total=row[6],
+            chunks_embedded=row[7],
+            size_bytes=row[8],
+            content_hash=row[9],
+            attempts=row[10],
+            error=row[11],
+            created_at=datetime.fromisoformat(row[12]),
+            updated_at=datetime.fromisoformat(row[13]),
+            tenant_id=row[14],
+        )
+
+class IngestionJobManager:
+    """Runs uploaded documents through ingestion on a bounded pool of workers.
+
+    Each job goes queued -> processing -> embedding -> storing -> completed
+    (or failed). Jobs are persisted when queued, started and finished; live
+    stage and progress of running jobs are kept in memory. Jobs left
+    unfinished by a restart are re-queued on start and rerun from the spool
+    file; ingestion diffs against whatever a previous attempt stored, so
+    reruns are idempotent.
+    """
+
+    def __init__(self, store: JobStore = None, max_workers: int = None, max_attempts: int = None):
+        self.store = store or JobStore()
+        self.max_workers = max_workers or settings.INGESTION_WORKERS
+        self.max_attempts = max_attempts or settings.INGESTION_MAX_ATTEMPTS
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._active: Dict[str, IngestionJob] = {}
+
+    async def start(self):
+        """Start the workers and re-queue jobs a previous run left unfinished"""
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_workers)]
+
+        for job in await run_blocking(self.store.list_unfinished):
+            if job.attempts >= self.max_attempts:
+                await self._finish(job, "failed", f"Gave up after {job.attempts} attempts")
+                continue
+            logger.info(f"Resuming ingestion job {job.id} ({job.filename}) from stage {job.stage}")
+            self._enqueue(job)
+
+    async def stop(self):
+        """Stop the workers; running jobs stay unfinished and resume on the next start"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, upload: SpooledUpload, document_id: Optional[str] = None) -> IngestionJob:
+        """Create a job for a spooled upload of the current tenant and queue it.
+
+        With a document_id the upload replaces that document's content.
+        """
+        now = datetime.now()
+        job = IngestionJob(
+            id=upload.upload_id,
+            document_id=document_id or str(uuid.uuid4()),
+            tenant_id=current_tenant.get(),
+            filename=upload.filename,
+            file_path=upload.path,
+            stage="queued",
+            size_bytes=upload.size_bytes,
+            content_hash=upload.content_hash,
+            created_at=now,
+            updated_at=now
+        )
+        await run_blocking(self.store.save, job)
+        self._enqueue(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[IngestionJob]:
+        """Current state of a job of the current tenant, live if it is queued or running"""
+        job = self._active.get(job_id)
+        if job is None:
+            job = await run_blocking(self.store.get, job_id)
+        if job is None or job.tenant_id != current_tenant.get():
+            return None
+        return job
+
+    def _enqueue(self, job: IngestionJob):
+        self._active[job.id] = job
+        self._queue.put_nowait(job.id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(self._active[job_id])
+            except Exception as e:
+                logger.error(f"Ingestion worker error on job {job_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: IngestionJob):
+        # Workers are shared, so the job's tenant is set for each job
+        token = current_tenant.set(job.tenant_id)
+        try:
+            await self._run_job(job)
+        finally:
+            current_tenant.reset(token)
+
+    async def _run_job(self, job: IngestionJob):
+        job.attempts += 1
+        self._set_stage(job, "processing")
+        await run_blocking(self.store.save, job)
+
+        def on_progress(done: int, total: int):
+            job.chunks_embedded = done
+            job.chunks_total = total
+            job.progress = done / total if total else 1.0
+            job.updated_at = datetime.now()
+
+        try:
+            if not os.path.exists(job.file_path):
+                raise FileNotFoundError(f"Spool file for {job.filename} is missing")
+
+            result = await rag_service.upload_document(
+                job.file_path,
+                job.filename,
+                progress_callback=on_progress,
+                content_hash=job.content_hash,
+                document_id=job.document_id,
+                stage_callback=lambda stage: self._set_stage(job, stage)
+            )
+            job.progress = 1.0
+            await self._finish(job, "completed")
+            logger.info(f"Ingestion job {job.id} completed: {job.filename}, {result.chunk_count} chunks")
+        except Exception as e:
+            logger.error(f"Ingestion job {job.id} failed: {str(e)}")
+            await self._finish(job, "failed", str(e))
+
+    def _set_stage(self, job: IngestionJob, stage: str):
+        job.stage = stage
+        job.updated_at = datetime.now()
+
+    async def _finish(self, job: IngestionJob, stage: str, error: Optional[str] = None):
+        self._set_stage(job, stage)
+        job.error = error
+        await run_blocking(self.store.save, job)
+        self._active.pop(job.id, None)
+        if os.path.exists(job.file_path):
+            await run_blocking(os.remove, job.file_path)
+
+# Global instance
+ingestion_jobs = IngestionJobManager()
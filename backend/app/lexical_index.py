@@ -0,0 +1,480 @@
+import os
+import re
+import json
+import math
+import threading
+from array import array
+from collections import Counter
+from typing import List, Dict, Tuple, Optional, Sequence
+import logging
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Identifiers such as /api/query, ERR-404, user_id or v1.2.3 are indexed whole
+# and also as their alphanumeric parts
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+(?:[./:#@\-][a-z0-9_]+)*")
+PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+SNAPSHOT_FILE = "snapshot.npz"
+# Estimated Python object overhead of a chunk ID (list and position dict
+# entries) and of a term (term list entry and dict entry), for memory_bytes
+CHUNK_ENTRY_BYTES = 160
+TERM_ENTRY_BYTES = 120
+# Champion lists hold this fraction of max_scan_postings
+CHAMPION_FRACTION = 4
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms of a text, keeping identifiers whole alongside their parts.
+
+    The parts of identifiers follow all whole terms; callers count terms, so
+    order does not matter.
+    """
+    terms = TOKEN_PATTERN.findall(text.lower())
+    for term in [term for term in terms if not term.isalnum()]:
+        parts = PART_PATTERN.findall(term)
+        if len(parts) > 1 or (parts and parts[0] != term):
+            terms.extend(parts)
+    return terms
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[str]],
+    weights: Sequence[float],
+    k: int = 60
+) -> List[str]:
+    """Fuse ranked ID lists: each list adds weight / (k + rank) to the IDs it contains"""
+    scores: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+class LexicalIndex:
+    """BM25 inverted index over chunk texts.
+
+    Postings live in two segments. The base segment is immutable and stored
+    as flat NumPy arrays (CSR layout: per-term offsets into one array of
+    chunk positions and one of term frequencies). New chunks go to a small
+    delta segment of append-only arrays. Deletes only mark tombstones. Once
+    the delta or the tombstones grow large, both are merged into a new base
+    segment in linear time, which is then saved as a snapshot. Every change
+    is also appended to a log next to the snapshot, and loading replays the
+    log.
+
+    Query cost is bounded by max_scan_postings per term. For base terms with
+    longer posting lists, only a precomputed champion list (the postings
+    with the highest BM25 impact) proposes candidates. Candidates are then
+    scored exactly against the full lists by binary search. Terms found in
+    more than half of the chunks are ignored like stopwords.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        k1: float = 1.2,
+        b: float = 0.75,
+        max_scan_postings: int = None,
+        merge_min_postings: int = 200_000
+    ):
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self.max_scan_postings = max_scan_postings or settings.LEXICAL_MAX_SCAN_POSTINGS
+        self.merge_min_postings = merge_min_postings
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        # Chunk table, indexed by position
+        self._chunk_ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._lengths = array('I')
+        self._alive = bytearray()
+        self._live_count = 0
+        self._live_length = 0
+        # Base segment
+        self._base_term_list: List[str] = []
+        self._base_terms: Dict[str, int] = {}
+        self._base_offsets = np.zeros(1, dtype=np.int64)
+        self._base_ids = np.zeros(0, dtype=np.uint32)
+        self._base_tfs = np.zeros(0, dtype=np.uint16)
+        # Champion positions of base terms with long posting lists, by term index
+        self._champions: Dict[int, np.ndarray] = {}
+        # Delta segment
+        self._delta: Dict[str, Tuple[array, array]] = {}
+        self._delta_postings = 0
+        # Query scratch space, sized to the chunk table
+        self._scores = np.zeros(0, dtype=np.float32)
+        self._seen = np.zeros(0, dtype=bool)
+        self._generation = 0
+        self._log = None
+
+    @property
+    def live_count(self) -> int:
+        return self._live_count
+
+    def add(self, ids: List[str], texts: List[str], merge: bool = True):
+        """Index chunks, replacing any already indexed under the same IDs.
+
+        Bulk loads pass merge=False and call save() once at the end.
+        """
+        records = [(chunk_id, Counter(tokenize(text))) for chunk_id, text in zip(ids, texts)]
+        with self._lock:
+            for chunk_id, counts in records:
+                self._apply_add(chunk_id, counts)
+            self._append_log([{"a": chunk_id, "tf": counts} for chunk_id, counts in records])
+            if merge:
+                self._maybe_merge()
+
+    def delete(self, ids: List[str]):
+        """Remove chunks from the index"""
+        with self._lock:
+            for chunk_id in ids:
+                self._apply_delete(chunk_id)
+            self._append_log([{"d": list(ids)}])
+            self._maybe_merge()
+
+    def clear(self):
+        """Drop all chunks, including the persisted snapshot and log"""
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+            for name in os.listdir(self.directory):
+                os.remove(os.path.join(self.directory, name))
+            self._reset()
+            self._open_log()
+
+    def search(self, query: str, n_results: int) -> List[Tuple[str, float]]:
+        """Top chunks by BM25 score as (chunk_id, score), best first"""
+        terms = set(tokenize(query))
+        with self._lock:
+            if not terms or not self._live_count:
+                return []
+            count = self._live_count
+            average_length = self._live_length / count
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+            alive = np.frombuffer(self._alive, dtype=np.uint8)
+            self._ensure_scratch(len(self._chunk_ids))
+            scores, seen = self._scores, self._seen
+
+            # Short posting lists are scored in full; long ones propose their
+            # champions as candidates and are scored against the candidates below
+            term_postings = []
+            for term in terms:
+                parts = self._postings(term)
+                frequency = sum(ids.size for ids, _, _ in parts)
+                if frequency:
+                    term_postings.append((frequency, parts))
+            if not term_postings:
+                return []
+            # Terms in more than half of the chunks carry almost no information
+            # (idf < ln 2), so they are skipped unless nothing else matched
+            informative = [item for item in term_postings if item[0] <= count // 2]
+            term_postings = informative or [min(term_postings, key=lambda item: item[0])]
+
+            touched = []
+            probes = []
+            for frequency, parts in term_postings:
+                idf = self._idf(frequency, count)
+                for ids, tfs, champions in parts:
+                    if champions is None:
+                        scores[ids] += self._term_scores(tfs, lengths[ids], idf, average_length)
+                        new = ids[~seen[ids]]
+                    else:
+                        probes.append((ids, tfs, idf))
+                        new = champions[~seen[champions]]
+                    seen[new] = True
+                    touched.append(new)
+            # Sorted candidates make the binary searches below cache-friendly
+            candidates = np.sort(np.concatenate(touched))
+            seen[candidates] = False
+
+            for ids, tfs, idf in probes:
+                index = np.minimum(np.searchsorted(ids, candidates), ids.size - 1)
+                hits = ids[index] == candidates
+                matched = candidates[hits]
+                scores[matched] += self._term_scores(tfs[index[hits]], lengths[matched], idf, average_length)
+
+            candidate_scores = scores[candidates] * alive[candidates]
+            scores[candidates] = 0.0
+
+            live = candidate_scores > 0
+            candidates, candidate_scores = candidates[live], candidate_scores[live]
+            if candidates.size > n_results:
+                top = np.argpartition(-candidate_scores, n_results - 1)[:n_results]
+                candidates, candidate_scores = candidates[top], candidate_scores[top]
+            order = np.argsort(-candidate_scores, kind="stable")
+            return [(self._chunk_ids[candidates[i]], float(candidate_scores[i])) for i in order]
+
+    def save(self):
+        """Merge the delta segment and tombstones into a new snapshot"""
+        with self._lock:
+            self._merge()
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    def memory_bytes(self) -> int:
+        """Approximate resident size: posting arrays exactly, Python containers estimated"""
+        with self._lock:
+            arrays = (
+                self._base_offsets.nbytes + self._base_ids.nbytes + self._base_tfs.nbytes
+                + sum(champions.nbytes for champions in self._champions.values())
+                + self._scores.nbytes + self._seen.nbytes
+            )
+            chunk_table = len(self._chunk_ids) * (CHUNK_ENTRY_BYTES + 5)
+            terms = (len(self._base_terms) + len(self._delta)) * TERM_ENTRY_BYTES
+            return int(arrays + chunk_table + terms + self._delta_postings * 6)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "chunks": self._live_count,
+                "tombstones": len(self._chunk_ids) - self._live_count,
+                "terms": len(self._base_terms) + sum(1 for term in self._delta if term not in self._base_terms),
+                "base_postings": int(self._base_ids.size),
+                "delta_postings": self._delta_postings,
+            }
+
+    def _idf(self, frequency: int, count: int) -> float:
+        return math.log(1.0 + (count - frequency + 0.5) / (frequency + 0.5))
+
+    def _term_scores(self, tfs: np.ndarray, lengths: np.ndarray, idf: float, average_length: float) -> np.ndarray:
+        tf = tfs.astype(np.float32)
+        norm = self.k1 * (1.0 - self.b + self.b * lengths.astype(np.float32) / average_length)
+        return idf * tf * (self.k1 + 1.0) / (tf + norm)
+
+    def _postings(self, term: str) -> List[Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]]:
+        """Posting parts of a term, each sorted by chunk position, with champions for long base lists"""
+        parts = []
+        index = self._base_terms.get(term)
+        if index is not None:
+            start, end = self._base_offsets[index], self._base_offsets[index + 1]
+            parts.append((self._base_ids[start:end], self._base_tfs[start:end], self._champions.get(index)))
+        delta = self._delta.get(term)
+        if delta is not None:
+            parts.append((np.frombuffer(delta[0], dtype=np.uint32), np.frombuffer(delta[1], dtype=np.uint16), None))
+        return parts
+
+    def _ensure_scratch(self, size: int):
+        if self._scores.size < size:
+            capacity = max(size, self._scores.size * 2, 1024)
+            self._scores = np.zeros(capacity, dtype=np.float32)
+            self._seen = np.zeros(capacity, dtype=bool)
+
+    def _apply_add(self, chunk_id: str, counts: Counter):
+        if chunk_id in self._positions:
+            self._apply_delete(chunk_id)
+        position = len(self._chunk_ids)
+        length = sum(counts.values())
+        self._chunk_ids.append(chunk_id)
+        self._positions[chunk_id] = position
+        self._lengths.append(length)
+        self._alive.append(1)
+        self._live_count += 1
+        self._live_length += length
+        for term, frequency in counts.items():
+            postings = self._delta.get(term)
+            if postings is None:
+                postings = self._delta[term] = (array('I'), array('H'))
+            postings[0].append(position)
+            postings[1].append(frequency if frequency < 65535 else 65535)
+        self._delta_postings += len(counts)
+
+    def _apply_delete(self, chunk_id: str):
+        position = self._positions.pop(chunk_id, None)
+        if position is None or not self._alive[position]:
+            return
+        self._alive[position] = 0
+        self._live_count -= 1
+        self._live_length -= self._lengths[position]
+
+    def _maybe_merge(self):
+        tombstones = len(self._chunk_ids) - self._live_count
+        if (
+            self._delta_postings > max(self.merge_min_postings, self._base_ids.size // 10)
+            or tombstones > max(1000, len(self._chunk_ids) // 5)
+        ):
+            self._merge()
+
+    def _merge(self):
+        """Rebuild the base segment from base and delta in linear time, dropping tombstoned chunks"""
+        alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+
+        # Delta terms get indices after the base terms
+        term_list = list(self._base_term_list)
+        term_index = dict(self._base_terms)
+        delta_indices, delta_sizes, delta_ids, delta_tfs = [], [], [], []
+        for term, (ids, tfs) in self._delta.items():
+            index = term_index.get(term)
+            if index is None:
+                index = term_index[term] = len(term_list)
+                term_list.append(term)
+            delta_indices.append(index)
+            delta_sizes.append(len(ids))
+            delta_ids.append(ids.tobytes())
+            delta_tfs.append(tfs.tobytes())
+        delta_indices = np.array(delta_indices, dtype=np.int64)
+        delta_sizes = np.array(delta_sizes, dtype=np.int64)
+
+        # Each term's postings are its base postings followed by its delta
+        # postings (delta positions are always higher), so both segments are
+        # scattered straight into place without sorting
+        base_counts = np.zeros(len(term_list), dtype=np.int64)
+        base_counts[:len(self._base_term_list)] = np.diff(self._base_offsets)
+        counts = base_counts.copy()
+        counts[delta_indices] += delta_sizes
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        total = int(offsets[-1])
+        merged_ids = np.empty(total, dtype=np.uint32)
+        merged_tfs = np.empty(total, dtype=np.uint16)
+
+        base_terms = np.repeat(np.arange(len(self._base_term_list), dtype=np.int64), base_counts[:len(self._base_term_list)])
+        shift = offsets[:len(self._base_term_list)] - self._base_offsets[:-1]
+        destination = np.arange(self._base_ids.size, dtype=np.int64) + shift[base_terms]
+        merged_ids[destination] = self._base_ids
+        merged_tfs[destination] = self._base_tfs
+        del base_terms, destination
+
+        delta_terms = np.repeat(delta_indices, delta_sizes)
+        delta_starts = np.cumsum(delta_sizes) - delta_sizes
+        destination = (
+            np.arange(delta_terms.size, dtype=np.int64)
+            - np.repeat(delta_starts, delta_sizes)
+            + offsets[delta_terms] + base_counts[delta_terms]
+        )
+        merged_ids[destination] = np.frombuffer(b"".join(delta_ids), dtype=np.uint32)
+        merged_tfs[destination] = np.frombuffer(b"".join(delta_tfs), dtype=np.uint16)
+        del delta_terms, destination
+
+        if not alive.all():
+            keep = alive[merged_ids]
+            posting_terms = np.repeat(np.arange(len(term_list), dtype=np.int64), counts)
+            counts = np.bincount(posting_terms[keep], minlength=len(term_list))
+            remap = (np.cumsum(alive, dtype=np.int64) - 1).astype(np.uint32)
+            merged_ids = remap[merged_ids[keep]]
+            merged_tfs = merged_tfs[keep]
+            del posting_terms, keep
+
+        present = np.flatnonzero(counts)
+        if present.size < len(term_list):
+            term_list = [term_list[i] for i in present]
+            counts = counts[present]
+        self._base_term_list = term_list
+        self._base_terms = {term: i for i, term in enumerate(term_list)}
+        self._base_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self._base_ids = merged_ids
+        self._base_tfs = merged_tfs
+        self._delta = {}
+        self._delta_postings = 0
+
+        lengths = np.frombuffer(self._lengths, dtype=np.uint32)[alive]
+        if not alive.all():
+            self._chunk_ids = [chunk_id for chunk_id, live in zip(self._chunk_ids, alive) if live]
+            self._positions = {chunk_id: i for i, chunk_id in enumerate(self._chunk_ids)}
+        self._lengths = array('I', lengths.tobytes())
+        self._alive = bytearray(b"\x01" * len(self._chunk_ids))
+        self._build_champions()
+        self._write_snapshot()
+
+    def _build_champions(self):
+        """Pick the highest-impact postings of every term with a long posting list"""
+        self._champions = {}
+        if not self._live_count:
+            return
+        limit = max(1, self.max_scan_postings // CHAMPION_FRACTION)
+        lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+        average_length = self._live_length / self._live_count
+        for index in np.flatnonzero(np.diff(self._base_offsets) > self.max_scan_postings):
+            start, end = self._base_offsets[index], self._base_offsets[index + 1]
+            ids = self._base_ids[start:end]
+            impacts = self._term_scores(self._base_tfs[start:end], lengths[ids], 1.0, average_length)
+            top = np.argpartition(-impacts, limit - 1)[:limit]
+            self._champions[int(index)] = np.sort(ids[top])
+
+    def _write_snapshot(self):
+        generation = self._generation + 1
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as file:
+            np.savez(
+                file,
+                generation=np.array([generation]),
+                terms=np.frombuffer("\n".join(self._base_term_list).encode("utf-8"), dtype=np.uint8),
+                offsets=self._base_offsets,
+                ids=self._base_ids,
+                tfs=self._base_tfs,
+                chunk_ids=np.frombuffer("\n".join(self._chunk_ids).encode("utf-8"), dtype=np.uint8),
+                lengths=np.frombuffer(self._lengths, dtype=np.uint32),
+            )
+        os.replace(temporary, path)
+
+        # The new snapshot covers everything logged so far
+        if self._log is not None:
+            self._log.close()
+        previous = self._log_path()
+        self._generation = generation
+        self._open_log()
+        if os.path.exists(previous):
+            os.remove(previous)
+        logger.info(
+            f"Saved lexical index snapshot: {len(self._chunk_ids)} chunks, "
+            f"{len(self._base_term_list)} terms, {self._base_ids.size} postings"
+        )
+
+    def _log_path(self) -> str:
+        return os.path.join(self.directory, f"log.{self._generation}.jsonl")
+
+    def _open_log(self):
+        self._log = open(self._log_path(), "a", encoding="utf-8")
+
+    def _append_log(self, entries: List[dict]):
+        self._log.write("".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries))
+        self._log.flush()
+
+    def _load(self):
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if os.path.exists(path):
+            with np.load(path) as snapshot:
+                self._generation = int(snapshot["generation"][0])
+                terms = snapshot["terms"].tobytes().decode("utf-8")
+                self._base_term_list = terms.split("\n") if terms else []
+                self._base_terms = {term: i for i, term in enumerate(self._base_term_list)}
+                self._base_offsets = snapshot["offsets"]
+                self._base_ids = snapshot["ids"]
+                self._base_tfs = snapshot["tfs"]
+                chunk_ids = snapshot["chunk_ids"].tobytes().decode("utf-8")
+                self._chunk_ids = chunk_ids.split("\n") if chunk_ids else []
+                self._lengths = array('I', snapshot["lengths"].tobytes())
+            self._positions = {chunk_id: i for i, chunk_id in enumerate(self._chunk_ids)}
+            self._alive = bytearray(b"\x01" * len(self._chunk_ids))
+            self._live_count = len(self._chunk_ids)
+            self._live_length = int(np.frombuffer(self._lengths, dtype=np.uint32).sum())
+            self._build_champions()
+
+        replayed = 0
+        if os.path.exists(self._log_path()):
+            with open(self._log_path(), "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn final write; the caller's consistency check rebuilds if needed
+                        break
+                    if "a" in entry:
+                        self._apply_add(entry["a"], Counter(entry["tf"]))
+                    else:
+                        for chunk_id in entry["d"]:
+                            self._apply_delete(chunk_id)
+                    replayed += 1
+        self._open_log()
+        if replayed:
+            logger.info(f"Replayed {replayed} lexical index log entries")
@@ -1,12 +1,17 @@
 import logging
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 from app.routes import router
 from app.config import settings
+from app.concurrency import run_blocking, shutdown_executor
+from app.rag_service import rag_service
+from app.ingestion_jobs import ingestion_jobs
+from app.tenants import TENANT_HEADER, DEFAULT_TENANT, current_tenant, validate_tenant_id
+from app import openai_client
 
 # Configure logging
 logging.basicConfig(
@@ -21,9 +26,15 @@ async def lifespan(app: FastAPI):
     logger.info("Starting RAG System POC...")
     logger.info(f"Chroma DB directory: {settings.CHROMA_PERSIST_DIRECTORY}")
     logger.info(f"Upload directory: {settings.UPLOAD_DIRECTORY}")
+    await run_blocking(rag_service.load_default_tenant)
+    await ingestion_jobs.start()
     yield
     # Shutdown
     logger.info("Shutting down RAG System POC...")
+    await ingestion_jobs.stop()
+    await run_blocking(rag_service.tenants.close_all)
+    await openai_client.close()
+    shutdown_executor()
 
 app = FastAPI(
     title="RAG System POC",
@@ -41,6 +52,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def tenant_scope(request: Request, call_next):
+    """Run the request as the tenant named in the X-Tenant-ID header"""
+    try:
+        tenant_id = validate_tenant_id(request.headers.get(TENANT_HEADER, DEFAULT_TENANT))
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    token = current_tenant.set(tenant_id)
+    try:
+        return await call_next(request)
+    finally:
+        current_tenant.reset(token)
+
 # Include routes
 app.include_router(router, prefix="/api")
 
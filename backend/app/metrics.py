@@ -0,0 +1,137 @@
+import time
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, Tuple, TypeVar
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Upper bounds in seconds of the latency buckets, from fast in-memory stages
+# to slow LLM calls and large uploads
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0
+)
+
+class Histogram:
+    """Latency histogram with fixed buckets; observing is a bisect and three additions"""
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # One count per bucket plus the +Inf bucket; not cumulative
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        # Buckets are "less than or equal" bounds, as in Prometheus
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+class _StageTimer:
+    __slots__ = ("trace", "stage", "started")
+
+    def __init__(self, trace: "RequestTrace", stage: str):
+        self.trace = trace
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.trace.add(self.stage, time.perf_counter() - self.started)
+        return False
+
+class RequestTrace:
+    """Seconds spent in each stage of one request.
+
+    Stages are timed with `with trace.stage("search"):`; a stage entered
+    several times (one per batch, say) adds up. The totals are recorded into
+    the histograms once the request ends (Metrics.record) and are the
+    per-request breakdown returned to clients.
+    """
+    __slots__ = ("stages",)
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    def stage(self, stage: str) -> _StageTimer:
+        """Context manager timing one stage"""
+        return _StageTimer(self, stage)
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def as_dict(self) -> Dict[str, float]:
+        return {stage: round(seconds, 6) for stage, seconds in self.stages.items()}
+
+class Metrics:
+    """Process-wide stage latency histograms, keyed by operation and stage"""
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, operation: str, stage: str, seconds: float):
+        histogram = self._histograms.get((operation, stage))
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault((operation, stage), Histogram())
+        histogram.observe(seconds)
+
+    def record(self, operation: str, trace: RequestTrace):
+        """Observe the stage totals of a finished request"""
+        for stage, seconds in trace.stages.items():
+            self.observe(operation, stage, seconds)
+
+    def render_prometheus(self) -> str:
+        """All histograms in the Prometheus text exposition format"""
+        lines = [
+            "# HELP rag_stage_duration_seconds Time spent in each stage of uploads and queries",
+            "# TYPE rag_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        for (operation, stage), histogram in histograms:
+            counts, total, count = histogram.snapshot()
+            labels = f'operation="{operation}",stage="{stage}"'
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'rag_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'rag_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"rag_stage_duration_seconds_sum{{{labels}}} {total}")
+            lines.append(f"rag_stage_duration_seconds_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+def timed_iter(iterable: Iterable[T], timings: Dict[str, float], key: str) -> Iterator[T]:
+    """Iterate, adding the seconds spent producing items to timings[key]"""
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            timings[key] = timings.get(key, 0.0) + time.perf_counter() - started
+            return
+        timings[key] = timings.get(key, 0.0) + time.perf_counter() - started
+        yield item
+
+# Global instance
+metrics = Metrics()
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
@@ -8,6 +8,9 @@ class DocumentChunk(BaseModel):
     content: str
     metadata: Dict[str, Any]
     chunk_index: int
+    # Cosine distance to the query when the chunk was retrieved by vector
+    # search; None for keyword-only hits
+    distance: Optional[float] = None
 
 class Document(BaseModel):
     id: str
@@ -17,24 +20,91 @@ class Document(BaseModel):
     upload_date: datetime
     chunk_count: int
     size_bytes: int
+    content_hash: Optional[str] = None
+
+class QueryFilters(BaseModel):
+    """Restricts a query to matching chunks; given fields are combined with AND"""
+    document_ids: Optional[List[str]] = None
+    file_types: Optional[List[str]] = None
+    filenames: Optional[List[str]] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
 
 class QueryRequest(BaseModel):
     query: str
     max_chunks: Optional[int] = 5
     include_metadata: Optional[bool] = True
+    filters: Optional[QueryFilters] = None
+    # Return the seconds spent in each stage of the query
+    include_timings: bool = False
+    # Return the ranked sources only, without generating an answer
+    retrieval_only: bool = False
 
 class QueryResponse(BaseModel):
     query: str
-    answer: str
+    # None for retrieval-only queries
+    answer: Optional[str] = None
     sources: List[DocumentChunk]
     processing_time: float
+    # "exact" or "semantic" when the answer came from the answer cache
+    cache_hit: Optional[str] = None
+    # Seconds per stage (embed_query, search, context_build, generate, ...)
+    # when the request asked for them
+    timings: Optional[Dict[str, float]] = None
+
+class BatchQueryRequest(BaseModel):
+    """Several queries answered with one embedding call and one vector search"""
+    queries: List[str]
+    max_chunks: Optional[int] = 5
+    filters: Optional[QueryFilters] = None
+    include_timings: bool = False
+    retrieval_only: bool = False
+
+class BatchQueryResult(BaseModel):
+    query: str
+    # One of response and error is set
+    response: Optional[QueryResponse] = None
+    error: Optional[str] = None
+
+class BatchQueryResponse(BaseModel):
+    # In the order of the request's queries
+    results: List[BatchQueryResult]
+    processing_time: float
+    # Seconds per stage of the whole batch when the request asked for them
+    timings: Optional[Dict[str, float]] = None
 
 class UploadResponse(BaseModel):
     document_id: str
     filename: str
     chunk_count: int
     message: str
+    # How the stored chunks changed; a replaced document only adds what is new
+    chunks_added: int = 0
+    chunks_moved: int = 0
+    chunks_removed: int = 0
+    # Seconds spent in each ingestion stage
+    timings: Optional[Dict[str, float]] = None
 
 class DocumentListResponse(BaseModel):
     documents: List[Document]
     total_count: int
+
+class IngestionJob(BaseModel):
+    id: str
+    document_id: str
+    tenant_id: str = "default"
+    filename: str
+    # queued, processing, embedding, storing, completed or failed
+    stage: str
+    # Fraction of the chunks needing embeddings that are embedded; 1.0 once
+    # completed. A replaced document only embeds its changed chunks
+    progress: float = 0.0
+    chunks_total: Optional[int] = None
+    chunks_embedded: int = 0
+    size_bytes: int
+    content_hash: str
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    file_path: str = Field(exclude=True)
@@ -0,0 +1,32 @@
+import asyncio
+import logging
+
+import httpx
+import openai
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# One bounded connection pool shared by every upstream OpenAI call
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=settings.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS
+    ),
+    timeout=httpx.Timeout(settings.OPENAI_TIMEOUT)
+)
+
+async_client = openai.AsyncOpenAI(
+    api_key=settings.OPENAI_API_KEY,
+    base_url=settings.OPENAI_BASE_URL or None,
+    http_client=http_client
+)
+
+# Caps concurrent upstream requests; callers beyond the limit wait here
+# instead of piling onto the connection pool
+upstream_semaphore = asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENCY)
+
+async def close():
+    """Close the shared connection pool"""
+    await http_client.aclose()
@@ -1,25 +1,30 @@
-import openai
-from typing import List
+from typing import List, Optional, AsyncIterator
 import logging
-from app.config import settings
+from app.embeddings import embedding_provider
+from app.embedding_batcher import EmbeddingBatcher, ProgressCallback
+from app.generators import create_generator
 
 logger = logging.getLogger(__name__)
 
-# Configure OpenAI
-openai.api_key = settings.OPENAI_API_KEY
-
 class OpenAIService:
     def __init__(self):
-        self.client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.embedding_batcher = EmbeddingBatcher(embedding_provider)
+        # Writes the answers: the chat completion, or a local generator (GENERATOR)
+        self.generator = create_generator()
+
+    async def generate_embeddings(
+        self,
+        texts: List[str],
+        token_counts: Optional[List[int]] = None,
+        progress_callback: Optional[ProgressCallback] = None
+    ) -> List[List[float]]:
+        """Generate embeddings for a list of texts with the shared embedding provider.
 
-    async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for a list of texts"""
+        Texts are packed into token-budgeted batches that run concurrently;
+        progress_callback(done, total) is called as batches complete.
+        """
         try:
-            response = self.client.embeddings.create(
-                model=settings.EMBEDDING_MODEL,
-                input=texts
-            )
-            embeddings = [item.embedding for item in response.data]
+            embeddings = await self.embedding_batcher.embed(texts, token_counts, progress_callback)
             logger.info(f"Generated embeddings for {len(texts)} texts")
             return embeddings
         except Exception as e:
@@ -32,44 +37,9 @@ class OpenAIService:
         context_chunks: List[str], 
         conversation_history: List[dict] = None
     ) -> str:
-        """Generate response using retrieved context"""
+        """Generate response using retrieved context with the configured generator"""
         try:
-            # Create context from chunks
-            context = "\n\n".join([f"Source {i+1}:\n{chunk}" for i, chunk in enumerate(context_chunks)])
-            
-            # Create system prompt
-            system_prompt = """You are a helpful AI assistant that answers questions based on the provided context. 
-            
-Rules:
-1. Answer questions using ONLY the information provided in the context
-2. If the context doesn't contain enough information to answer the question, say so clearly
-3. Always cite which source(s) you used by referring to "Source X" 
-4. Be concise and accurate
-5. If asked about something not in the context, politely explain you can only answer based on the provided documents
-
-Context:
-{context}""".format(context=context)
-
-            # Prepare messages
-            messages = [
-                {"role": "system", "content": system_prompt},
-            ]
-            
-            # Add conversation history if provided
-            if conversation_history:
-                messages.extend(conversation_history[-6:])  # Last 3 exchanges
-            
-            messages.append({"role": "user", "content": query})
-
-            # Generate response
-            response = self.client.chat.completions.create(
-                model=settings.LLM_MODEL,
-                messages=messages,
-                temperature=0.3,
-                max_tokens=500
-            )
-            
-            answer = response.choices[0].message.content
+            answer = await self.generator.generate(query, context_chunks, conversation_history)
             logger.info(f"Generated response for query: {query[:50]}...")
             return answer
             
@@ -77,5 +47,22 @@ Context:
             logger.error(f"Error generating response: {str(e)}")
             raise
 
+    async def stream_response(
+        self,
+        query: str,
+        context_chunks: List[str],
+        conversation_history: List[dict] = None
+    ) -> AsyncIterator[str]:
+        """Generate a response using retrieved context, yielding tokens as they arrive"""
+        try:
+            async for token in self.generator.stream(query, context_chunks, conversation_history):
+                yield token
+
+            logger.info(f"Streamed response for query: {query[:50]}...")
+
+        except Exception as e:
+            logger.error(f"Error streaming response: {str(e)}")
+            raise
+
 # Global instance
 openai_service = OpenAIService()
@@ -0,0 +1,466 @@
+import os
+import json
+import threading
+from typing import List, Optional, Tuple
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.f32"
+CODES_FILE = "codes.bin"
+SCALES_FILE = "scales.f32"
+LIVE_FILE = "live.u8"
+CODEBOOKS_FILE = "codebooks.npy"
+# Suffix of the files a prepared compaction writes beside the current ones
+COMPACTION_SUFFIX = ".compact"
+
+QUANTIZATIONS = ("none", "int8", "pq")
+# Rows scanned per step: the float32 copy of a block of codes should stay in
+# the CPU cache (1024 x 384 dimensions is 1.5 MB)
+SCAN_BLOCK_ROWS = 1024
+# pq blocks pay a lookup per subvector, so larger blocks amortize the per-call cost
+PQ_SCAN_BLOCK_ROWS = 4096
+# Bound on the score matrix of one batched search, queries x rows of float32
+BATCH_SCORE_BYTES = 64 * 1024 * 1024
+PQ_CENTROIDS = 256
+PQ_KMEANS_ITERATIONS = 12
+
+class QuantizedIndex:
+    """Unit-length vectors in memory-mapped files, searched by an approximate scan and exact rescoring.
+
+    With quantization "none" only the float32 vectors are stored and every
+    search is one exact matrix-vector product over them. Otherwise every
+    vector is stored twice, appended row by row:
+    - compressed codes, scanned in full by each query. int8 keeps one byte
+      per dimension and a per-row scale (4x smaller than float32); pq
+      (product quantization) keeps one byte per subvector of
+      pq_subvector_dimensions dimensions, an index into a codebook of 256
+      centroids trained by k-means once pq_training_vectors vectors are
+      stored. Until then pq searches scan the full vectors exactly.
+    - the float32 vectors, read only for the rescore_factor * n best
+      candidates of the scan, whose exact cosine distances decide the result.
+
+    Only the codes need to stay in the page cache; the full vectors are
+    touched a few rows per query. Deleted rows are tombstoned in a live
+    flag per row and skipped by the scan until a compaction rewrites the
+    files without them.
+
+    A compaction is prepared beside the current files, then finished by
+    renaming them into place. Callers keeping their own row numbers commit
+    the new ones between the two steps and pass the generation they
+    committed when reopening, so an interrupted compaction is finished or
+    discarded to match.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        dimension: Optional[int] = None,
+        quantization: str = "int8",
+        rescore_factor: int = 50,
+        pq_subvector_dimensions: int = 8,
+        pq_training_vectors: int = 20000,
+        generation: Optional[int] = None
+    ):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.rescore_factor = rescore_factor
+        self.pq_training_vectors = pq_training_vectors
+        self._lock = threading.RLock()
+
+        meta_path = os.path.join(directory, META_FILE)
+        pending_path = meta_path + COMPACTION_SUFFIX
+        pending_generation = None
+        if os.path.exists(pending_path):
+            with open(pending_path, "r") as file:
+                pending_generation = json.load(file)["generation"]
+        if pending_generation is not None and generation in (None, pending_generation):
+            self._rename_compacted()
+            logger.info(f"Finished interrupted compaction of {directory}")
+        else:
+            self._remove_compacted()
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as file:
+                meta = json.load(file)
+            if meta["quantization"] != quantization:
+                logger.warning(
+                    f"Index in {directory} uses {meta['quantization']} codes; ignoring the configured {quantization}"
+                )
+        else:
+            if quantization not in QUANTIZATIONS:
+                raise ValueError(f"Unsupported quantization: {quantization}")
+            meta = {
+                "dimension": dimension or 0,
+                "quantization": quantization,
+                "pq_subvector_dimensions": pq_subvector_dimensions,
+                "rows": 0,
+            }
+        self.dimension = meta["dimension"]
+        self.quantization = meta["quantization"]
+        self.pq_subvector_dimensions = meta["pq_subvector_dimensions"]
+        self.rows = meta["rows"]
+        self.generation = meta.get("generation", 0)
+
+        codebooks_path = os.path.join(directory, CODEBOOKS_FILE)
+        self.codebooks = np.load(codebooks_path) if os.path.exists(codebooks_path) else None
+        # Drop anything appended after the last recorded row count, e.g. by a crash mid-append
+        for name, width in self._files():
+            path = os.path.join(directory, name)
+            if os.path.exists(path) and os.path.getsize(path) > self.rows * width:
+                os.truncate(path, self.rows * width)
+        self._remap()
+
+    @property
+    def subvectors(self) -> int:
+        return -(-self.dimension // self.pq_subvector_dimensions)
+
+    def _code_width(self) -> int:
+        """Bytes of codes per row; 0 without quantization and while pq codebooks are untrained"""
+        if self.quantization == "int8":
+            return self.dimension
+        if self.quantization == "pq" and self.codebooks is not None:
+            return self.subvectors
+        return 0
+
+    def _files(self) -> List[Tuple[str, int]]:
+        """(file name, bytes per row) of every per-row file"""
+        files = [(VECTORS_FILE, self.dimension * 4), (LIVE_FILE, 1)]
+        if self._code_width():
+            files.append((CODES_FILE, self._code_width()))
+        if self.quantization == "int8":
+            files.append((SCALES_FILE, 4))
+        return files
+
+    def _map(self, name: str, dtype, shape: tuple, mode: str = "r"):
+        path = os.path.join(self.directory, name)
+        if not self.rows or not os.path.exists(path):
+            return np.zeros(shape if self.rows else (0,) + shape[1:], dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+
+    def _remap(self):
+        """Map the files at the current row count; earlier maps stay valid for searches using them"""
+        rows, dimension = self.rows, self.dimension
+        # Read-only maps are used as plain arrays: slicing an np.memmap costs
+        # more than scanning a small block of it
+        self._vectors = np.asarray(self._map(VECTORS_FILE, np.float32, (rows, dimension)))
+        self._live = self._map(LIVE_FILE, np.uint8, (rows,), mode="r+")
+        self._codes = (
+            np.asarray(self._map(
+                CODES_FILE, np.int8 if self.quantization == "int8" else np.uint8, (rows, self._code_width())
+            ))
+            if self._code_width() else None
+        )
+        self._scales = (
+            np.asarray(self._map(SCALES_FILE, np.float32, (rows,))) if self.quantization == "int8" else None
+        )
+
+    def _save_meta(self, path: Optional[str] = None, rows: Optional[int] = None, generation: Optional[int] = None):
+        path = path or os.path.join(self.directory, META_FILE)
+        with open(path + ".tmp", "w") as file:
+            json.dump({
+                "dimension": self.dimension,
+                "quantization": self.quantization,
+                "pq_subvector_dimensions": self.pq_subvector_dimensions,
+                "rows": self.rows if rows is None else rows,
+                "generation": self.generation if generation is None else generation,
+            }, file)
+        os.replace(path + ".tmp", path)
+
+    def _append_file(self, name: str, data: np.ndarray):
+        with open(os.path.join(self.directory, name), "ab") as file:
+            file.write(np.ascontiguousarray(data).tobytes())
+
+    def append(self, embeddings) -> range:
+        """Store vectors (normalized to unit length); returns their rows"""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or not len(vectors):
+            return range(self.rows, self.rows)
+        with self._lock:
+            if not self.dimension:
+                self.dimension = vectors.shape[1]
+            if vectors.shape[1] != self.dimension:
+                raise ValueError(f"Expected {self.dimension}-dimensional vectors, got {vectors.shape[1]}")
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+            self._append_file(VECTORS_FILE, vectors)
+            self._append_file(LIVE_FILE, np.ones(len(vectors), dtype=np.uint8))
+            if self.quantization == "int8":
+                codes, scales = _int8_encode(vectors)
+                self._append_file(CODES_FILE, codes)
+                self._append_file(SCALES_FILE, scales)
+            elif self.codebooks is not None:
+                self._append_file(CODES_FILE, _pq_encode(self._pad(vectors), self.codebooks))
+            start = self.rows
+            self.rows += len(vectors)
+            self._save_meta()
+            self._remap()
+            if self.quantization == "pq" and self.codebooks is None and self.rows >= self.pq_training_vectors:
+                self._train_pq()
+            return range(start, self.rows)
+
+    def _pad(self, vectors: np.ndarray) -> np.ndarray:
+        """Zero-pad vectors to a whole number of pq subvectors"""
+        padding = self.subvectors * self.pq_subvector_dimensions - self.dimension
+        return np.pad(vectors, ((0, 0), (0, padding))) if padding else vectors
+
+    def _train_pq(self):
+        """Train the pq codebooks on a sample of the stored vectors and encode every row"""
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(self.rows, min(self.rows, self.pq_training_vectors), replace=False))
+        sample = self._pad(np.asarray(self._vectors[sample_rows]))
+        self.codebooks = _pq_train(sample, self.subvectors, self.pq_subvector_dimensions, rng)
+        np.save(os.path.join(self.directory, CODEBOOKS_FILE), self.codebooks)
+
+        path = os.path.join(self.directory, CODES_FILE)
+        with open(path, "wb") as file:
+            for start in range(0, self.rows, SCAN_BLOCK_ROWS):
+                block = self._pad(np.asarray(self._vectors[start:start + SCAN_BLOCK_ROWS]))
+                file.write(_pq_encode(block, self.codebooks).tobytes())
+        self._remap()
+        logger.info(f"Trained product quantization codebooks on {len(sample)} vectors; encoded {self.rows} rows")
+
+    def delete(self, rows):
+        """Tombstone rows; they are skipped by searches from now on"""
+        rows = np.asarray(list(rows), dtype=np.int64)
+        if not len(rows):
+            return
+        with self._lock:
+            self._live[rows] = 0
+            if isinstance(self._live, np.memmap):
+                self._live.flush()
+
+    def set_live(self, rows):
+        """Mark exactly the given rows live and every other row deleted"""
+        with self._lock:
+            live = np.zeros(self.rows, dtype=np.uint8)
+            live[np.asarray(list(rows), dtype=np.int64)] = 1
+            self._live[:] = live
+            if isinstance(self._live, np.memmap):
+                self._live.flush()
+
+    def live_count(self) -> int:
+        return int(np.count_nonzero(self._live))
+
+    def prepare_compaction(self) -> np.ndarray:
+        """Write the live rows to new files beside the current ones; returns the old row of each new row.
+
+        Searches keep using the current files until finish_compaction.
+        Appends and deletes in between are lost, so callers hold them off.
+        """
+        with self._lock:
+            kept = np.flatnonzero(self._live)
+            arrays = {VECTORS_FILE: self._vectors, CODES_FILE: self._codes, SCALES_FILE: self._scales}
+            for name, _ in self._files():
+                path = os.path.join(self.directory, name + COMPACTION_SUFFIX)
+                with open(path, "wb") as file:
+                    if name == LIVE_FILE:
+                        file.write(np.ones(len(kept), dtype=np.uint8).tobytes())
+                        continue
+                    for start in range(0, len(kept), SCAN_BLOCK_ROWS):
+                        file.write(np.ascontiguousarray(arrays[name][kept[start:start + SCAN_BLOCK_ROWS]]).tobytes())
+            # Written last: its presence marks the compaction as complete on disk
+            self._save_meta(
+                os.path.join(self.directory, META_FILE + COMPACTION_SUFFIX), rows=len(kept), generation=self.generation + 1
+            )
+            return kept
+
+    def finish_compaction(self):
+        """Switch to the files written by prepare_compaction"""
+        with self._lock:
+            self._rename_compacted()
+            with open(os.path.join(self.directory, META_FILE), "r") as file:
+                meta = json.load(file)
+            self.rows, self.generation = meta["rows"], meta["generation"]
+            self._remap()
+        logger.info(f"Compacted {self.directory} to {self.rows} rows")
+
+    def discard_compaction(self):
+        with self._lock:
+            self._remove_compacted()
+
+    def _rename_compacted(self):
+        names = [name for name in os.listdir(self.directory) if name.endswith(COMPACTION_SUFFIX)]
+        # The metadata goes last, so an interrupted rename is finished on the next open
+        for name in sorted(names, key=lambda name: name == META_FILE + COMPACTION_SUFFIX):
+            path = os.path.join(self.directory, name)
+            os.replace(path, path[:-len(COMPACTION_SUFFIX)])
+
+    def _remove_compacted(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(COMPACTION_SUFFIX):
+                os.remove(os.path.join(self.directory, name))
+
+    def search(
+        self,
+        query_embedding,
+        n_results: int,
+        allowed: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """The n_results nearest live rows as (row, cosine distance), nearest first.
+
+        allowed optionally restricts the search to rows where it is True.
+        """
+        return self.search_batch([query_embedding], n_results, allowed)[0]
+
+    def search_batch(
+        self,
+        query_embeddings,
+        n_results: int,
+        allowed: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """search for several queries, scoring each block of rows against all of them in one product"""
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            rows, vectors, live, codes, scales, codebooks = (
+                self.rows, self._vectors, self._live, self._codes, self._scales, self.codebooks
+            )
+        if not rows or n_results <= 0:
+            return [[] for _ in queries]
+
+        valid = live.astype(bool)
+        if allowed is not None:
+            # Rows appended after allowed was built are not allowed
+            valid[len(allowed):] = False
+            valid[:len(allowed)] &= allowed[:rows]
+        results = []
+        group_size = max(1, BATCH_SCORE_BYTES // (4 * rows))
+        for group_start in range(0, len(queries), group_size):
+            group = queries[group_start:group_start + group_size]
+            if codes is None:
+                # Exact: one product over the full vectors, no rescoring
+                scores = group @ vectors.T
+                results.extend(_top(query_scores, valid, n_results) for query_scores in scores)
+                continue
+            if self.quantization == "int8":
+                scores = _scan(
+                    rows,
+                    lambda start, end: (group @ codes[start:end].astype(np.float32).T) * scales[start:end],
+                    queries=len(group)
+                )
+            else:
+                # pq lookup tables differ per query, so pq codes are scanned query by query
+                scores = np.stack([
+                    _scan(rows, lambda start, end: _pq_scores(lookup, codes[start:end]), PQ_SCAN_BLOCK_ROWS)
+                    for lookup in np.einsum(
+                        "msd,qmd->qms", codebooks, self._pad(group).reshape(len(group), self.subvectors, -1)
+                    )
+                ])
+            for query, query_scores in zip(group, scores):
+                candidates = [row for row, _ in _top(query_scores, valid, n_results * self.rescore_factor)]
+                results.append(self._rescore(vectors, candidates, query, n_results))
+        return results
+
+    def rescore(self, rows: List[int], query_embedding, n_results: int) -> List[Tuple[int, float]]:
+        """Exact cosine distances of the given rows; the n_results nearest, nearest first"""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        with self._lock:
+            vectors = self._vectors
+        return self._rescore(vectors, rows, query, n_results)
+
+    def _rescore(self, vectors: np.ndarray, rows: List[int], query: np.ndarray, n_results: int):
+        if not rows:
+            return []
+        # Sorted rows read the vectors file front to back
+        ordered = np.sort(np.asarray(rows, dtype=np.int64))
+        similarities = vectors[ordered] @ query
+        count = min(n_results, len(ordered))
+        top = np.argpartition(-similarities, count - 1)[:count]
+        top = top[np.argsort(-similarities[top], kind="stable")]
+        return [(int(ordered[i]), float(1.0 - similarities[i])) for i in top]
+
+    def memory_bytes(self) -> int:
+        """Bytes the scan keeps in the page cache: codes, scales and live flags"""
+        per_row = self._code_width() + 1 + (4 if self.quantization == "int8" else 0)
+        if self._code_width() == 0:
+            per_row += self.dimension * 4
+        codebooks = self.codebooks.nbytes if self.codebooks is not None else 0
+        return self.rows * per_row + codebooks
+
+    def warm(self):
+        """Read the scanned files into the page cache"""
+        for name, _ in self._files():
+            if name == VECTORS_FILE and self._code_width():
+                continue
+            path = os.path.join(self.directory, name)
+            if os.path.exists(path):
+                with open(path, "rb") as file:
+                    while file.read(1 << 20):
+                        pass
+
+    def close(self):
+        with self._lock:
+            self.rows = 0
+            self._remap()
+
+def _scan(rows: int, score_block, block_rows: int = SCAN_BLOCK_ROWS, queries: Optional[int] = None) -> np.ndarray:
+    """Scores of all rows, computed block by block; shaped (queries, rows) if queries is given"""
+    scores = np.empty((rows,) if queries is None else (queries, rows), dtype=np.float32)
+    for start in range(0, rows, block_rows):
+        end = min(start + block_rows, rows)
+        scores[..., start:end] = score_block(start, end)
+    return scores
+
+def _top(scores: np.ndarray, valid: np.ndarray, count: int) -> List[Tuple[int, float]]:
+    """The count highest-scoring valid rows as (row, cosine distance), best first"""
+    candidates = np.flatnonzero(valid)
+    if not len(candidates):
+        return []
+    if len(candidates) < len(scores):
+        scores = scores[candidates]
+    else:
+        candidates = None
+    count = min(count, len(scores))
+    top = np.argpartition(-scores, count - 1)[:count] if count < len(scores) else np.arange(len(scores))
+    top = top[np.argsort(-scores[top], kind="stable")]
+    rows = candidates[top] if candidates is not None else top
+    return [(int(row), float(1.0 - score)) for row, score in zip(rows, scores[top])]
+
+def _pq_scores(lookup: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """Approximate similarities of pq-coded rows from the per-subvector lookup table"""
+    # One table lookup per subvector is about twice as fast as a 2-D fancy index
+    scores = np.zeros(len(codes), dtype=np.float32)
+    for m in range(len(lookup)):
+        scores += lookup[m].take(codes[:, m])
+    return scores
+
+def _int8_encode(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric int8 codes with one scale per row"""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def _nearest_centroids(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    distances = (centroids ** 2).sum(axis=1)[None, :] - 2.0 * points @ centroids.T
+    return distances.argmin(axis=1)
+
+def _pq_train(sample: np.ndarray, subvectors: int, dimensions: int, rng) -> np.ndarray:
+    """k-means codebooks of PQ_CENTROIDS centroids per subvector, shaped (subvectors, 256, dimensions)"""
+    codebooks = np.zeros((subvectors, PQ_CENTROIDS, dimensions), dtype=np.float32)
+    for m in range(subvectors):
+        points = sample[:, m * dimensions:(m + 1) * dimensions]
+        count = min(PQ_CENTROIDS, len(points))
+        centroids = points[rng.choice(len(points), count, replace=False)].copy()
+        for _ in range(PQ_KMEANS_ITERATIONS):
+            assignment = _nearest_centroids(points, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, points)
+            counts = np.bincount(assignment, minlength=count)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        codebooks[m, :count] = centroids
+        # Fewer points than centroids: repeat the first ones, they are never the only nearest
+        codebooks[m, count:] = centroids[0]
+    return codebooks
+
+def _pq_encode(vectors: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+    subvectors, _, dimensions = codebooks.shape
+    codes = np.empty((len(vectors), subvectors), dtype=np.uint8)
+    for m in range(subvectors):
+        codes[:, m] = _nearest_centroids(vectors[:, m * dimensions:(m + 1) * dimensions], codebooks[m])
+    return codes
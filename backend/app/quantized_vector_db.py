@@ -0,0 +1,538 @@
+import os
+import json
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Callable
+import logging
+
+import numpy as np
+
+from app.config import settings
+from app.document_catalog import open_sqlite
+from app.lexical_index import LexicalIndex
+from app.models import QueryFilters
+from app.quantized_index import QuantizedIndex
+from app.query_filters import matches_where
+from app.embeddings import (
+    EmbeddingProvider,
+    EmbeddingConfigurationError,
+    embedding_provider as default_embedding_provider,
+)
+
+logger = logging.getLogger(__name__)
+
+# Subdirectories of the persist directory
+QUANTIZED_DIRECTORY = "quantized"
+LEXICAL_INDEX_DIRECTORY = "lexical_index"
+RECORDS_FILE = "records.db"
+LEXICAL_REBUILD_PAGE_SIZE = 5000
+# SQLite's default limit on host parameters is 999
+SQLITE_MAX_PARAMETERS = 900
+# Resident bytes per chunk of the SQLite page cache and row map, for memory_bytes
+RECORD_BYTES_PER_CHUNK = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id TEXT PRIMARY KEY,
+    row INTEGER NOT NULL,
+    document_id TEXT,
+    chunk_index INTEGER,
+    document TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_chunks_row ON chunks(row);
+CREATE INDEX IF NOT EXISTS idx_chunks_document_id ON chunks(document_id);
+CREATE INDEX IF NOT EXISTS idx_chunks_chunk_index ON chunks(chunk_index);
+CREATE TABLE IF NOT EXISTS info (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def _empty_results() -> Dict[str, Any]:
+    return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+
+def _batches(items: List[Any], size: int = SQLITE_MAX_PARAMETERS) -> Iterable[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+class QuantizedVectorDatabase:
+    """VectorDatabase backed by a QuantizedIndex instead of a Chroma HNSW index.
+
+    Vectors live in memory-mapped files (see QuantizedIndex): either plain
+    float32 vectors searched exactly (VECTOR_BACKEND=flat), or compressed
+    codes scanned with NumPy and full vectors on disk for rescoring the
+    best candidates (VECTOR_BACKEND=quantized). Chunk texts and metadata are
+    rows of a SQLite table keyed by chunk ID, each pointing at its vector's
+    row. The methods and result layouts are those of VectorDatabase.
+
+    Once deletes leave COMPACTION_TOMBSTONE_FRACTION of the rows
+    tombstoned, the index is compacted and the chunks' rows renumbered.
+    Searches racing a compaction notice it by a sequence number that is odd
+    while one runs, and retry behind it.
+    """
+
+    def __init__(
+        self,
+        embedding_provider: EmbeddingProvider = None,
+        persist_directory: str = None,
+        lexical_index: Optional[LexicalIndex] = None,
+        quantization: str = None
+    ):
+        persist_directory = persist_directory or settings.CHROMA_PERSIST_DIRECTORY
+        self.embedding_provider = embedding_provider or default_embedding_provider
+        directory = os.path.join(persist_directory, QUANTIZED_DIRECTORY)
+        os.makedirs(directory, exist_ok=True)
+        self.records_path = os.path.join(directory, RECORDS_FILE)
+        self._local = threading.local()
+        self._connections: List[Any] = []
+        self._connections_lock = threading.Lock()
+        self._connection().executescript(SCHEMA)
+        # No per-request limit as with Chroma; bounds a bulk insert transaction
+        self.max_batch_size = 50000
+        # Held by writes and compactions; searches take it only to retry
+        self._write_lock = threading.RLock()
+        self._sequence = 0
+
+        self._validate_embedding_model()
+        generation = self._connection().execute("SELECT value FROM info WHERE key = 'index_generation'").fetchone()
+        self.index = QuantizedIndex(
+            directory,
+            dimension=self.dimension,
+            quantization=quantization or settings.QUANTIZATION,
+            rescore_factor=settings.QUANTIZED_RESCORE_FACTOR,
+            pq_subvector_dimensions=settings.PQ_SUBVECTOR_DIMENSIONS,
+            pq_training_vectors=settings.PQ_TRAINING_VECTORS,
+            generation=int(generation[0]) if generation else 0
+        )
+        self.chunk_count = self._connection().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        if self.index.live_count() != self.chunk_count:
+            # Vectors appended without their records, e.g. by a crash mid-insert
+            rows = [row for row, in self._connection().execute("SELECT row FROM chunks")]
+            self.index.set_live(rows)
+            logger.info(f"Reconciled quantized index with {len(rows)} stored chunks")
+
+        if lexical_index is None and settings.HYBRID_SEARCH_ENABLED:
+            lexical_index = LexicalIndex(os.path.join(persist_directory, LEXICAL_INDEX_DIRECTORY))
+        self.lexical_index = lexical_index
+        if self.lexical_index is not None:
+            self._sync_lexical_index()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Used by its thread only, but closed by whichever thread closes the database
+            connection = open_sqlite(self.records_path, check_same_thread=False)
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _validate_embedding_model(self):
+        """Record the embedding model on first use; fail fast if the stored vectors come from another"""
+        connection = self._connection()
+        info = dict(connection.execute("SELECT key, value FROM info").fetchall())
+        expected_model = self.embedding_provider.model_name
+        expected_dimension = self.embedding_provider.dimension
+        if not info:
+            connection.executemany("INSERT INTO info (key, value) VALUES (?, ?)", [
+                ("embedding_provider", self.embedding_provider.name),
+                ("embedding_model", expected_model),
+                ("embedding_dimension", str(expected_dimension or 0)),
+            ])
+            self.dimension = expected_dimension or 0
+            return
+
+        stored_model = info["embedding_model"]
+        stored_dimension = int(info["embedding_dimension"])
+        self.dimension = stored_dimension or expected_dimension or 0
+        if stored_model != expected_model or (
+            stored_dimension and expected_dimension and stored_dimension != expected_dimension
+        ):
+            raise EmbeddingConfigurationError(
+                f"Quantized index was built with {stored_model} "
+                f"({stored_dimension or 'unknown'} dimensions) but the configured embedding model is "
+                f"{expected_model} ({expected_dimension or 'unknown'} dimensions). "
+                f"Re-index the documents or restore the original EMBEDDING_MODEL."
+            )
+
+    def _sync_lexical_index(self):
+        """Rebuild the lexical index from the stored chunks if their counts differ"""
+        count = self.chunk_count
+        if self.lexical_index.live_count == count:
+            return
+        logger.info(f"Rebuilding lexical index from {count} chunks")
+        self.lexical_index.clear()
+        last_row = -1
+        while True:
+            page = self._connection().execute(
+                "SELECT row, id, document FROM chunks WHERE row > ? ORDER BY row LIMIT ?",
+                (last_row, LEXICAL_REBUILD_PAGE_SIZE)
+            ).fetchall()
+            if not page:
+                break
+            self.lexical_index.add([row[1] for row in page], [row[2] for row in page], merge=False)
+            last_row = page[-1][0]
+        self.lexical_index.save()
+
+    def _rows_of(self, ids: List[str]) -> Dict[str, int]:
+        rows = {}
+        for batch in _batches(ids):
+            rows.update(self._connection().execute(
+                f"SELECT id, row FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+            ).fetchall())
+        return rows
+
+    def _document_rows(self, document_ids: List[str]) -> List[int]:
+        rows = []
+        for batch in _batches(document_ids):
+            rows.extend(row for row, in self._connection().execute(
+                f"SELECT row FROM chunks WHERE document_id IN ({','.join('?' * len(batch))})", batch
+            ))
+        return rows
+
+    def _where_rows(self, where: Dict[str, Any]) -> List[int]:
+        return [
+            row for row, metadata in self._connection().execute("SELECT row, metadata FROM chunks")
+            if matches_where(where, json.loads(metadata))
+        ]
+
+    def _consistent(self, search: Callable[[], Any]) -> Any:
+        """Run a search that maps rows to records, again behind the write lock if a compaction renumbered rows meanwhile"""
+        sequence = self._sequence
+        if sequence % 2 == 0:
+            results = search()
+            if self._sequence == sequence:
+                return results
+        with self._write_lock:
+            return search()
+
+    def _with_records(self, hits: List[Tuple[int, float]]) -> Dict[str, Any]:
+        """Chroma query results for (row, distance) hits"""
+        records = {}
+        rows = [row for row, _ in hits]
+        for batch in _batches(rows):
+            for row, chunk_id, document, metadata in self._connection().execute(
+                f"SELECT row, id, document, metadata FROM chunks WHERE row IN ({','.join('?' * len(batch))})", batch
+            ):
+                records[row] = (chunk_id, document, json.loads(metadata))
+        hits = [(row, distance) for row, distance in hits if row in records]
+        return {
+            "ids": [[records[row][0] for row, _ in hits]],
+            "documents": [[records[row][1] for row, _ in hits]],
+            "metadatas": [[records[row][2] for row, _ in hits]],
+            "distances": [[distance for _, distance in hits]],
+        }
+
+    def add_documents(
+        self,
+        chunks: List[str],
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+        embeddings: Optional[List[List[float]]] = None
+    ) -> bool:
+        """Add document chunks; as with Chroma, IDs that are already stored are skipped"""
+        try:
+            existing = self._rows_of(ids)
+            new = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+            if not new:
+                return True
+            if embeddings is None:
+                vectors = dict(zip(new, self.embedding_provider.embed([chunks[i] for i in new])))
+            else:
+                vectors = {i: embeddings[i] for i in new}
+
+            with self._write_lock:
+                # Another writer may have stored some of the IDs while these were embedded
+                existing = self._rows_of([ids[i] for i in new])
+                new = [i for i in new if ids[i] not in existing]
+                if not new:
+                    return True
+                rows = self.index.append([vectors[i] for i in new])
+                if not self.dimension:
+                    self.dimension = self.index.dimension
+                    self._connection().execute(
+                        "UPDATE info SET value = ? WHERE key = 'embedding_dimension'", (str(self.dimension),)
+                    )
+
+                connection = self._connection()
+                connection.execute("BEGIN")
+                try:
+                    connection.executemany(
+                        "INSERT INTO chunks (id, row, document_id, chunk_index, document, metadata) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        [
+                            (ids[i], row, metadatas[i].get("document_id"), metadatas[i].get("chunk_index"),
+                             chunks[i], json.dumps(metadatas[i]))
+                            for i, row in zip(new, rows)
+                        ]
+                    )
+                    connection.execute("COMMIT")
+                except Exception:
+                    connection.execute("ROLLBACK")
+                    self.index.delete(rows)
+                    raise
+                self.chunk_count += len(new)
+            if self.lexical_index is not None:
+                self.lexical_index.add([ids[i] for i in new], [chunks[i] for i in new])
+            logger.info(f"Added {len(new)} chunks to quantized vector database")
+            return True
+        except Exception as e:
+            logger.error(f"Error adding documents: {str(e)}")
+            return False
+
+    def similarity_search(
+        self,
+        query: str = None,
+        n_results: int = 5,
+        where: Dict[str, Any] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> Dict[str, Any]:
+        """Perform similarity search with a query string or a precomputed query vector.
+
+        A Chroma where clause is checked against the metadata of every
+        chunk, skipping the rows that fail it; query filters are faster
+        through filtered_search, which uses the catalog.
+        """
+        try:
+            if query_embedding is None:
+                query_embedding = self.embedding_provider.embed_query(query)
+            if where is None:
+                return self._consistent(lambda: self._with_records(self.index.search(query_embedding, n_results)))
+
+            def search():
+                allowed = np.zeros(self.index.rows, dtype=bool)
+                allowed[self._where_rows(where)] = True
+                return self._with_records(self.index.search(query_embedding, n_results, allowed=allowed))
+            return self._consistent(search)
+        except Exception as e:
+            logger.error(f"Error in similarity search: {str(e)}")
+            return _empty_results()
+
+    def batch_similarity_search(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 5
+    ) -> List[Dict[str, Any]]:
+        """Search several query vectors in one pass over the index; one result per query, in Chroma's layout"""
+        if not len(query_embeddings):
+            return []
+        try:
+            return self._consistent(lambda: [
+                self._with_records(hits) for hits in self.index.search_batch(query_embeddings, n_results)
+            ])
+        except Exception as e:
+            logger.error(f"Error in batch similarity search: {str(e)}")
+            return [_empty_results() for _ in query_embeddings]
+
+    def filtered_search(
+        self,
+        query_embedding: List[float],
+        n_results: int,
+        filters: QueryFilters,
+        documents: Dict[str, int],
+        total_chunks: int
+    ) -> Dict[str, Any]:
+        """Vector search restricted to the chunks of documents, the ones matching filters.
+
+        Few matching chunks are compared exactly; otherwise the scan skips
+        the rows of other documents.
+        """
+        matching = sum(documents.values())
+        if matching == 0:
+            return _empty_results()
+        if matching <= settings.SCOPED_SEARCH_MAX_CHUNKS:
+            return self.scoped_search(list(documents), query_embedding, n_results)
+
+        def search():
+            allowed = np.zeros(self.index.rows, dtype=bool)
+            allowed[self._document_rows(list(documents))] = True
+            return self._with_records(self.index.search(query_embedding, n_results, allowed=allowed))
+        return self._consistent(search)
+
+    def scoped_search(
+        self,
+        document_ids: List[str],
+        query_embedding: List[float],
+        n_results: int = 5
+    ) -> Dict[str, Any]:
+        """Exact search over the chunks of a few documents"""
+        return self._consistent(lambda: self._with_records(
+            self.index.rescore(self._document_rows(document_ids), query_embedding, n_results)
+        ))
+
+    def lexical_search(self, query: str, n_results: int = 5) -> List[Tuple[str, float]]:
+        """BM25 search of the chunk texts, as (chunk_id, score) best first"""
+        if self.lexical_index is None:
+            return []
+        return self.lexical_index.search(query, n_results)
+
+    def get_chunks(self, ids: List[str]) -> Dict[str, Any]:
+        """Texts and metadata of chunks by ID"""
+        records = {}
+        for batch in _batches(ids):
+            for chunk_id, document, metadata in self._connection().execute(
+                f"SELECT id, document, metadata FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+            ):
+                records[chunk_id] = (document, json.loads(metadata))
+        found = [chunk_id for chunk_id in dict.fromkeys(ids) if chunk_id in records]
+        return {
+            "ids": found,
+            "documents": [records[chunk_id][0] for chunk_id in found],
+            "metadatas": [records[chunk_id][1] for chunk_id in found],
+        }
+
+    def get_document_chunks(self, document_id: str) -> Dict[str, Dict[str, Any]]:
+        """Metadata of every chunk of a document, keyed by chunk ID"""
+        return {
+            chunk_id: json.loads(metadata)
+            for chunk_id, metadata in self._connection().execute(
+                "SELECT id, metadata FROM chunks WHERE document_id = ?", (document_id,)
+            )
+        }
+
+    def document_chunk_ids(self, document_ids: List[str]) -> List[str]:
+        """IDs of every chunk of the given documents, in one lookup"""
+        chunk_ids = []
+        for batch in _batches(list(document_ids)):
+            chunk_ids.extend(chunk_id for chunk_id, in self._connection().execute(
+                f"SELECT id FROM chunks WHERE document_id IN ({','.join('?' * len(batch))})", batch
+            ))
+        return chunk_ids
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """Merge new metadata values into existing chunks without touching their embeddings"""
+        if not ids:
+            return
+        stored = self.get_chunks(ids)
+        current = dict(zip(stored["ids"], stored["metadatas"]))
+        updates = []
+        for chunk_id, metadata in zip(ids, metadatas):
+            if chunk_id in current:
+                merged = {**current[chunk_id], **metadata}
+                updates.append((merged.get("document_id"), merged.get("chunk_index"), json.dumps(merged), chunk_id))
+                current[chunk_id] = merged
+        connection = self._connection()
+        connection.execute("BEGIN")
+        try:
+            connection.executemany(
+                "UPDATE chunks SET document_id = ?, chunk_index = ?, metadata = ? WHERE id = ?", updates
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def delete_chunks(self, ids: List[str]):
+        """Delete chunks by ID"""
+        with self._write_lock:
+            rows = self._rows_of(ids)
+            if not rows:
+                return
+            connection = self._connection()
+            connection.execute("BEGIN")
+            try:
+                for batch in _batches(list(rows)):
+                    connection.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch)
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            self.index.delete(rows.values())
+            self.chunk_count -= len(rows)
+            tombstones = self.index.rows - self.chunk_count
+            if (
+                tombstones >= settings.COMPACTION_MIN_TOMBSTONES
+                and tombstones >= settings.COMPACTION_TOMBSTONE_FRACTION * self.index.rows
+            ):
+                self.compact()
+        if self.lexical_index is not None:
+            self.lexical_index.delete(list(rows))
+
+    def compact(self):
+        """Rewrite the index without its tombstoned rows and renumber the chunks' rows to match"""
+        with self._write_lock:
+            started = time.perf_counter()
+            kept = self.index.prepare_compaction()
+            connection = self._connection()
+            self._sequence += 1
+            try:
+                connection.execute("BEGIN")
+                try:
+                    # In ascending order every row moves down into a slot already vacated
+                    connection.executemany(
+                        "UPDATE chunks SET row = ? WHERE row = ?",
+                        [(new, int(old)) for new, old in enumerate(kept) if new != old]
+                    )
+                    connection.execute(
+                        "INSERT OR REPLACE INTO info (key, value) VALUES ('index_generation', ?)",
+                        (str(self.index.generation + 1),)
+                    )
+                    connection.execute("COMMIT")
+                except Exception:
+                    connection.execute("ROLLBACK")
+                    self.index.discard_compaction()
+                    raise
+                self.index.finish_compaction()
+            finally:
+                self._sequence += 1
+            logger.info(
+                f"Compacted quantized index to {len(kept)} rows in {time.perf_counter() - started:.2f}s"
+            )
+
+    def delete_documents(self, document_id: str) -> bool:
+        """Delete all chunks for a specific document"""
+        try:
+            ids = list(self.get_document_chunks(document_id))
+            if ids:
+                self.delete_chunks(ids)
+                logger.info(f"Deleted {len(ids)} chunks for document {document_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting document chunks: {str(e)}")
+            return False
+
+    def get_document_count(self) -> int:
+        """Get total number of chunks in the database"""
+        return self.chunk_count
+
+    def memory_bytes(self) -> int:
+        """Estimated resident memory of the scanned codes, record lookups and lexical index"""
+        memory = self.index.memory_bytes() + self.chunk_count * RECORD_BYTES_PER_CHUNK
+        if self.lexical_index is not None:
+            memory += self.lexical_index.memory_bytes()
+        return memory
+
+    def warm(self):
+        """Read the scanned codes into the page cache now rather than on the first search"""
+        self.index.warm()
+
+    def close(self):
+        """Close the index files and database connections"""
+        if self.lexical_index is not None:
+            self.lexical_index.close()
+        self.index.close()
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def get_document_summaries(self) -> List[Dict[str, Any]]:
+        """Metadata of the first chunk of every document"""
+        return [
+            metadata for metadata in (
+                json.loads(row) for row, in self._connection().execute(
+                    "SELECT metadata FROM chunks WHERE chunk_index = 0"
+                )
+            )
+            if "document_id" in metadata
+        ]
+
+    def list_documents(self) -> List[str]:
+        """List all unique document IDs"""
+        return [
+            document_id for document_id, in self._connection().execute(
+                "SELECT DISTINCT document_id FROM chunks WHERE document_id IS NOT NULL"
+            )
+        ]
@@ -0,0 +1,86 @@
+from typing import List, Dict, Any, Optional
+
+from app.models import QueryFilters
+
+def is_empty(filters: Optional[QueryFilters]) -> bool:
+    return filters is None or not any([
+        filters.document_ids, filters.file_types, filters.filenames,
+        filters.uploaded_after, filters.uploaded_before,
+    ])
+
+def build_where(filters: Optional[QueryFilters]) -> Optional[Dict[str, Any]]:
+    """Chroma where clause for the filters, or None if they match everything.
+
+    Upload dates are compared on the numeric upload_timestamp metadata,
+    since Chroma only supports range operators on numbers.
+    """
+    if is_empty(filters):
+        return None
+    conditions = []
+    if filters.document_ids:
+        conditions.append(_any_of("document_id", filters.document_ids))
+    if filters.file_types:
+        conditions.append(_any_of("file_type", _file_types(filters)))
+    if filters.filenames:
+        conditions.append(_any_of("filename", filters.filenames))
+    if filters.uploaded_after:
+        conditions.append({"upload_timestamp": {"$gte": filters.uploaded_after.timestamp()}})
+    if filters.uploaded_before:
+        conditions.append({"upload_timestamp": {"$lte": filters.uploaded_before.timestamp()}})
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+def matches(filters: Optional[QueryFilters], metadata: Dict[str, Any]) -> bool:
+    """Whether a chunk's metadata passes the filters, with the same semantics as build_where"""
+    if is_empty(filters):
+        return True
+    if filters.document_ids and metadata.get("document_id") not in filters.document_ids:
+        return False
+    if filters.file_types and metadata.get("file_type") not in _file_types(filters):
+        return False
+    if filters.filenames and metadata.get("filename") not in filters.filenames:
+        return False
+    timestamp = metadata.get("upload_timestamp")
+    if filters.uploaded_after and (timestamp is None or timestamp < filters.uploaded_after.timestamp()):
+        return False
+    if filters.uploaded_before and (timestamp is None or timestamp > filters.uploaded_before.timestamp()):
+        return False
+    return True
+
+# Chroma where operators; a chunk without the compared key never matches
+WHERE_OPERATORS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value > operand,
+    "$gte": lambda value, operand: value >= operand,
+    "$lt": lambda value, operand: value < operand,
+    "$lte": lambda value, operand: value <= operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+def matches_where(where: Optional[Dict[str, Any]], metadata: Dict[str, Any]) -> bool:
+    """Whether a chunk's metadata passes a Chroma where clause, for backends that filter outside Chroma"""
+    for key, condition in (where or {}).items():
+        if key == "$and":
+            if not all(matches_where(clause, metadata) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(clause, metadata) for clause in condition):
+                return False
+        else:
+            if key not in metadata:
+                return False
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, operand in condition.items():
+                if operator not in WHERE_OPERATORS:
+                    raise ValueError(f"Unsupported where operator: {operator}")
+                if not WHERE_OPERATORS[operator](metadata[key], operand):
+                    return False
+    return True
+
+def _file_types(filters: QueryFilters) -> List[str]:
+    return [file_type.lower().lstrip(".") for file_type in filters.file_types]
+
+def _any_of(key: str, values: List[str]) -> Dict[str, Any]:
+    return {key: values[0]} if len(values) == 1 else {key: {"$in": list(values)}}
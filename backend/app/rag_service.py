@@ -1,142 +1,834 @@
 import os
 import uuid
 import time
-from typing import List, Dict, Any
+import asyncio
+import weakref
+from itertools import islice
+from typing import List, Dict, Any, Optional, Callable, AsyncIterator, Iterator, Tuple
 from datetime import datetime
 import logging
 
-from app.vector_db import vector_db
-from app.document_processor import document_processor
+from app.vector_db import vector_db, create_vector_database, VectorDatabase
+from app.document_processor import document_processor, hash_file
 from app.openai_service import openai_service
-from app.models import Document, DocumentChunk, QueryResponse, UploadResponse
+from app.embeddings import embedding_provider, CachedEmbeddingProvider
+from app.concurrency import run_blocking
+from app.answer_cache import AnswerCache
+from app.document_catalog import DocumentCatalog
+from app.lexical_index import reciprocal_rank_fusion
+from app.reranker import create_reranker
+from app.context_builder import context_builder
+from app.query_filters import is_empty, matches
+from app.metrics import metrics, RequestTrace
+from app.tenants import TenantManager, TenantStore, DEFAULT_TENANT
+from app.models import (
+    BatchQueryResponse, BatchQueryResult, Document, DocumentChunk, QueryFilters, QueryResponse, UploadResponse
+)
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Filtered hybrid queries fetch this many times more lexical hits, as some will not match
+LEXICAL_FILTER_OVERFETCH = 4
+
+NO_RESULTS_ANSWER = "I couldn't find any relevant information in the knowledge base to answer your question. Please try rephrasing your query or upload relevant documents first."
+
+async def _single_token(text: str) -> AsyncIterator[str]:
+    yield text
+
 class RAGService:
     def __init__(self):
-        self.documents_metadata: Dict[str, Document] = {}
+        # Every request works on the store of the current tenant
+        self.tenants = TenantManager(self._open_tenant)
+        # Dropped once no upload or delete of the document holds them
+        self._document_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self.reranker = create_reranker()
 
-    async def upload_document(self, file_path: str, original_filename: str) -> UploadResponse:
-        """Process and upload a document to the knowledge base"""
+    def _open_tenant(self, tenant_id: str) -> TenantStore:
+        """Open a tenant's vector database and catalog, validating the catalog against it.
+
+        The default tenant uses the configured Chroma directory and catalog;
+        others get their own under TENANTS_DIRECTORY.
+        """
+        answer_cache = AnswerCache() if settings.ANSWER_CACHE_ENABLED else None
+        if tenant_id == DEFAULT_TENANT:
+            store = TenantStore(tenant_id, vector_db, DocumentCatalog(), answer_cache, owned=False)
+        else:
+            directory = os.path.join(settings.TENANTS_DIRECTORY, tenant_id)
+            store = TenantStore(
+                tenant_id,
+                create_vector_database(
+                    persist_directory=os.path.join(directory, "chroma"),
+                    backend=settings.TENANT_VECTOR_BACKENDS.get(tenant_id)
+                ),
+                DocumentCatalog(os.path.join(directory, "catalog.db")),
+                answer_cache
+            )
+        _sync_catalog(store.catalog, store.vector_db)
+        store.vector_db.warm()
+        return store
+
+    async def upload_document(
+        self,
+        file_path: str,
+        original_filename: str,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        content_hash: Optional[str] = None,
+        document_id: Optional[str] = None,
+        stage_callback: Optional[Callable[[str], None]] = None
+    ) -> UploadResponse:
+        """Process and upload a document to the knowledge base.
+
+        With the ID of an existing document this replaces its content
+        incrementally: only chunks whose content is new are embedded and
+        inserted, chunks that disappeared are deleted and chunks that only
+        moved get their metadata rewritten in place. Re-running an
+        interrupted upload is therefore also cheap and idempotent.
+
+        progress_callback(done, total) reports embedding progress in chunks and
+        stage_callback(stage) reports the "embedding" and "storing" stages.
+        content_hash is the file's SHA-256, computed here when not given.
+        The time spent extracting, chunking, embedding and storing is recorded
+        in the stage metrics and returned in the response's timings.
+        """
+        document_id = document_id or str(uuid.uuid4())
+        trace = RequestTrace()
+        try:
+            async with self.tenants.use() as store:
+                async with self._document_lock(document_id):
+                    with trace.stage("total"):
+                        response = await self._ingest_document(
+                            store, file_path, original_filename, document_id, content_hash,
+                            progress_callback, stage_callback, trace
+                        )
+        finally:
+            metrics.record("upload", trace)
+        response.timings = trace.as_dict()
+        # The tenant's indexes grew
+        await run_blocking(self.tenants.enforce_budget)
+        return response
+
+    async def _ingest_document(
+        self,
+        store: TenantStore,
+        file_path: str,
+        original_filename: str,
+        document_id: str,
+        content_hash: Optional[str],
+        progress_callback: Optional[Callable[[int, int], None]],
+        stage_callback: Optional[Callable[[str], None]],
+        trace: RequestTrace
+    ) -> UploadResponse:
         try:
             # Determine file type
             file_type = original_filename.split('.')[-1].lower()
             file_size = os.path.getsize(file_path)
+            if content_hash is None:
+                content_hash = await run_blocking(hash_file, file_path)
+
+            current = await run_blocking(store.catalog.get, document_id)
+            if current and current.content_hash == content_hash and current.original_filename == original_filename:
+                logger.info(f"Document {original_filename} is unchanged")
+                return UploadResponse(
+                    document_id=document_id,
+                    filename=original_filename,
+                    chunk_count=current.chunk_count,
+                    message="Document unchanged"
+                )
             
-            # Process document
-            document_id, chunks, metadatas = document_processor.process_document(
-                file_path, original_filename, file_type
+            existing = await run_blocking(store.vector_db.get_document_chunks, document_id)
+            # A replaced document keeps its original upload date
+            upload_date = next(iter(existing.values()))["upload_date"] if existing else datetime.now().isoformat()
+            # Extraction and chunking are interleaved in the stream; timings
+            # gets the extraction time and the total time reading the stream
+            timings = {"extract": 0.0, "read": 0.0}
+            stream = document_processor.stream_document(
+                file_path, original_filename, file_type, document_id, datetime.fromisoformat(upload_date), timings
             )
+
+            # The file is read, embedded and stored a batch of chunks at a time,
+            # so memory stays bounded however large it is. The next batch is
+            # extracted while the current one is embedded.
+            if stage_callback:
+                stage_callback("embedding")
+            kept_ids = set()
+            first_id = None
+            chunk_count = added = moved = 0
+            pending = asyncio.ensure_future(run_blocking(_next_batch, stream, timings))
+            try:
+                while True:
+                    batch = await pending
+                    if not batch:
+                        break
+                    pending = asyncio.ensure_future(run_blocking(_next_batch, stream, timings))
+                    if first_id is None:
+                        # The first chunk carries enough document metadata to rebuild the catalog
+                        first_id = batch[0][0]
+                        batch[0][2]["size_bytes"] = file_size
+                        batch[0][2]["content_hash"] = content_hash
+                    counts = await self._store_batch(
+                        store, batch, existing, chunk_count, added, progress_callback, trace
+                    )
+                    chunk_count += len(batch)
+                    added += counts[0]
+                    moved += counts[1]
+                    kept_ids.update(chunk_id for chunk_id, _, _ in batch)
+            finally:
+                pending.cancel()
+            trace.add("extract", timings["extract"])
+            trace.add("chunk", timings["read"] - timings["extract"])
+
+            # Adding before deleting means readers never see the document missing
+            if stage_callback:
+                stage_callback("storing")
+            with trace.stage("store"):
+                if first_id is not None and (first_id not in existing or existing[first_id].get("chunk_count") != chunk_count):
+                    await run_blocking(
+                        store.vector_db.update_metadatas,
+                        [first_id],
+                        [{"document_id": document_id, "chunk_count": chunk_count}]
+                    )
+                removed_ids = [chunk_id for chunk_id in existing if chunk_id not in kept_ids]
+                await run_blocking(store.vector_db.delete_chunks, removed_ids)
+                
+                # Store document metadata
+                document = Document(
+                    id=document_id,
+                    filename=original_filename,
+                    original_filename=original_filename,
+                    file_type=file_type,
+                    upload_date=datetime.fromisoformat(upload_date),
+                    chunk_count=chunk_count,
+                    size_bytes=file_size,
+                    content_hash=content_hash
+                )
+                
+                await run_blocking(store.catalog.upsert, document)
+            self._invalidate_answers(store, document_id)
             
-            # Generate embeddings
-            embeddings = await openai_service.generate_embeddings(chunks)
-            
-            # Create chunk IDs
-            chunk_ids = [f"{document_id}_{i}" for i in range(len(chunks))]
-            
-            # Store in vector database
-            # Note: ChromaDB handles embeddings automatically when using OpenAI
-            success = vector_db.add_documents(chunks, metadatas, chunk_ids)
-            
-            if not success:
-                raise Exception("Failed to store document in vector database")
-            
-            # Store document metadata
-            document = Document(
-                id=document_id,
-                filename=original_filename,
-                original_filename=original_filename,
-                file_type=file_type,
-                upload_date=datetime.now(),
-                chunk_count=len(chunks),
-                size_bytes=file_size
+            logger.info(
+                f"Successfully uploaded document: {original_filename} "
+                f"({added} chunks added, {moved} moved, {len(removed_ids)} removed; "
+                f"stage seconds {trace.as_dict()})"
             )
             
-            self.documents_metadata[document_id] = document
-            
-            logger.info(f"Successfully uploaded document: {original_filename}")
-            
             return UploadResponse(
                 document_id=document_id,
                 filename=original_filename,
-                chunk_count=len(chunks),
-                message="Document uploaded and processed successfully"
+                chunk_count=chunk_count,
+                message="Document uploaded and processed successfully",
+                chunks_added=added,
+                chunks_moved=moved,
+                chunks_removed=len(removed_ids)
             )
             
         except Exception as e:
             logger.error(f"Error uploading document: {str(e)}")
             raise
 
+    async def _store_batch(
+        self,
+        store: TenantStore,
+        batch: List[Tuple[str, str, Dict[str, Any]]],
+        existing: Dict[str, Dict[str, Any]],
+        chunks_before: int,
+        added_before: int,
+        progress_callback: Optional[Callable[[int, int], None]],
+        trace: RequestTrace
+    ) -> Tuple[int, int]:
+        """Embed and add the new chunks of a batch and rewrite the metadata of moved ones.
+
+        Chunks are diffed against the stored ones by content-derived ID.
+        Returns the numbers of chunks added and moved.
+        """
+        new = [(chunk_id, text, metadata) for chunk_id, text, metadata in batch if chunk_id not in existing]
+        moved = [
+            (chunk_id, metadata) for chunk_id, _, metadata in batch
+            if chunk_id in existing and any(existing[chunk_id].get(key) != value for key, value in metadata.items())
+        ]
+
+        # Progress counts the whole upload; the total grows as the file is read
+        batch_progress = None
+        if progress_callback:
+            batch_progress = lambda done, total: progress_callback(added_before + done, added_before + total)
+        with trace.stage("embed"):
+            embeddings = await openai_service.generate_embeddings(
+                [text for _, text, _ in new],
+                token_counts=[metadata["token_count"] for _, _, metadata in new],
+                progress_callback=batch_progress
+            )
+
+        with trace.stage("store"):
+            if new:
+                success = await run_blocking(
+                    store.vector_db.add_documents,
+                    [text for _, text, _ in new],
+                    [metadata for _, _, metadata in new],
+                    [chunk_id for chunk_id, _, _ in new],
+                    embeddings=embeddings
+                )
+                if not success:
+                    raise Exception("Failed to store document in vector database")
+            await run_blocking(
+                store.vector_db.update_metadatas,
+                [chunk_id for chunk_id, _ in moved],
+                [metadata for _, metadata in moved]
+            )
+        logger.debug(f"Stored chunks {chunks_before}-{chunks_before + len(batch)}: {len(new)} new, {len(moved)} moved")
+        return len(new), len(moved)
+
+    def _document_lock(self, document_id: str) -> asyncio.Lock:
+        """Lock serializing ingestion and deletion of one document"""
+        lock = self._document_locks.get(document_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._document_locks[document_id] = lock
+        return lock
+
     async def query_knowledge_base(
         self, 
         query: str, 
         max_chunks: int = None,
-        conversation_history: List[dict] = None
+        conversation_history: List[dict] = None,
+        filters: Optional[QueryFilters] = None,
+        include_timings: bool = False,
+        retrieval_only: bool = False
     ) -> QueryResponse:
-        """Query the knowledge base and generate response"""
-        start_time = time.time()
+        """Query the knowledge base and generate response, optionally restricted by filters.
+
+        Every stage is timed and recorded in the stage metrics; with include_timings the
+        response also carries this query's breakdown. With retrieval_only the ranked
+        chunks are returned without generating an answer.
+        """
         max_chunks = max_chunks or settings.MAX_RETRIEVAL_CHUNKS
+        trace = RequestTrace()
         
         try:
-            # Perform similarity search
-            search_results = vector_db.similarity_search(
-                query=query,
-                n_results=max_chunks
-            )
-            
-            # Extract results
-            retrieved_chunks = []
-            if search_results["documents"] and search_results["documents"][0]:
-                for i, (doc_id, content, metadata) in enumerate(zip(
-                    search_results["ids"][0],
-                    search_results["documents"][0], 
-                    search_results["metadatas"][0]
-                )):
-                    chunk = DocumentChunk(
-                        id=doc_id,
-                        document_id=metadata.get("document_id", "unknown"),
-                        content=content,
-                        metadata=metadata,
-                        chunk_index=metadata.get("chunk_index", i)
+            with trace.stage("total"):
+                async with self.tenants.use() as store:
+                    response = await self._answer_query(
+                        store, query, max_chunks, conversation_history, filters, trace, retrieval_only
                     )
-                    retrieved_chunks.append(chunk)
-            
-            # Generate response using retrieved context
-            if retrieved_chunks:
-                context_texts = [chunk.content for chunk in retrieved_chunks]
+        except Exception as e:
+            logger.error(f"Error querying knowledge base: {str(e)}")
+            raise
+        finally:
+            metrics.record("query", trace)
+        if include_timings:
+            # Responses may be shared with the answer cache, so annotate a copy
+            response = response.model_copy(update={"timings": trace.as_dict()})
+        return response
+
+    async def _answer_query(
+        self,
+        store: TenantStore,
+        query: str,
+        max_chunks: int,
+        conversation_history: Optional[List[dict]],
+        filters: Optional[QueryFilters],
+        trace: RequestTrace,
+        retrieval_only: bool = False
+    ) -> QueryResponse:
+        start_time = time.time()
+        # Answers depend on the conversation when there is history, so only
+        # standalone, unfiltered queries go through the answer cache
+        answer_cache = store.answer_cache
+        use_cache = (
+            answer_cache is not None and not retrieval_only and not conversation_history and is_empty(filters)
+        )
+
+        if use_cache:
+            with trace.stage("cache_lookup"):
+                cached = answer_cache.lookup_exact(query, max_chunks)
+            if cached:
+                return self._from_cache(cached, query, start_time, "exact")
+
+        retrieved_chunks, query_embedding = await self._retrieve_chunks(store, query, max_chunks, filters, trace)
+        if retrieval_only:
+            return QueryResponse(query=query, sources=retrieved_chunks, processing_time=time.time() - start_time)
+        return await self._answer_from_chunks(
+            store, query, max_chunks, conversation_history, retrieved_chunks, query_embedding, use_cache, start_time, trace
+        )
+
+    async def _answer_from_chunks(
+        self,
+        store: TenantStore,
+        query: str,
+        max_chunks: int,
+        conversation_history: Optional[List[dict]],
+        retrieved_chunks: List[DocumentChunk],
+        query_embedding: Optional[List[float]],
+        use_cache: bool,
+        start_time: float,
+        trace: RequestTrace
+    ) -> QueryResponse:
+        """Build the context from retrieved chunks and generate (or reuse) the answer"""
+        answer_cache = store.answer_cache
+        # Sources are the chunks that made it into the prompt context
+        with trace.stage("context_build"):
+            context = context_builder.build(retrieved_chunks)
+        retrieved_chunks = context.sources
+
+        if use_cache and retrieved_chunks:
+            with trace.stage("cache_lookup"):
+                cached = answer_cache.lookup_similar(
+                    query_embedding, [chunk.id for chunk in retrieved_chunks], max_chunks
+                )
+            if cached:
+                return self._from_cache(cached, query, start_time, "semantic")
+
+        # Generate response using retrieved context
+        if retrieved_chunks:
+            with trace.stage("generate"):
                 answer = await openai_service.generate_response(
-                    query, context_texts, conversation_history
+                    query, context.passages, conversation_history
                 )
+        else:
+            answer = NO_RESULTS_ANSWER
+
+        processing_time = time.time() - start_time
+
+        response = QueryResponse(
+            query=query,
+            answer=answer,
+            sources=retrieved_chunks,
+            processing_time=processing_time
+        )
+        if use_cache and retrieved_chunks:
+            answer_cache.store(query, max_chunks, query_embedding, response)
+        return response
+
+    async def query_knowledge_base_batch(
+        self,
+        queries: List[str],
+        max_chunks: int = None,
+        filters: Optional[QueryFilters] = None,
+        include_timings: bool = False,
+        retrieval_only: bool = False
+    ) -> BatchQueryResponse:
+        """Answer several queries, sharing the query embedding call and the vector search.
+
+        Answers are generated concurrently, BATCH_QUERY_CONCURRENCY at a time,
+        or not at all with retrieval_only. A query that fails gets the error
+        in its result instead of failing the batch. With include_timings the
+        batch and every answer carry their stage breakdown.
+        """
+        start_time = time.time()
+        max_chunks = max_chunks or settings.MAX_RETRIEVAL_CHUNKS
+        trace = RequestTrace()
+
+        try:
+            with trace.stage("total"):
+                async with self.tenants.use() as store:
+                    results = await self._answer_batch(
+                        store, queries, max_chunks, filters, include_timings, retrieval_only, start_time, trace
+                    )
+        except Exception as e:
+            logger.error(f"Error querying knowledge base in batch: {str(e)}")
+            raise
+        finally:
+            metrics.record("query_batch", trace)
+
+        return BatchQueryResponse(
+            results=results,
+            processing_time=time.time() - start_time,
+            timings=trace.as_dict() if include_timings else None
+        )
+
+    async def _answer_batch(
+        self,
+        store: TenantStore,
+        queries: List[str],
+        max_chunks: int,
+        filters: Optional[QueryFilters],
+        include_timings: bool,
+        retrieval_only: bool,
+        start_time: float,
+        trace: RequestTrace
+    ) -> List[BatchQueryResult]:
+        answer_cache = store.answer_cache
+        use_cache = answer_cache is not None and not retrieval_only and is_empty(filters)
+        results: List[Optional[BatchQueryResult]] = [None] * len(queries)
+
+        pending = []
+        for i, query in enumerate(queries):
+            if not query.strip():
+                results[i] = BatchQueryResult(query=query, error="Query cannot be empty")
+                continue
+            cached = None
+            if use_cache:
+                with trace.stage("cache_lookup"):
+                    cached = answer_cache.lookup_exact(query, max_chunks)
+            if cached:
+                results[i] = BatchQueryResult(query=query, response=self._from_cache(cached, query, start_time, "exact"))
             else:
-                answer = "I couldn't find any relevant information in the knowledge base to answer your question. Please try rephrasing your query or upload relevant documents first."
-            
-            processing_time = time.time() - start_time
-            
-            return QueryResponse(
-                query=query,
-                answer=answer,
-                sources=retrieved_chunks,
-                processing_time=processing_time
+                pending.append(i)
+        if not pending:
+            return results
+
+        try:
+            retrieved = await self._retrieve_chunks_batch(
+                store, [queries[i] for i in pending], max_chunks, filters, trace
             )
-            
         except Exception as e:
-            logger.error(f"Error querying knowledge base: {str(e)}")
+            # The queries were searched together, so they fail together
+            logger.error(f"Error retrieving chunks for batch: {str(e)}")
+            for i in pending:
+                results[i] = BatchQueryResult(query=queries[i], error=str(e))
+            return results
+
+        if retrieval_only:
+            processing_time = time.time() - start_time
+            for i, (retrieved_chunks, _) in zip(pending, retrieved):
+                results[i] = BatchQueryResult(query=queries[i], response=QueryResponse(
+                    query=queries[i], sources=retrieved_chunks, processing_time=processing_time
+                ))
+            return results
+
+        semaphore = asyncio.Semaphore(settings.BATCH_QUERY_CONCURRENCY)
+
+        async def answer(query: str, retrieved_chunks: List[DocumentChunk], query_embedding) -> BatchQueryResult:
+            query_trace = RequestTrace()
+            try:
+                async with semaphore:
+                    response = await self._answer_from_chunks(
+                        store, query, max_chunks, None, retrieved_chunks, query_embedding,
+                        use_cache, start_time, query_trace
+                    )
+            except Exception as e:
+                logger.error(f"Error answering batch query: {str(e)}")
+                return BatchQueryResult(query=query, error=str(e))
+            if include_timings:
+                response = response.model_copy(update={"timings": query_trace.as_dict()})
+            return BatchQueryResult(query=query, response=response)
+
+        # Wall time of generating every answer; each answer has its own breakdown
+        with trace.stage("answer"):
+            answered = await asyncio.gather(*(
+                answer(queries[i], retrieved_chunks, query_embedding)
+                for i, (retrieved_chunks, query_embedding) in zip(pending, retrieved)
+            ))
+        for i, result in zip(pending, answered):
+            results[i] = result
+        return results
+
+    def _from_cache(self, cached: QueryResponse, query: str, start_time: float, cache_hit: str) -> QueryResponse:
+        """Return a cached response as the answer to this query"""
+        return cached.model_copy(update={
+            "query": query,
+            "processing_time": time.time() - start_time,
+            "cache_hit": cache_hit
+        })
+
+    def _invalidate_answers(self, store: TenantStore, document_id: str):
+        if store.answer_cache is not None:
+            store.answer_cache.invalidate_documents([document_id])
+
+    async def stream_query_knowledge_base(
+        self,
+        query: str,
+        max_chunks: int = None,
+        conversation_history: List[dict] = None,
+        filters: Optional[QueryFilters] = None,
+        include_timings: bool = False
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Query the knowledge base, streaming the answer as it is generated.
+
+        Yields a "sources" event as soon as retrieval finishes, then one "token"
+        event per generated fragment, then a "done" event with timings, which
+        include the per-stage breakdown with include_timings.
+        """
+        start_time = time.time()
+        max_chunks = max_chunks or settings.MAX_RETRIEVAL_CHUNKS
+        trace = RequestTrace()
+
+        try:
+            async with self.tenants.use() as store:
+                answer_cache = store.answer_cache
+                use_cache = answer_cache is not None and not conversation_history and is_empty(filters)
+
+                cache_hit = None
+                cached = None
+                if use_cache:
+                    with trace.stage("cache_lookup"):
+                        cached = answer_cache.lookup_exact(query, max_chunks)
+                if cached:
+                    cache_hit = "exact"
+                    retrieved_chunks, query_embedding = cached.sources, None
+                else:
+                    retrieved_chunks, query_embedding = await self._retrieve_chunks(
+                        store, query, max_chunks, filters, trace
+                    )
+                    with trace.stage("context_build"):
+                        context = context_builder.build(retrieved_chunks)
+                    retrieved_chunks = context.sources
+                    if use_cache and retrieved_chunks:
+                        with trace.stage("cache_lookup"):
+                            cached = answer_cache.lookup_similar(
+                                query_embedding, [chunk.id for chunk in retrieved_chunks], max_chunks
+                            )
+                        cache_hit = "semantic" if cached else None
+                retrieval_time = time.time() - start_time
+                yield {
+                    "event": "sources",
+                    "data": {
+                        "query": query,
+                        "sources": [chunk.model_dump() for chunk in retrieved_chunks],
+                        "retrieval_time": retrieval_time
+                    }
+                }
+
+                if cached:
+                    tokens = _single_token(cached.answer)
+                elif retrieved_chunks:
+                    tokens = openai_service.stream_response(query, context.passages, conversation_history)
+                else:
+                    tokens = _single_token(NO_RESULTS_ANSWER)
+
+                time_to_first_token = None
+                answer_parts = []
+                generation_started = time.perf_counter()
+                async for token in tokens:
+                    if time_to_first_token is None:
+                        time_to_first_token = time.time() - start_time
+                        trace.add("ttft", time_to_first_token)
+                    answer_parts.append(token)
+                    yield {"event": "token", "data": {"content": token}}
+                # Includes the time the client took to read the tokens
+                trace.add("generate", time.perf_counter() - generation_started)
+
+                processing_time = time.time() - start_time
+                trace.add("total", processing_time)
+                if use_cache and not cached and retrieved_chunks:
+                    answer_cache.store(query, max_chunks, query_embedding, QueryResponse(
+                        query=query,
+                        answer="".join(answer_parts),
+                        sources=retrieved_chunks,
+                        processing_time=processing_time
+                    ))
+
+                yield {
+                    "event": "done",
+                    "data": {
+                        "retrieval_time": retrieval_time,
+                        "time_to_first_token": time_to_first_token,
+                        "processing_time": processing_time,
+                        "cache_hit": cache_hit,
+                        "timings": trace.as_dict() if include_timings else None
+                    }
+                }
+
+        except Exception as e:
+            logger.error(f"Error streaming query: {str(e)}")
             raise
+        finally:
+            metrics.record("query", trace)
+
+    async def _retrieve_chunks(
+        self,
+        store: TenantStore,
+        query: str,
+        max_chunks: int,
+        filters: Optional[QueryFilters] = None,
+        trace: Optional[RequestTrace] = None
+    ) -> Tuple[List[DocumentChunk], Optional[List[float]]]:
+        """Run the similarity search and convert the hits to DocumentChunks.
+
+        Also returns the query embedding, or None when the search was skipped.
+        With a reranker, RERANK_CANDIDATES chunks are retrieved and the best
+        max_chunks of them by reranker score are kept.
+        """
+        return (await self._retrieve_chunks_batch(store, [query], max_chunks, filters, trace))[0]
+
+    async def _retrieve_chunks_batch(
+        self,
+        store: TenantStore,
+        queries: List[str],
+        max_chunks: int,
+        filters: Optional[QueryFilters] = None,
+        trace: Optional[RequestTrace] = None
+    ) -> List[Tuple[List[DocumentChunk], Optional[List[float]]]]:
+        """_retrieve_chunks for several queries, searched together"""
+        trace = trace or RequestTrace()
+        n_results = max(max_chunks, settings.RERANK_CANDIDATES) if self.reranker else max_chunks
+        # Perform similarity search
+        searches = await self._similarity_search_batch(store, queries, n_results, filters, trace)
+        retrieved = [(_to_chunks(search_results), query_embedding) for search_results, query_embedding in searches]
+
+        if self.reranker and any(chunks for chunks, _ in retrieved):
+            async def rerank(query: str, chunks: List[DocumentChunk]) -> List[DocumentChunk]:
+                if not chunks:
+                    return chunks
+                return await run_blocking(self.reranker.rerank, query, chunks, max_chunks)
+
+            with trace.stage("rerank"):
+                reranked = await asyncio.gather(*(
+                    rerank(query, chunks) for query, (chunks, _) in zip(queries, retrieved)
+                ))
+            retrieved = [(chunks, query_embedding) for chunks, (_, query_embedding) in zip(reranked, retrieved)]
+        return retrieved
+
+    async def _similarity_search(
+        self,
+        store: TenantStore,
+        query: str,
+        n_results: int,
+        filters: Optional[QueryFilters] = None,
+        trace: Optional[RequestTrace] = None
+    ) -> Tuple[Dict[str, Any], Optional[List[float]]]:
+        """Embed the query on the async path and search the vector database off the event loop.
 
-    def list_documents(self) -> List[Document]:
-        """List all uploaded documents"""
-        return list(self.documents_metadata.values())
+        Filters are resolved to the matching documents through the catalog and
+        pushed down into the vector search (see VectorDatabase.filtered_search).
+        """
+        return (await self._similarity_search_batch(store, [query], n_results, filters, trace))[0]
 
-    def delete_document(self, document_id: str) -> bool:
+    async def _similarity_search_batch(
+        self,
+        store: TenantStore,
+        queries: List[str],
+        n_results: int,
+        filters: Optional[QueryFilters] = None,
+        trace: Optional[RequestTrace] = None
+    ) -> List[Tuple[Dict[str, Any], Optional[List[float]]]]:
+        """_similarity_search for several queries: one (results, query embedding) per query.
+
+        The queries are embedded in one call and, without filters, searched
+        with one multi-query Chroma call. Lexical search and fusion run per
+        query.
+        """
+        trace = trace or RequestTrace()
+        # The catalog's chunk total is much cheaper than counting the collection
+        total_chunks = await run_blocking(store.catalog.total_chunks)
+        if total_chunks == 0:
+            # Nothing to search, so skip embedding the queries
+            return [({"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}, None) for _ in queries]
+
+        filtered = not is_empty(filters)
+        documents = await run_blocking(store.catalog.find_documents, filters) if filtered else None
+
+        async def embed_queries() -> List[List[float]]:
+            with trace.stage("embed_query"):
+                return await embedding_provider.aembed(queries)
+
+        def search(query_embeddings: List[List[float]], n: int) -> List[Dict[str, Any]]:
+            if filtered:
+                # Each filtered search picks its own strategy, so they run one by one
+                return [
+                    store.vector_db.filtered_search(query_embedding, n, filters, documents, total_chunks)
+                    for query_embedding in query_embeddings
+                ]
+            return store.vector_db.batch_similarity_search(query_embeddings, n)
+
+        async def dense_search(query_embeddings: List[List[float]], n: int) -> List[Dict[str, Any]]:
+            with trace.stage("search"):
+                return await run_blocking(search, query_embeddings, n)
+
+        async def lexical_search(n: int) -> List[List[Tuple[str, float]]]:
+            with trace.stage("lexical_search"):
+                return await run_blocking(
+                    lambda: [store.vector_db.lexical_search(query, n) for query in queries]
+                )
+
+        if store.vector_db.lexical_index is None:
+            query_embeddings = await embed_queries()
+            return list(zip(await dense_search(query_embeddings, n_results), query_embeddings))
+
+        # Hybrid: the lexical search runs while the queries are being embedded.
+        # The lexical index has no metadata, so with filters it over-fetches
+        # and non-matching hits are dropped before fusion
+        candidates = max(n_results, settings.HYBRID_CANDIDATES)
+        lexical_candidates = candidates * LEXICAL_FILTER_OVERFETCH if filtered else candidates
+        query_embeddings, lexical_hits = await asyncio.gather(embed_queries(), lexical_search(lexical_candidates))
+        dense = await dense_search(query_embeddings, candidates)
+        with trace.stage("fuse"):
+            fused = await asyncio.gather(*(
+                self._fuse_results(store, dense_results, hits, n_results, filters)
+                for dense_results, hits in zip(dense, lexical_hits)
+            ))
+        return list(zip(fused, query_embeddings))
+
+    async def _fuse_results(
+        self,
+        store: TenantStore,
+        dense: Dict[str, Any],
+        lexical_hits: List[Tuple[str, float]],
+        n_results: int,
+        filters: Optional[QueryFilters] = None
+    ) -> Dict[str, Any]:
+        """Reciprocal-rank fusion of dense and lexical hits, in Chroma's result layout"""
+        dense_ids = dense["ids"][0]
+        chunks = {
+            chunk_id: (document, metadata, distance)
+            for chunk_id, document, metadata, distance in zip(
+                dense_ids, dense["documents"][0], dense["metadatas"][0], dense["distances"][0]
+            )
+        }
+        lexical_ids = [chunk_id for chunk_id, _ in lexical_hits]
+
+        async def fetch(ids: List[str]):
+            # Lexical-only hits have no distance
+            fetched = await run_blocking(store.vector_db.get_chunks, ids)
+            for chunk_id, document, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+                if matches(filters, metadata):
+                    chunks[chunk_id] = (document, metadata, None)
+
+        if not is_empty(filters):
+            # Dense hits already passed the filters; check the others before fusing
+            await fetch([chunk_id for chunk_id in lexical_ids if chunk_id not in chunks])
+            lexical_ids = [chunk_id for chunk_id in lexical_ids if chunk_id in chunks][:max(n_results, settings.HYBRID_CANDIDATES)]
+
+        fused_ids = reciprocal_rank_fusion(
+            [dense_ids, lexical_ids],
+            [settings.HYBRID_DENSE_WEIGHT, settings.HYBRID_LEXICAL_WEIGHT],
+            settings.HYBRID_RRF_K
+        )[:n_results]
+
+        missing = [chunk_id for chunk_id in fused_ids if chunk_id not in chunks]
+        if missing:
+            await fetch(missing)
+
+        fused_ids = [chunk_id for chunk_id in fused_ids if chunk_id in chunks]
+        return {
+            "ids": [fused_ids],
+            "documents": [[chunks[chunk_id][0] for chunk_id in fused_ids]],
+            "metadatas": [[chunks[chunk_id][1] for chunk_id in fused_ids]],
+            "distances": [[chunks[chunk_id][2] for chunk_id in fused_ids]],
+        }
+
+    async def list_documents(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        file_type: Optional[str] = None,
+        uploaded_after: Optional[datetime] = None,
+        uploaded_before: Optional[datetime] = None
+    ) -> Tuple[List[Document], int]:
+        """List a page of uploaded documents and the total number matching the filters"""
+        async with self.tenants.use() as store:
+            return await run_blocking(
+                store.catalog.list, limit, offset, file_type, uploaded_after, uploaded_before
+            )
+
+    async def get_document(self, document_id: str) -> Optional[Document]:
+        """Catalog entry of a document, or None if it does not exist"""
+        async with self.tenants.use() as store:
+            return await run_blocking(store.catalog.get, document_id)
+
+    def load_default_tenant(self):
+        """Open the default tenant at startup rather than on the first request"""
+        self.tenants.release(self.tenants.acquire(DEFAULT_TENANT))
+
+    async def delete_document(self, document_id: str) -> bool:
         """Delete a document from the knowledge base"""
         try:
-            # Delete from vector database
-            success = vector_db.delete_documents(document_id)
-            
-            # Remove from metadata
-            if document_id in self.documents_metadata:
-                del self.documents_metadata[document_id]
+            async with self.tenants.use() as store, self._document_lock(document_id):
+                # Delete from vector database
+                success = await run_blocking(store.vector_db.delete_documents, document_id)
+                
+                # Remove from catalog
+                await run_blocking(store.catalog.delete, document_id)
+                self._invalidate_answers(store, document_id)
             
             logger.info(f"Deleted document: {document_id}")
             return success
@@ -145,16 +837,78 @@ class RAGService:
             logger.error(f"Error deleting document: {str(e)}")
             return False
 
-    def get_document_stats(self) -> Dict[str, Any]:
-        """Get knowledge base statistics"""
-        total_documents = len(self.documents_metadata)
-        total_chunks = vector_db.get_document_count()
-        
-        return {
-            "total_documents": total_documents,
-            "total_chunks": total_chunks,
-            "document_types": list(set([doc.file_type for doc in self.documents_metadata.values()]))
-        }
+    async def get_document_stats(self) -> Dict[str, Any]:
+        """Get knowledge base statistics of the current tenant, and memory use of all loaded tenants"""
+        async with self.tenants.use() as store:
+            stats = await run_blocking(store.catalog.get_stats)
+            stats["tenant"] = store.tenant_id
+            stats["total_chunks"] = await run_blocking(store.vector_db.get_document_count)
+            if isinstance(embedding_provider, CachedEmbeddingProvider):
+                stats["embedding_cache"] = embedding_provider.cache.get_stats()
+            if store.answer_cache is not None:
+                stats["answer_cache"] = store.answer_cache.get_stats()
+            if store.vector_db.lexical_index is not None:
+                stats["lexical_index"] = await run_blocking(store.vector_db.lexical_index.get_stats)
+            if self.reranker is not None:
+                stats["reranker"] = self.reranker.get_stats()
+            stats["tenants"] = await run_blocking(self.tenants.get_stats)
+            return stats
+
+def _to_chunks(search_results: Dict[str, Any]) -> List[DocumentChunk]:
+    """DocumentChunks of a search result in Chroma's layout"""
+    retrieved_chunks = []
+    if search_results["documents"] and search_results["documents"][0]:
+        for i, (doc_id, content, metadata, distance) in enumerate(zip(
+            search_results["ids"][0],
+            search_results["documents"][0],
+            search_results["metadatas"][0],
+            search_results["distances"][0]
+        )):
+            retrieved_chunks.append(DocumentChunk(
+                id=doc_id,
+                document_id=metadata.get("document_id", "unknown"),
+                content=content,
+                metadata=metadata,
+                chunk_index=metadata.get("chunk_index", i),
+                distance=distance
+            ))
+    return retrieved_chunks
+
+def _next_batch(
+    stream: Iterator[Tuple[str, str, Dict[str, Any]]],
+    timings: Dict[str, float]
+) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """The next INGEST_BATCH_CHUNKS chunks of a document stream, empty at the end;
+    the time taken is added to timings["read"]"""
+    started = time.perf_counter()
+    batch = list(islice(stream, settings.INGEST_BATCH_CHUNKS))
+    timings["read"] += time.perf_counter() - started
+    return batch
+
+def _sync_catalog(catalog: DocumentCatalog, vector_db: VectorDatabase):
+    """Validate a catalog against its vector database, rebuilding it if they disagree.
+
+    Validation compares chunk totals; a rebuild reads one summary chunk per
+    document in a single bulk pass rather than every chunk.
+    """
+    vector_chunks = vector_db.get_document_count()
+    if catalog.get_stats()["total_chunks"] == vector_chunks:
+        return
+
+    documents = []
+    for metadata in vector_db.get_document_summaries():
+        documents.append(Document(
+            id=metadata["document_id"],
+            filename=metadata.get("filename", "unknown"),
+            original_filename=metadata.get("filename", "unknown"),
+            file_type=metadata.get("file_type", "unknown"),
+            upload_date=datetime.fromisoformat(metadata["upload_date"]) if "upload_date" in metadata else datetime.now(),
+            chunk_count=metadata.get("chunk_count", 0),
+            size_bytes=metadata.get("size_bytes", 0),
+            content_hash=metadata.get("content_hash")
+        ))
+    catalog.replace_all(documents)
+    logger.info(f"Rebuilt document catalog: {len(documents)} documents, {vector_chunks} chunks")
 
 # Global instance
 rag_service = RAGService()
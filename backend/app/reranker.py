@@ -0,0 +1,181 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+import logging
+
+import numpy as np
+
+from app.config import settings
+from app.answer_cache import normalize_query
+from app.models import DocumentChunk
+
+logger = logging.getLogger(__name__)
+
+class Reranker:
+    """Base class for rerankers that rescore retrieved chunks with a local CPU model.
+
+    rerank() scores every candidate not already in the score cache in one
+    batched forward pass and keeps the best top_k. Scores are cached by
+    normalized query and chunk ID; chunk IDs are derived from chunk content,
+    so a cached score never outlives the text it was computed for.
+
+    Stats weigh the latency the stage adds against the prompt tokens it
+    saves, i.e. the tokens of the candidates it dropped, which would
+    otherwise have to be sent to get the same recall.
+    """
+    name = "base"
+
+    def __init__(self, cache_max_entries: int = None):
+        self.cache_max_entries = cache_max_entries or settings.RERANK_CACHE_MAX_ENTRIES
+        self._cache: Dict[Tuple[str, str], float] = OrderedDict()
+        # rerank() runs on the blocking worker threads
+        self._lock = threading.Lock()
+
+        self.queries = 0
+        self.candidates = 0
+        self.cache_hits = 0
+        self.total_seconds = 0.0
+        self.tokens_saved = 0
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        """Relevance of each text to the query, higher is better"""
+        raise NotImplementedError
+
+    def rerank(self, query: str, chunks: List[DocumentChunk], top_k: int) -> List[DocumentChunk]:
+        """The top_k chunks by model score, with the score in their metadata"""
+        started = time.perf_counter()
+        normalized = normalize_query(query)
+
+        scores: Dict[str, float] = {}
+        with self._lock:
+            for chunk in chunks:
+                score = self._cache.get((normalized, chunk.id))
+                if score is not None:
+                    self._cache.move_to_end((normalized, chunk.id))
+                    scores[chunk.id] = score
+        missing = [chunk for chunk in chunks if chunk.id not in scores]
+        if missing:
+            computed = self.score(query, [chunk.content for chunk in missing])
+            with self._lock:
+                for chunk, score in zip(missing, computed):
+                    scores[chunk.id] = float(score)
+                    self._cache[(normalized, chunk.id)] = float(score)
+                while len(self._cache) > self.cache_max_entries:
+                    self._cache.popitem(last=False)
+
+        ranked = sorted(chunks, key=lambda chunk: scores[chunk.id], reverse=True)
+        kept = [
+            chunk.model_copy(update={"metadata": {**chunk.metadata, "rerank_score": scores[chunk.id]}})
+            for chunk in ranked[:top_k]
+        ]
+        tokens_saved = sum(chunk.metadata.get("token_count", 0) for chunk in ranked[top_k:])
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.queries += 1
+            self.candidates += len(chunks)
+            self.cache_hits += len(chunks) - len(missing)
+            self.total_seconds += elapsed
+            self.tokens_saved += tokens_saved
+        logger.debug(
+            f"Reranked {len(chunks)} candidates ({len(missing)} scored) in {elapsed * 1000:.1f} ms, "
+            f"saving {tokens_saved} prompt tokens"
+        )
+        return kept
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queries = self.queries or 1
+            return {
+                "model": self.name,
+                "queries": self.queries,
+                "candidates_scored": self.candidates - self.cache_hits,
+                "cache_hits": self.cache_hits,
+                "cache_entries": len(self._cache),
+                "mean_latency_ms": round(self.total_seconds / queries * 1000, 3),
+                "prompt_tokens_saved": self.tokens_saved,
+                "mean_prompt_tokens_saved": round(self.tokens_saved / queries, 1),
+                "ms_per_1k_tokens_saved": (
+                    round(self.total_seconds * 1000 / (self.tokens_saved / 1000), 3) if self.tokens_saved else None
+                ),
+            }
+
+class CrossEncoderReranker(Reranker):
+    """Cross-encoder exported to ONNX (e.g. cross-encoder/ms-marco-MiniLM-L-6-v2), run on CPU.
+
+    model_path is a directory holding model.onnx and its tokenizer.json.
+    """
+    name = "cross-encoder"
+
+    def __init__(self, model_path: str = None, max_length: int = None, cache_max_entries: int = None):
+        super().__init__(cache_max_entries)
+        self.model_path = model_path or settings.RERANKER_MODEL_PATH
+        self.max_length = max_length or settings.RERANKER_MAX_LENGTH
+        for filename in ("model.onnx", "tokenizer.json"):
+            if not os.path.exists(os.path.join(self.model_path, filename)):
+                raise ValueError(f"Cross-encoder reranker needs {filename} in {self.model_path}")
+        self._session = None
+        self._tokenizer = None
+
+    def _load(self):
+        # Imported lazily, like the local embedding model
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        tokenizer = Tokenizer.from_file(os.path.join(self.model_path, "tokenizer.json"))
+        tokenizer.enable_truncation(max_length=self.max_length)
+        tokenizer.enable_padding()
+        self._session = onnxruntime.InferenceSession(
+            os.path.join(self.model_path, "model.onnx"), providers=["CPUExecutionProvider"]
+        )
+        self._tokenizer = tokenizer
+        logger.info(f"Loaded cross-encoder reranker from {self.model_path}")
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        if self._session is None:
+            self._load()
+        encodings = self._tokenizer.encode_batch([(query, text) for text in texts])
+        features = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        inputs = {item.name: features[item.name] for item in self._session.get_inputs()}
+        logits = self._session.run(None, inputs)[0]
+        # Single-logit models score relevance directly; two-logit ones use the "relevant" class
+        return logits[:, -1].tolist()
+
+class EmbeddingReranker(Reranker):
+    """Cosine similarity from the ONNX all-MiniLM-L6-v2 model bundled with Chroma.
+
+    Weaker than a cross-encoder but needs no extra model files. Useful when
+    documents are embedded with another model, or to order lexical-only
+    hits from hybrid search, which carry no vector distance.
+    """
+    name = "embedding"
+
+    def __init__(self, cache_max_entries: int = None):
+        super().__init__(cache_max_entries)
+        self._model = None
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        if self._model is None:
+            from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+            self._model = ONNXMiniLM_L6_V2()
+        vectors = np.array(self._model([query] + texts), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return (vectors[1:] @ vectors[0]).tolist()
+
+def create_reranker(kind: str = None) -> Optional[Reranker]:
+    """Create the reranker selected by RERANKER, or None when reranking is off"""
+    kind = settings.RERANKER if kind is None else kind
+    if not kind:
+        return None
+    elif kind == "cross-encoder":
+        return CrossEncoderReranker()
+    elif kind == "embedding":
+        return EmbeddingReranker()
+    else:
+        raise ValueError(f"Unsupported reranker: {kind}")
@@ -1,11 +1,18 @@
 import os
-import shutil
-from typing import List
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from fastapi.responses import JSONResponse
+import json
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
-from app.models import QueryRequest, QueryResponse, DocumentListResponse, UploadResponse
+from app.models import (
+    QueryRequest, QueryResponse, BatchQueryRequest, BatchQueryResponse, DocumentListResponse, IngestionJob
+)
 from app.rag_service import rag_service
+from app.ingestion_jobs import ingestion_jobs
+from app.upload_spool import spool_upload
+from app.document_processor import SUPPORTED_FILE_TYPES
+from app.metrics import metrics
 from app.config import settings
 import logging
 
@@ -16,38 +23,53 @@ router = APIRouter()
 # Ensure upload directory exists
 os.makedirs(settings.UPLOAD_DIRECTORY, exist_ok=True)
 
-@router.post("/upload", response_model=UploadResponse)
-async def upload_document(file: UploadFile = File(...)):
-    """Upload and process a document"""
+ALLOWED_EXTENSIONS = list(SUPPORTED_FILE_TYPES)
+
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"]
+                }
+            }
+        }
+    }
+}
+
+@router.post("/upload", response_model=IngestionJob, status_code=202, openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_document(request: Request):
+    """Upload a document and queue it for processing.
+
+    The file is streamed to disk and an ingestion job is returned right away;
+    poll /jobs/{job_id} for its progress.
+    """
     try:
-        # Validate file type
-        allowed_extensions = ['pdf', 'txt', 'md', 'docx']
-        file_extension = file.filename.split('.')[-1].lower()
-        
-        if file_extension not in allowed_extensions:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"File type '{file_extension}' not supported. Allowed types: {allowed_extensions}"
-            )
-        
-        # Save uploaded file
-        file_path = os.path.join(settings.UPLOAD_DIRECTORY, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Process document
-        result = await rag_service.upload_document(file_path, file.filename)
-        
-        # Clean up temporary file
-        os.remove(file_path)
-        
-        return result
+        upload = await spool_upload(request, settings.UPLOAD_DIRECTORY, ALLOWED_EXTENSIONS)
+        return await ingestion_jobs.submit(upload)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error uploading file: {str(e)}")
-        # Clean up file if it exists
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs/{job_id}", response_model=IngestionJob)
+async def get_job(job_id: str):
+    """Get the stage and progress of an ingestion job"""
+    try:
+        job = await ingestion_jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting job: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/query", response_model=QueryResponse)
@@ -59,32 +81,125 @@ async def query_documents(request: QueryRequest):
         
         result = await rag_service.query_knowledge_base(
             query=request.query,
-            max_chunks=request.max_chunks
+            max_chunks=request.max_chunks,
+            filters=request.filters,
+            include_timings=request.include_timings,
+            retrieval_only=request.retrieval_only
         )
         return result
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/query/batch", response_model=BatchQueryResponse)
+async def query_documents_batch(request: BatchQueryRequest):
+    """Answer several queries at once.
+
+    Results are in the order of the queries; a query that fails has an error
+    instead of a response, and the others are still answered.
+    """
+    try:
+        if not request.queries:
+            raise HTTPException(status_code=400, detail="Queries cannot be empty")
+        if len(request.queries) > settings.BATCH_QUERY_MAX_QUERIES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {settings.BATCH_QUERY_MAX_QUERIES} queries per batch"
+            )
+
+        return await rag_service.query_knowledge_base_batch(
+            queries=request.queries,
+            max_chunks=request.max_chunks,
+            filters=request.filters,
+            include_timings=request.include_timings,
+            retrieval_only=request.retrieval_only
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing batch query: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/query/stream")
+async def query_documents_stream(request: QueryRequest):
+    """Query the knowledge base, streaming sources and answer tokens as Server-Sent Events"""
+    if not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    if request.retrieval_only:
+        raise HTTPException(status_code=400, detail="Retrieval-only queries are not streamed; use /api/query")
+
+    async def event_stream():
+        try:
+            async for event in rag_service.stream_query_knowledge_base(
+                query=request.query,
+                max_chunks=request.max_chunks,
+                filters=request.filters,
+                include_timings=request.include_timings
+            ):
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+        except Exception as e:
+            # Headers are already sent, so errors are reported in-band
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/documents", response_model=DocumentListResponse)
-async def list_documents():
-    """List all uploaded documents"""
+async def list_documents(
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    file_type: Optional[str] = None,
+    uploaded_after: Optional[datetime] = None,
+    uploaded_before: Optional[datetime] = None
+):
+    """List uploaded documents, newest first, with pagination and filters"""
     try:
-        documents = rag_service.list_documents()
+        documents, total_count = await rag_service.list_documents(
+            limit=limit,
+            offset=offset,
+            file_type=file_type,
+            uploaded_after=uploaded_after,
+            uploaded_before=uploaded_before
+        )
         return DocumentListResponse(
             documents=documents,
-            total_count=len(documents)
+            total_count=total_count
         )
     except Exception as e:
         logger.error(f"Error listing documents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.put("/documents/{document_id}", response_model=IngestionJob, status_code=202, openapi_extra=UPLOAD_REQUEST_BODY)
+async def replace_document(document_id: str, request: Request):
+    """Replace a document's content, keeping its ID.
+
+    Only chunks whose content changed are re-embedded; poll /jobs/{job_id}
+    for progress.
+    """
+    try:
+        if await rag_service.get_document(document_id) is None:
+            raise HTTPException(status_code=404, detail="Document not found")
+        upload = await spool_upload(request, settings.UPLOAD_DIRECTORY, ALLOWED_EXTENSIONS)
+        return await ingestion_jobs.submit(upload, document_id=document_id)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error replacing document: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.delete("/documents/{document_id}")
 async def delete_document(document_id: str):
     """Delete a document from the knowledge base"""
     try:
-        success = rag_service.delete_document(document_id)
+        success = await rag_service.delete_document(document_id)
         if success:
             return JSONResponse(
                 status_code=200,
@@ -93,6 +208,8 @@ async def delete_document(document_id: str):
         else:
             raise HTTPException(status_code=404, detail="Document not found")
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error deleting document: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -101,12 +218,17 @@ async def delete_document(document_id: str):
 async def get_stats():
     """Get knowledge base statistics"""
     try:
-        stats = rag_service.get_document_stats()
+        stats = await rag_service.get_document_stats()
         return JSONResponse(content=stats)
     except Exception as e:
         logger.error(f"Error getting stats: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Stage latency histograms of uploads and queries in the Prometheus text format"""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint"""
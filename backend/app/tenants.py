@@ -0,0 +1,209 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+import logging
+
+from app.answer_cache import AnswerCache
+from app.concurrency import run_blocking
+from app.config import settings
+from app.document_catalog import DocumentCatalog
+from app.vector_db import VectorDatabase
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = "default"
+TENANT_HEADER = "X-Tenant-ID"
+# Tenant IDs name directories, so they are kept to a safe alphabet
+TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,47}$")
+
+# Tenant of the request being handled; set by the HTTP middleware and by
+# ingestion workers from the job
+current_tenant: ContextVar[str] = ContextVar("current_tenant", default=DEFAULT_TENANT)
+
+def validate_tenant_id(tenant_id: str) -> str:
+    """Return tenant_id if it is a valid tenant ID, else raise ValueError"""
+    if not TENANT_ID_PATTERN.match(tenant_id):
+        raise ValueError(
+            f"Invalid tenant ID '{tenant_id}': use 1-48 letters, digits, '-' or '_', "
+            f"starting with a letter or digit"
+        )
+    return tenant_id
+
+class TenantStore:
+    """The vector database, catalog and answer cache of one tenant"""
+
+    def __init__(
+        self,
+        tenant_id: str,
+        vector_db: VectorDatabase,
+        catalog: DocumentCatalog,
+        answer_cache: Optional[AnswerCache] = None,
+        owned: bool = True
+    ):
+        self.tenant_id = tenant_id
+        self.vector_db = vector_db
+        self.catalog = catalog
+        self.answer_cache = answer_cache
+        # Stores built from the process-wide instances are not closed on eviction
+        self.owned = owned
+        self.load_seconds = 0.0
+        self.loaded_at = time.time()
+        self.last_used = time.time()
+        # Requests currently using the store; it is only evicted at zero
+        self.users = 0
+
+    def resident_bytes(self) -> int:
+        # The answer cache is bounded by entries and small next to the indexes
+        return self.vector_db.memory_bytes()
+
+    def close(self):
+        if self.owned:
+            self.vector_db.close()
+
+class TenantManager:
+    """Opens tenant stores on first use and evicts idle ones under a memory budget.
+
+    Each tenant has its own Chroma directory, and so its own HNSW index that
+    Chroma loads into memory on first search. Loaded stores are kept in
+    least-recently-used order; after a load pushes the estimated resident
+    memory of all stores over the budget, the least recently used stores no
+    request is using are closed until it fits again. Pinned tenants are
+    never evicted.
+    """
+
+    def __init__(
+        self,
+        open_store: Callable[[str], TenantStore],
+        memory_budget_bytes: int = None,
+        pinned: Tuple[str, ...] = (DEFAULT_TENANT,)
+    ):
+        self.open_store = open_store
+        self.memory_budget_bytes = memory_budget_bytes or settings.TENANT_MEMORY_BUDGET_BYTES
+        self.pinned = set(pinned)
+        self._stores: "OrderedDict[str, TenantStore]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Serialize loading each tenant, so concurrent first requests open it once
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._loads = 0
+        self._evictions = 0
+
+    @asynccontextmanager
+    async def use(self, tenant_id: str = None) -> AsyncIterator[TenantStore]:
+        """Hold the store of tenant_id (the current tenant by default) for the duration"""
+        tenant_id = tenant_id or current_tenant.get()
+        with self._lock:
+            store = self._checkout(tenant_id)
+        if store is None:
+            store = await run_blocking(self.acquire, tenant_id)
+        try:
+            yield store
+        finally:
+            self.release(store)
+
+    def acquire(self, tenant_id: str) -> TenantStore:
+        """The store of tenant_id, opened if it is not loaded; pair with release"""
+        with self._lock:
+            store = self._checkout(tenant_id)
+            if store is not None:
+                return store
+            load_lock = self._load_locks.setdefault(tenant_id, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                store = self._checkout(tenant_id)
+                if store is not None:
+                    return store
+
+            started = time.perf_counter()
+            store = self.open_store(tenant_id)
+            store.load_seconds = time.perf_counter() - started
+            logger.info(f"Loaded tenant {tenant_id} in {store.load_seconds * 1000:.0f} ms")
+            with self._lock:
+                store.users += 1
+                self._stores[tenant_id] = store
+                self._loads += 1
+        self.enforce_budget()
+        return store
+
+    def release(self, store: TenantStore):
+        with self._lock:
+            store.users -= 1
+            store.last_used = time.time()
+
+    def _checkout(self, tenant_id: str) -> Optional[TenantStore]:
+        # Called with the lock held
+        store = self._stores.get(tenant_id)
+        if store is not None:
+            store.users += 1
+            store.last_used = time.time()
+            self._stores.move_to_end(tenant_id)
+        return store
+
+    def enforce_budget(self):
+        """Close least recently used idle stores until the loaded ones fit the memory budget.
+
+        Runs after every load and after ingestion, the two ways resident memory grows.
+        """
+        with self._lock:
+            evicted = self._select_evictions()
+        for victim in evicted:
+            victim.close()
+            logger.info(f"Evicted tenant {victim.tenant_id} (idle {time.time() - victim.last_used:.0f}s)")
+
+    def _select_evictions(self):
+        # Called with the lock held
+        resident = {tenant_id: store.resident_bytes() for tenant_id, store in self._stores.items()}
+        total = sum(resident.values())
+        evicted = []
+        for tenant_id, store in list(self._stores.items()):
+            if total <= self.memory_budget_bytes:
+                break
+            if tenant_id in self.pinned or store.users > 0:
+                continue
+            del self._stores[tenant_id]
+            total -= resident[tenant_id]
+            self._evictions += 1
+            evicted.append(store)
+        if total > self.memory_budget_bytes:
+            logger.warning(
+                f"Loaded tenants use an estimated {total / 2**20:.0f} MiB, over the "
+                f"{self.memory_budget_bytes / 2**20:.0f} MiB budget; the rest are pinned or in use"
+            )
+        return evicted
+
+    def loaded_tenants(self):
+        with self._lock:
+            return list(self._stores)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stores = list(self._stores.values())
+            stats = {
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "loads": self._loads,
+                "evictions": self._evictions,
+            }
+        tenants = {
+            store.tenant_id: {
+                "resident_bytes": store.resident_bytes(),
+                "load_seconds": round(store.load_seconds, 4),
+                "loaded_at": store.loaded_at,
+                "last_used": store.last_used,
+                "active_requests": store.users,
+            }
+            for store in stores
+        }
+        stats["resident_bytes"] = sum(tenant["resident_bytes"] for tenant in tenants.values())
+        stats["loaded"] = tenants
+        return stats
+
+    def close_all(self):
+        with self._lock:
+            stores = list(self._stores.values())
+            self._stores.clear()
+        for store in stores:
+            store.close()
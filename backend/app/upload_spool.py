@@ -0,0 +1,143 @@
+import os
+import uuid
+import hashlib
+from typing import List, NamedTuple, Optional
+import logging
+
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+
+from app.concurrency import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Upload bytes are handed to the writer thread in blocks of this size
+SPOOL_WRITE_BYTES = 1024 * 1024
+
+class SpooledUpload(NamedTuple):
+    upload_id: str
+    filename: str
+    file_type: str
+    path: str
+    size_bytes: int
+    content_hash: str
+
+class _SpoolWriter:
+    """Appends to a spool file, hashing the bytes as they are written"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "wb")
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        self.digest.update(data)
+        self.size += len(data)
+
+    def close(self):
+        self.file.close()
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+async def spool_upload(
+    request: Request,
+    directory: str,
+    allowed_extensions: List[str],
+    field_name: str = "file"
+) -> SpooledUpload:
+    """Stream a multipart upload's file field to a uniquely named spool file.
+
+    The request body is parsed as it arrives, so the file is never held in
+    memory or copied to a temporary file first. The extension is validated
+    as soon as the part headers are read.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+    # Parser callbacks only record events; they are handled between writes
+    events = []
+    header_field = bytearray()
+    header_value = bytearray()
+    headers = {}
+
+    def on_header_end():
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        events.append(("headers", dict(headers)))
+        headers.clear()
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_header_field": lambda data, start, end: header_field.extend(data[start:end]),
+        "on_header_value": lambda data, start, end: header_value.extend(data[start:end]),
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+        "on_part_end": lambda: events.append(("end", None)),
+    })
+
+    upload_id = uuid.uuid4().hex
+    writer: Optional[_SpoolWriter] = None
+    filename = file_type = None
+    in_file = False
+    pending = bytearray()
+
+    try:
+        async for body in request.stream():
+            parser.write(body)
+            for kind, value in events:
+                if kind == "headers":
+                    _, options = parse_options_header(value.get(b"content-disposition", b""))
+                    in_file = (
+                        writer is None
+                        and options.get(b"name") == field_name.encode()
+                        and b"filename" in options
+                    )
+                    if in_file:
+                        filename = os.path.basename(options[b"filename"].decode("utf-8", "replace"))
+                        file_type = filename.split('.')[-1].lower()
+                        if file_type not in allowed_extensions:
+                            raise HTTPException(
+                                status_code=400,
+                                detail=f"File type '{file_type}' not supported. Allowed types: {allowed_extensions}"
+                            )
+                        path = os.path.join(directory, f"{upload_id}.{file_type}")
+                        writer = await run_blocking(_SpoolWriter, path)
+                elif kind == "data" and in_file:
+                    pending.extend(value)
+                    if len(pending) >= SPOOL_WRITE_BYTES:
+                        await run_blocking(writer.write, bytes(pending))
+                        pending.clear()
+                elif kind == "end":
+                    in_file = False
+            events.clear()
+        parser.finalize()
+
+        if writer is None:
+            raise HTTPException(status_code=400, detail=f"No '{field_name}' file in upload")
+        if pending:
+            await run_blocking(writer.write, bytes(pending))
+        await run_blocking(writer.close)
+    except BaseException:
+        # Also runs on cancellation (client disconnect), so no awaiting here
+        if writer is not None:
+            writer.discard()
+        raise
+
+    logger.info(f"Spooled upload {filename} ({writer.size} bytes) to {writer.path}")
+    return SpooledUpload(
+        upload_id=upload_id,
+        filename=filename,
+        file_type=file_type,
+        path=writer.path,
+        size_bytes=writer.size,
+        content_hash=writer.digest.hexdigest()
+    )
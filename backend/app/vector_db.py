@@ -1,36 +1,197 @@
+import os
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime
 import chromadb
+import numpy as np
+from chromadb.api.client import SharedSystemClient
 from chromadb.config import Settings as ChromaSettings
 import uuid
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from app.config import settings
+from app.lexical_index import LexicalIndex
+from app.quantized_vector_db import QuantizedVectorDatabase
+from app.write_coordinator import WriteCoordinator
+from app.models import QueryFilters
+from app.query_filters import build_where
+from app.document_processor import chunk_document_id
+from app.embeddings import (
+    EmbeddingProvider,
+    EmbeddingConfigurationError,
+    LEGACY_EMBEDDING_MODEL,
+    embedding_provider as default_embedding_provider,
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+COLLECTION_NAME = "document_chunks"
+# Subdirectory of the Chroma directory holding the lexical index
+LEXICAL_INDEX_DIRECTORY = "lexical_index"
+LEXICAL_REBUILD_PAGE_SIZE = 5000
+# Broad filters over-fetch from the unfiltered index by this factor over the
+# expected number of hits, up to FILTER_OVERFETCH_MAX_RESULTS results
+FILTER_OVERFETCH_FACTOR = 2
+FILTER_OVERFETCH_MAX_RESULTS = 1000
+# Resident bytes per chunk besides its vector: HNSW links and Chroma's ID maps.
+# Measured at about 180 bytes with the default HNSW parameters
+HNSW_BYTES_PER_CHUNK = 200
+
+class DocumentVectors:
+    """Chunk IDs, texts, metadata and unit-length embeddings of one document"""
+    __slots__ = ("ids", "documents", "metadatas", "embeddings")
+
+    def __init__(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]], embeddings):
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.embeddings = vectors / np.maximum(norms, 1e-12)
+
 class VectorDatabase:
-    def __init__(self):
+    def __init__(
+        self,
+        embedding_provider: EmbeddingProvider = None,
+        persist_directory: str = None,
+        lexical_index: Optional[LexicalIndex] = None
+    ):
+        persist_directory = persist_directory or settings.CHROMA_PERSIST_DIRECTORY
+        self.embedding_provider = embedding_provider or default_embedding_provider
         self.client = chromadb.PersistentClient(
-            path=settings.CHROMA_PERSIST_DIRECTORY,
+            path=persist_directory,
             settings=ChromaSettings(allow_reset=True)
         )
-        self.collection = self.client.get_or_create_collection(
-            name="document_chunks",
-            metadata={"hnsw:space": "cosine"}
+        self.collection = self._open_collection()
+        self._validate_embedding_model()
+        self._backfill_upload_timestamps()
+        # Kept up to date on writes, as counting the collection costs milliseconds
+        self.chunk_count = self.collection.count()
+
+        # Candidate lists of recently searched documents, for document-scoped queries
+        self._document_vectors: "OrderedDict[str, DocumentVectors]" = OrderedDict()
+        self._document_vectors_chunks = 0
+        self._document_vectors_lock = threading.Lock()
+
+        if lexical_index is None and settings.HYBRID_SEARCH_ENABLED:
+            lexical_index = LexicalIndex(os.path.join(persist_directory, LEXICAL_INDEX_DIRECTORY))
+        self.lexical_index = lexical_index
+        if self.lexical_index is not None:
+            self._sync_lexical_index()
+
+    @property
+    def max_batch_size(self) -> int:
+        """Most chunks one add_documents call may store"""
+        return self.client.max_batch_size
+
+    def _open_collection(self):
+        """Open the chunk collection, recording the embedding model when creating it"""
+        try:
+            collection = self.client.get_collection(
+                name=COLLECTION_NAME,
+                embedding_function=self.embedding_provider
+            )
+            if "embedding_model" in (collection.metadata or {}) or collection.count() > 0:
+                return collection
+            # An empty collection from before models were recorded: recreate it
+            # so it carries the embedding model from now on
+            self.client.delete_collection(COLLECTION_NAME)
+        except ValueError:
+            pass
+
+        metadata = {
+            "hnsw:space": "cosine",
+            "embedding_provider": self.embedding_provider.name,
+            "embedding_model": self.embedding_provider.model_name,
+        }
+        if self.embedding_provider.dimension:
+            metadata["embedding_dimension"] = self.embedding_provider.dimension
+        return self.client.create_collection(
+            name=COLLECTION_NAME,
+            metadata=metadata,
+            embedding_function=self.embedding_provider
         )
 
+    def _validate_embedding_model(self):
+        """Fail fast if the stored vectors come from a different embedding model"""
+        metadata = self.collection.metadata or {}
+        stored_model = metadata.get("embedding_model")
+        if stored_model is None:
+            stored_model = LEGACY_EMBEDDING_MODEL
+            logger.warning(
+                f"Collection '{COLLECTION_NAME}' does not record its embedding model; "
+                f"assuming {LEGACY_EMBEDDING_MODEL}"
+            )
+
+        stored_dimension = metadata.get("embedding_dimension")
+        if stored_dimension is None:
+            sample = self.collection.get(limit=1, include=["embeddings"])
+            if sample["embeddings"]:
+                stored_dimension = len(sample["embeddings"][0])
+
+        expected_model = self.embedding_provider.model_name
+        expected_dimension = self.embedding_provider.dimension
+        self.dimension = stored_dimension or expected_dimension or 0
+        if stored_model != expected_model or (
+            stored_dimension and expected_dimension and stored_dimension != expected_dimension
+        ):
+            raise EmbeddingConfigurationError(
+                f"Collection '{COLLECTION_NAME}' was built with {stored_model} "
+                f"({stored_dimension or 'unknown'} dimensions) but the configured embedding model is "
+                f"{expected_model} ({expected_dimension or 'unknown'} dimensions). "
+                f"Re-index the documents or restore the original EMBEDDING_MODEL."
+            )
+
+    def _backfill_upload_timestamps(self):
+        """Add the numeric upload_timestamp used by date filters to chunks stored without it"""
+        for summary in self.get_document_summaries():
+            if "upload_timestamp" in summary or "upload_date" not in summary:
+                continue
+            timestamp = datetime.fromisoformat(summary["upload_date"]).timestamp()
+            ids = list(self.get_document_chunks(summary["document_id"]))
+            self.collection.update(ids=ids, metadatas=[{"upload_timestamp": timestamp}] * len(ids))
+            logger.info(f"Added upload timestamps to {len(ids)} chunks of document {summary['document_id']}")
+
+    def _sync_lexical_index(self):
+        """Rebuild the lexical index from the collection if their chunk counts differ"""
+        count = self.chunk_count
+        if self.lexical_index.live_count == count:
+            return
+        logger.info(f"Rebuilding lexical index from {count} chunks")
+        self.lexical_index.clear()
+        for offset in range(0, count, LEXICAL_REBUILD_PAGE_SIZE):
+            page = self.collection.get(offset=offset, limit=LEXICAL_REBUILD_PAGE_SIZE, include=["documents"])
+            self.lexical_index.add(page["ids"], page["documents"], merge=False)
+        self.lexical_index.save()
+
     def add_documents(
         self, 
         chunks: List[str], 
         metadatas: List[Dict[str, Any]], 
-        ids: List[str]
+        ids: List[str],
+        embeddings: Optional[List[List[float]]] = None
     ) -> bool:
-        """Add document chunks to the vector database"""
+        """Add document chunks to the vector database.
+
+        Embeddings computed by the caller are stored as-is; otherwise the
+        chunks are embedded with the configured embedding provider.
+        """
         try:
+            if embeddings is None:
+                embeddings = self.embedding_provider.embed(chunks)
             self.collection.add(
                 documents=chunks,
+                embeddings=embeddings,
                 metadatas=metadatas,
                 ids=ids
             )
+            self.chunk_count += len(ids)
+            if not self.dimension and len(embeddings):
+                self.dimension = len(embeddings[0])
+            if self.lexical_index is not None:
+                self.lexical_index.add(ids, chunks)
+            self._forget_documents({metadata.get("document_id") for metadata in metadatas})
             logger.info(f"Added {len(chunks)} chunks to vector database")
             return True
         except Exception as e:
@@ -39,14 +200,17 @@ class VectorDatabase:
 
     def similarity_search(
         self, 
-        query: str, 
+        query: str = None, 
         n_results: int = 5,
-        where: Dict[str, Any] = None
+        where: Dict[str, Any] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> Dict[str, Any]:
-        """Perform similarity search"""
+        """Perform similarity search with a query string or a precomputed query vector"""
         try:
+            if query_embedding is None:
+                query_embedding = self.embedding_provider.embed_query(query)
             results = self.collection.query(
-                query_texts=[query],
+                query_embeddings=[query_embedding],
                 n_results=n_results,
                 where=where
             )
@@ -55,6 +219,191 @@ class VectorDatabase:
             logger.error(f"Error in similarity search: {str(e)}")
             return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
 
+    def batch_similarity_search(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 5
+    ) -> List[Dict[str, Any]]:
+        """Search several query vectors in one Chroma query; one result per query, in Chroma's layout"""
+        try:
+            results = self.collection.query(query_embeddings=query_embeddings, n_results=n_results)
+            return [
+                {key: [results[key][i]] for key in ("ids", "documents", "metadatas", "distances")}
+                for i in range(len(query_embeddings))
+            ]
+        except Exception as e:
+            logger.error(f"Error in batch similarity search: {str(e)}")
+            return [
+                {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+                for _ in query_embeddings
+            ]
+
+    def filtered_search(
+        self,
+        query_embedding: List[float],
+        n_results: int,
+        filters: QueryFilters,
+        documents: Dict[str, int],
+        total_chunks: int
+    ) -> Dict[str, Any]:
+        """Vector search restricted to the documents matching filters.
+
+        Every filter is a document attribute, so documents, the matching
+        document IDs and their chunk counts as resolved from the catalog,
+        decide which chunks qualify. total_chunks is the catalog's total, as
+        counting the collection costs milliseconds. Chroma builds a Python record for every
+        chunk a where clause matches, so the clause is the last resort:
+        - few matching chunks: exact search over their cached candidate lists
+        - a large share of the collection: over-fetch chunk IDs from the
+          unfiltered index and keep those of matching documents, which are
+          then the filtered top-k
+        - otherwise: the Chroma where clause
+        """
+        matching = sum(documents.values())
+        if matching == 0:
+            return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+        if matching <= settings.SCOPED_SEARCH_MAX_CHUNKS:
+            return self.scoped_search(list(documents), query_embedding, n_results)
+
+        total = max(total_chunks, matching)
+        fetch = math.ceil(n_results * FILTER_OVERFETCH_FACTOR * total / matching)
+        while fetch <= FILTER_OVERFETCH_MAX_RESULTS:
+            results = self.collection.query(
+                query_embeddings=[query_embedding], n_results=min(fetch, total), include=["distances"]
+            )
+            keep = [
+                (chunk_id, distance)
+                for chunk_id, distance in zip(results["ids"][0], results["distances"][0])
+                if chunk_document_id(chunk_id) in documents
+            ][:n_results]
+            if len(keep) == n_results or fetch >= total:
+                return self._with_chunks(keep)
+            fetch *= 2
+
+        return self.similarity_search(query_embedding=query_embedding, n_results=n_results, where=build_where(filters))
+
+    def _with_chunks(self, hits: List[Tuple[str, float]]) -> Dict[str, Any]:
+        """Chroma query results for (chunk_id, distance) hits, with texts and metadata fetched by ID"""
+        fetched = self.get_chunks([chunk_id for chunk_id, _ in hits])
+        chunks = {
+            chunk_id: (document, metadata)
+            for chunk_id, document, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"])
+        }
+        hits = [(chunk_id, distance) for chunk_id, distance in hits if chunk_id in chunks]
+        return {
+            "ids": [[chunk_id for chunk_id, _ in hits]],
+            "documents": [[chunks[chunk_id][0] for chunk_id, _ in hits]],
+            "metadatas": [[chunks[chunk_id][1] for chunk_id, _ in hits]],
+            "distances": [[distance for _, distance in hits]],
+        }
+
+    def scoped_search(
+        self,
+        document_ids: List[str],
+        query_embedding: List[float],
+        n_results: int = 5
+    ) -> Dict[str, Any]:
+        """Exact search over the chunks of a few documents.
+
+        Each document's chunks and embeddings are loaded once and kept in a
+        bounded cache, so repeated queries scoped to a document compare the
+        query against its candidate list directly instead of walking the
+        HNSW graph with a restrictive filter. Results are in Chroma's layout
+        with cosine distances.
+        """
+        candidates = [self._load_document_vectors(document_id) for document_id in document_ids]
+        candidates = [candidate for candidate in candidates if candidate.ids]
+        if not candidates:
+            return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        distances = 1.0 - np.concatenate([candidate.embeddings for candidate in candidates]) @ query
+        count = min(n_results, len(distances))
+        top = np.argpartition(distances, count - 1)[:count] if count < len(distances) else np.arange(len(distances))
+        top = top[np.argsort(distances[top], kind="stable")]
+
+        # Map positions in the concatenated matrix back to (candidate, row)
+        offsets = np.cumsum([0] + [len(candidate.ids) for candidate in candidates])
+        owners = np.searchsorted(offsets, top, side="right") - 1
+        rows = [(candidates[owner], int(position - offsets[owner])) for owner, position in zip(owners, top)]
+        return {
+            "ids": [[candidate.ids[row] for candidate, row in rows]],
+            "documents": [[candidate.documents[row] for candidate, row in rows]],
+            "metadatas": [[candidate.metadatas[row] for candidate, row in rows]],
+            "distances": [distances[top].tolist()],
+        }
+
+    def _load_document_vectors(self, document_id: str) -> DocumentVectors:
+        with self._document_vectors_lock:
+            cached = self._document_vectors.get(document_id)
+            if cached is not None:
+                self._document_vectors.move_to_end(document_id)
+                return cached
+
+        results = self.collection.get(
+            where={"document_id": document_id}, include=["documents", "metadatas", "embeddings"]
+        )
+        loaded = DocumentVectors(results["ids"], results["documents"], results["metadatas"], results["embeddings"])
+        with self._document_vectors_lock:
+            if document_id not in self._document_vectors:
+                self._document_vectors[document_id] = loaded
+                self._document_vectors_chunks += len(loaded.ids)
+            while self._document_vectors_chunks > settings.SCOPED_SEARCH_CACHE_CHUNKS and len(self._document_vectors) > 1:
+                _, evicted = self._document_vectors.popitem(last=False)
+                self._document_vectors_chunks -= len(evicted.ids)
+        return loaded
+
+    def _forget_documents(self, document_ids):
+        """Drop cached candidate lists of documents whose chunks changed"""
+        with self._document_vectors_lock:
+            for document_id in document_ids:
+                evicted = self._document_vectors.pop(document_id, None)
+                if evicted is not None:
+                    self._document_vectors_chunks -= len(evicted.ids)
+
+    def lexical_search(self, query: str, n_results: int = 5) -> List[Tuple[str, float]]:
+        """BM25 search of the chunk texts, as (chunk_id, score) best first"""
+        if self.lexical_index is None:
+            return []
+        return self.lexical_index.search(query, n_results)
+
+    def get_chunks(self, ids: List[str]) -> Dict[str, Any]:
+        """Texts and metadata of chunks by ID"""
+        return self.collection.get(ids=ids, include=["documents", "metadatas"])
+
+    def get_document_chunks(self, document_id: str) -> Dict[str, Dict[str, Any]]:
+        """Metadata of every chunk of a document, keyed by chunk ID"""
+        results = self.collection.get(where={"document_id": document_id}, include=["metadatas"])
+        return dict(zip(results["ids"], results["metadatas"]))
+
+    def document_chunk_ids(self, document_ids: List[str]) -> List[str]:
+        """IDs of every chunk of the given documents, in one lookup"""
+        if not document_ids:
+            return []
+        return self.collection.get(where={"document_id": {"$in": list(document_ids)}}, include=[])["ids"]
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """Merge new metadata values into existing chunks without touching their embeddings"""
+        if ids:
+            self.collection.update(ids=ids, metadatas=metadatas)
+            self._forget_documents({metadata.get("document_id") for metadata in metadatas})
+
+    def delete_chunks(self, ids: List[str]):
+        """Delete chunks by ID"""
+        if ids:
+            self.collection.delete(ids=ids)
+            self.chunk_count -= len(ids)
+            if self.lexical_index is not None:
+                self.lexical_index.delete(ids)
+            removed = set(ids)
+            with self._document_vectors_lock:
+                stale = [
+                    document_id for document_id, cached in self._document_vectors.items()
+                    if not removed.isdisjoint(cached.ids)
+                ]
+            self._forget_documents(stale)
+
     def delete_documents(self, document_id: str) -> bool:
         """Delete all chunks for a specific document"""
         try:
@@ -65,6 +414,10 @@ class VectorDatabase:
             
             if results["ids"]:
                 self.collection.delete(ids=results["ids"])
+                self.chunk_count -= len(results["ids"])
+                if self.lexical_index is not None:
+                    self.lexical_index.delete(results["ids"])
+                self._forget_documents([document_id])
                 logger.info(f"Deleted {len(results['ids'])} chunks for document {document_id}")
             
             return True
@@ -80,6 +433,42 @@ class VectorDatabase:
             logger.error(f"Error getting document count: {str(e)}")
             return 0
 
+    def memory_bytes(self) -> int:
+        """Estimated resident memory of the loaded HNSW index, lexical index and candidate cache"""
+        per_chunk = self.dimension * 4 + HNSW_BYTES_PER_CHUNK
+        memory = self.chunk_count * per_chunk
+        if self.lexical_index is not None:
+            memory += self.lexical_index.memory_bytes()
+        with self._document_vectors_lock:
+            memory += self._document_vectors_chunks * self.dimension * 4
+        return memory
+
+    def warm(self):
+        """Load the HNSW index into memory now rather than on the first search"""
+        sample = self.collection.get(limit=1, include=["embeddings"])
+        if sample["embeddings"]:
+            self.collection.query(query_embeddings=sample["embeddings"], n_results=1, include=["distances"])
+
+    def close(self):
+        """Release the collection's memory and files.
+
+        chromadb 0.4.x has no public way to unload a persistent client: its
+        system (and with it the loaded HNSW segments) is cached per path
+        until stopped and dropped from that cache.
+        """
+        if self.lexical_index is not None:
+            self.lexical_index.close()
+        with self._document_vectors_lock:
+            self._document_vectors.clear()
+            self._document_vectors_chunks = 0
+        self.client._system.stop()
+        SharedSystemClient._identifer_to_system.pop(self.client._identifier, None)
+
+    def get_document_summaries(self) -> List[Dict[str, Any]]:
+        """Metadata of the first chunk of every document, fetched in one bulk query"""
+        results = self.collection.get(where={"chunk_index": 0}, include=["metadatas"])
+        return [metadata for metadata in results["metadatas"] if metadata and "document_id" in metadata]
+
     def list_documents(self) -> List[str]:
         """List all unique document IDs"""
         try:
@@ -93,5 +482,29 @@ class VectorDatabase:
             logger.error(f"Error listing documents: {str(e)}")
             return []
 
+def create_vector_database(
+    embedding_provider: EmbeddingProvider = None,
+    persist_directory: str = None,
+    backend: str = None
+):
+    """Open a vector database of the given backend, by default the one selected by VECTOR_BACKEND.
+
+    With WRITE_COORDINATOR_ENABLED its writes are logged and batched by a WriteCoordinator.
+    """
+    backend = backend or settings.VECTOR_BACKEND
+    if backend == "chroma":
+        database = VectorDatabase(embedding_provider=embedding_provider, persist_directory=persist_directory)
+    elif backend == "flat":
+        database = QuantizedVectorDatabase(
+            embedding_provider=embedding_provider, persist_directory=persist_directory, quantization="none"
+        )
+    elif backend == "quantized":
+        database = QuantizedVectorDatabase(embedding_provider=embedding_provider, persist_directory=persist_directory)
+    else:
+        raise ValueError(f"Unsupported vector backend: {backend}")
+    if settings.WRITE_COORDINATOR_ENABLED:
+        database = WriteCoordinator(database, persist_directory or settings.CHROMA_PERSIST_DIRECTORY)
+    return database
+
 # Global instance
-vector_db = VectorDatabase()
+vector_db = create_vector_database()
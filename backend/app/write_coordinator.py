@@ -0,0 +1,404 @@
+import os
+import json
+import time
+import base64
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+import logging
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+WRITE_LOG_FILE = "write_log.jsonl"
+
+# Past this size the log is rewritten with just the queued writes when it cannot be emptied
+LOG_REWRITE_BYTES = 64 * 1024 * 1024
+
+# Delay before applying writes again after they failed
+APPLY_RETRY_SECONDS = 5.0
+
+# Writers wait while this many batches of chunks are queued, bounding memory when applying falls behind
+MAX_QUEUED_BATCHES = 4
+
+# Methods of the vector database that read it; they wait for queued writes first
+READ_METHODS = frozenset({
+    "similarity_search",
+    "batch_similarity_search",
+    "filtered_search",
+    "scoped_search",
+    "lexical_search",
+    "get_chunks",
+    "get_document_chunks",
+    "document_chunk_ids",
+    "get_document_count",
+    "get_document_summaries",
+    "list_documents",
+})
+
+class WriteApplyError(RuntimeError):
+    """Logged writes could not be applied to the vector database; they stay logged and are retried"""
+
+class WriteCoordinator:
+    """Queues the writes of a vector database behind a write-ahead log and applies them in batches.
+
+    add_documents, delete_chunks, delete_documents and update_metadatas
+    append a record to the log and return once it is fsynced; writers
+    arriving together share one fsync. A background thread applies the
+    queued writes once they hold WRITE_BATCH_MAX_CHUNKS chunks or the oldest
+    has waited WRITE_BATCH_MAX_DELAY_MS, merged into one delete, one add and
+    one metadata update call. Merging keeps the result of applying the
+    writes one by one: a delete drops the queued adds and updates of the
+    chunks it covers, and an add of a chunk with a queued update first
+    applies what was merged so far.
+
+    Reads wait until every write acknowledged before them is applied, so
+    callers see their own writes. Writes still in the log when the process
+    stops are applied on the next open. Replaying applied ones is harmless,
+    as adds skip stored IDs and deletes and updates are idempotent. The log
+    is emptied whenever everything in it has been applied.
+
+    Writes that fail to apply stay in the log and the queue and are retried
+    every APPLY_RETRY_SECONDS. Until they succeed, reads waiting for them and
+    new writes raise WriteApplyError instead of losing or hiding writes.
+
+    Selected with WRITE_COORDINATOR_ENABLED; other attributes and methods
+    are those of the wrapped database.
+    """
+
+    def __init__(self, db, directory: str):
+        self.db = db
+        os.makedirs(directory, exist_ok=True)
+        self.log_path = os.path.join(directory, WRITE_LOG_FILE)
+        self._queue: List[Tuple[int, str, Dict[str, Any]]] = []
+        self._queued_chunks = 0
+        self._oldest_queued = 0.0
+        self._last_sequence = 0
+        self._applied_sequence = 0
+        self._readers = 0
+        self._closed = False
+        # Why the last batch failed to apply, cleared once one applies
+        self._error: Optional[Exception] = None
+        self._retry_at = 0.0
+        self._condition = threading.Condition()
+        # Appends hold _log_lock; fsyncs hold _sync_lock so writers can keep appending meanwhile.
+        # Locks are taken in the order _sync_lock, _log_lock, _condition
+        self._log_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._written_bytes = 0
+        self._synced_bytes = 0
+        # Counters for the benchmark and logs: writes acknowledged and vector database calls made
+        self.writes = 0
+        self.applied_calls = 0
+
+        self._replay()
+        self._log = open(self.log_path, "ab")
+        self._thread = threading.Thread(target=self._run, name="write-coordinator", daemon=True)
+        self._thread.start()
+
+    def __getattr__(self, name: str):
+        if name == "db":
+            raise AttributeError(name)
+        attribute = getattr(self.db, name)
+        if name in READ_METHODS:
+            def read(*args, **kwargs):
+                self.wait_applied()
+                return attribute(*args, **kwargs)
+            return read
+        return attribute
+
+    def _replay(self):
+        """Queue the writes left in the log by the previous process ahead of new ones"""
+        if not os.path.exists(self.log_path):
+            return
+        size = 0
+        with open(self.log_path, "rb") as file:
+            for line in file:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("no line end")
+                    record = json.loads(line)
+                except ValueError:
+                    # A record cut short by a crash was never acknowledged
+                    logger.warning(f"Ignoring a partial record at the end of {self.log_path}")
+                    break
+                size += len(line)
+                self._enqueue(record.pop("op"), _decode(record))
+        # New records are appended after the last complete one
+        os.truncate(self.log_path, size)
+        self._written_bytes = self._synced_bytes = size
+        if self._queue:
+            logger.info(f"Replaying {len(self._queue)} logged writes into the vector database")
+
+    def add_documents(
+        self,
+        chunks: List[str],
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+        embeddings: Optional[List[List[float]]] = None
+    ) -> bool:
+        """Log chunks for adding; returns True once the log is durable"""
+        try:
+            if embeddings is None:
+                # Logged writes must replay without calling the embedding API
+                embeddings = self.db.embedding_provider.embed(chunks)
+            vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+            if self.db.dimension and vectors.shape[1] != self.db.dimension:
+                # Rejected before logging: it could never be applied
+                raise ValueError(f"Expected {self.db.dimension}-dimensional embeddings, got {vectors.shape[1]}")
+            self._write("add", {
+                "ids": list(ids), "documents": list(chunks), "metadatas": list(metadatas), "embeddings": vectors
+            })
+            return True
+        except Exception as e:
+            logger.error(f"Error logging documents: {str(e)}")
+            return False
+
+    def delete_chunks(self, ids: List[str]):
+        """Log chunks for deleting"""
+        if ids:
+            self._write("delete_chunks", {"ids": list(ids)})
+
+    def delete_documents(self, document_id: str) -> bool:
+        """Log all chunks of a document for deleting"""
+        try:
+            self._write("delete_documents", {"document_ids": [document_id]})
+            return True
+        except Exception as e:
+            logger.error(f"Error logging document deletion: {str(e)}")
+            return False
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """Log metadata values for merging into existing chunks"""
+        if ids:
+            self._write("update", {"ids": list(ids), "metadatas": list(metadatas)})
+
+    def _write(self, op: str, payload: Dict[str, Any]):
+        """Append a write to the log and the queue, then wait until the log is on disk"""
+        line = _record(op, payload)
+        with self._condition:
+            self._raise_failure()
+            while self._queued_chunks >= MAX_QUEUED_BATCHES * settings.WRITE_BATCH_MAX_CHUNKS and not self._closed:
+                self._condition.wait()
+                self._raise_failure()
+        with self._log_lock:
+            self._log.write(line)
+            self._log.flush()
+            self._written_bytes += len(line)
+            written = self._written_bytes
+            # Queued under the log lock, so writes are applied in log order
+            with self._condition:
+                self._enqueue(op, payload)
+                self.writes += 1
+                self._condition.notify_all()
+        self._sync(written)
+
+    def _enqueue(self, op: str, payload: Dict[str, Any]):
+        self._last_sequence += 1
+        if not self._queue:
+            self._oldest_queued = time.monotonic()
+        self._queue.append((self._last_sequence, op, payload))
+        self._queued_chunks += len(payload.get("ids", ()))
+
+    def _raise_failure(self):
+        if self._error is not None:
+            raise WriteApplyError(f"Logged writes could not be applied: {str(self._error)}") from self._error
+
+    def _sync(self, written: int):
+        """fsync the log up to at least written bytes; one fsync covers every write appended before it"""
+        with self._sync_lock:
+            if self._synced_bytes >= written:
+                return
+            with self._log_lock:
+                target = self._written_bytes
+            if settings.WRITE_LOG_FSYNC:
+                os.fsync(self._log.fileno())
+            self._synced_bytes = target
+
+    def wait_applied(self):
+        """Wait until every write acknowledged so far is applied, applying them now"""
+        with self._condition:
+            target = self._last_sequence
+            if self._applied_sequence >= target:
+                return
+            self._readers += 1
+            self._condition.notify_all()
+            try:
+                while self._applied_sequence < target:
+                    self._raise_failure()
+                    self._condition.wait()
+            finally:
+                self._readers -= 1
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    timeout = None
+                    if self._queue:
+                        if self._error is not None:
+                            # Failed writes wait for their retry, whoever is waiting for them
+                            due = self._retry_at
+                        elif self._readers or self._queued_chunks >= settings.WRITE_BATCH_MAX_CHUNKS:
+                            due = 0.0
+                        else:
+                            due = self._oldest_queued + settings.WRITE_BATCH_MAX_DELAY_MS / 1000
+                        timeout = due - time.monotonic()
+                        if self._closed or timeout <= 0:
+                            break
+                    elif self._closed:
+                        return
+                    self._condition.wait(timeout)
+                batch, self._queue, self._queued_chunks = self._queue, [], 0
+                # Writers waiting for room may queue again
+                self._condition.notify_all()
+
+            try:
+                self._apply(batch)
+            except Exception as e:
+                logger.error(f"Error applying {len(batch)} logged writes, retrying in {APPLY_RETRY_SECONDS}s: {str(e)}")
+                with self._condition:
+                    # Still in the log; back at the front of the queue, ahead of later writes
+                    self._queue = batch + self._queue
+                    self._queued_chunks += sum(len(payload.get("ids", ())) for _, _, payload in batch)
+                    self._error = e
+                    self._retry_at = time.monotonic() + APPLY_RETRY_SECONDS
+                    self._condition.notify_all()
+                    if self._closed:
+                        # Left in the log for the next open
+                        return
+                continue
+
+            with self._sync_lock, self._log_lock, self._condition:
+                self._applied_sequence = batch[-1][0]
+                self._error = None
+                if not self._queue:
+                    # Everything logged is applied
+                    self._log.truncate(0)
+                elif self._log.tell() >= LOG_REWRITE_BYTES:
+                    self._rewrite_log()
+                self._condition.notify_all()
+
+    def _rewrite_log(self):
+        """Replace the log with the records of the writes still queued"""
+        path = f"{self.log_path}.tmp"
+        with open(path, "wb") as file:
+            for _, op, payload in self._queue:
+                file.write(_record(op, payload))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path, self.log_path)
+        self._log.close()
+        self._log = open(self.log_path, "ab")
+        self._synced_bytes = self._written_bytes
+
+    def _apply(self, batch: List[Tuple[int, str, Dict[str, Any]]]):
+        """Apply queued writes with as few vector database calls as give the same result as in order.
+
+        Raises if any call fails; applying the batch again from the start is safe.
+        """
+        pending = _PendingWrites()
+        for _, op, payload in batch:
+            # Updates are applied after adds, so they must not reach a chunk added after them
+            if op == "add" and not pending.updates.keys().isdisjoint(payload["ids"]):
+                self._apply_pending(pending)
+                pending = _PendingWrites()
+            pending.merge(op, payload)
+        self._apply_pending(pending)
+
+    def _apply_pending(self, pending: "_PendingWrites"):
+        """Apply merged writes: one delete, the adds in max_batch_size calls, one update"""
+        ids = list(pending.deleted_ids)
+        if pending.cancelled_ids:
+            # Deletes of chunks whose queued add was dropped only delete what was stored before
+            stored = set(self.db.get_chunks(list(pending.cancelled_ids))["ids"])
+            ids = [chunk_id for chunk_id in ids if chunk_id not in pending.cancelled_ids or chunk_id in stored]
+            self.applied_calls += 1
+        if pending.deleted_documents:
+            ids.extend(self.db.document_chunk_ids(list(pending.deleted_documents)))
+            self.applied_calls += 1
+        if ids:
+            self.db.delete_chunks(list(dict.fromkeys(ids)))
+            self.applied_calls += 1
+        if pending.adds:
+            self._apply_adds(pending.adds)
+        if pending.updates:
+            self.db.update_metadatas(list(pending.updates), list(pending.updates.values()))
+            self.applied_calls += 1
+
+    def _apply_adds(self, adds: Dict[str, Tuple[str, Dict[str, Any], np.ndarray]]):
+        ids = list(adds)
+        documents = [document for document, _, _ in adds.values()]
+        metadatas = [metadata for _, metadata, _ in adds.values()]
+        vectors = np.stack([vector for _, _, vector in adds.values()])
+        size = self.db.max_batch_size
+        for start in range(0, len(ids), size):
+            end = start + size
+            self.applied_calls += 1
+            if not self.db.add_documents(
+                documents[start:end], metadatas[start:end], ids[start:end], embeddings=vectors[start:end].tolist()
+            ):
+                raise WriteApplyError(f"The vector database did not add {len(ids[start:end])} logged chunks")
+
+    def close(self):
+        """Apply the queued writes, then close the log and the vector database"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._log.close()
+        self.db.close()
+
+class _PendingWrites:
+    """Writes merged for applying as deletes, then adds, then metadata updates"""
+
+    def __init__(self):
+        self.deleted_ids: Dict[str, None] = {}
+        self.deleted_documents: Dict[str, None] = {}
+        # Deleted chunks whose queued add was dropped instead
+        self.cancelled_ids = set()
+        self.adds: Dict[str, Tuple[str, Dict[str, Any], np.ndarray]] = {}
+        self.updates: Dict[str, Dict[str, Any]] = {}
+
+    def merge(self, op: str, payload: Dict[str, Any]):
+        if op == "add":
+            for i, chunk_id in enumerate(payload["ids"]):
+                # Adding a stored ID does nothing, so the first queued add wins
+                if chunk_id not in self.adds:
+                    self.adds[chunk_id] = (payload["documents"][i], payload["metadatas"][i], payload["embeddings"][i])
+        elif op == "delete_chunks":
+            for chunk_id in payload["ids"]:
+                if self.adds.pop(chunk_id, None) is not None:
+                    self.cancelled_ids.add(chunk_id)
+                self.updates.pop(chunk_id, None)
+                self.deleted_ids[chunk_id] = None
+        elif op == "delete_documents":
+            documents = set(payload["document_ids"])
+            self.adds = {
+                chunk_id: add for chunk_id, add in self.adds.items() if add[1].get("document_id") not in documents
+            }
+            self.deleted_documents.update(dict.fromkeys(payload["document_ids"]))
+        else:
+            for chunk_id, metadata in zip(payload["ids"], payload["metadatas"]):
+                self.updates.setdefault(chunk_id, {}).update(metadata)
+
+def _record(op: str, payload: Dict[str, Any]) -> bytes:
+    return (json.dumps({"op": op, **_encode(payload)}) + "\n").encode()
+
+def _encode(payload: Dict[str, Any]) -> Dict[str, Any]:
+    if "embeddings" not in payload:
+        return payload
+    vectors = payload["embeddings"]
+    return {
+        **payload,
+        "embeddings": base64.b64encode(vectors.tobytes()).decode(),
+        "dimension": vectors.shape[1],
+    }
+
+def _decode(record: Dict[str, Any]) -> Dict[str, Any]:
+    if "embeddings" in record:
+        vectors = np.frombuffer(base64.b64decode(record["embeddings"]), dtype=np.float32)
+        record["embeddings"] = vectors.reshape(len(record["ids"]), record.pop("dimension"))
+    return record
@@ -0,0 +1,155 @@
+"""
+Benchmark document chunking throughput on the sample corpus.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_chunking --scale 1000
+
+The sample documents in data/sample_documents are concatenated `--scale`
+times and chunked with DocumentProcessor.split_text. With --compare-legacy the
+original per-sentence re-encoding chunker is run on a smaller copy of the
+corpus and the chunk shapes of both implementations are compared.
+
+With --memory the corpus is written to a temporary text file and the peak
+Python memory (tracemalloc) of reading it whole, as before, is compared with
+streaming it through DocumentProcessor.stream_document in upload-sized
+batches.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from itertools import islice
+
+from app.config import settings
+from app.document_processor import DocumentProcessor
+
+SAMPLE_DIRECTORY = os.path.join(os.path.dirname(__file__), "..", "..", "data", "sample_documents")
+
+
+def load_corpus(scale: int) -> str:
+    """Concatenate the sample documents `scale` times"""
+    texts = []
+    for name in sorted(os.listdir(SAMPLE_DIRECTORY)):
+        with open(os.path.join(SAMPLE_DIRECTORY, name), "r", encoding="utf-8") as file:
+            texts.append(file.read())
+    return "\n\n".join(texts * scale)
+
+
+def legacy_chunk_text(processor: DocumentProcessor, text: str, chunk_size: int, overlap: int):
+    """The original chunker, which re-encodes the growing chunk for every sentence"""
+    sentences = text.split('. ')
+    chunks = []
+    current_chunk = ""
+    for sentence in sentences:
+        test_chunk = current_chunk + sentence + ". "
+        if processor.count_tokens(test_chunk) > chunk_size and current_chunk:
+            chunks.append(current_chunk.strip())
+            overlap_text = ""
+            for previous in reversed(current_chunk.strip().split('. ')):
+                test_overlap = previous + ". " + overlap_text
+                if processor.count_tokens(test_overlap) > overlap:
+                    break
+                overlap_text = test_overlap
+            current_chunk = overlap_text + sentence + ". "
+        else:
+            current_chunk = test_chunk
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def describe(processor: DocumentProcessor, chunks) -> dict:
+    token_counts = [processor.count_tokens(chunk) for chunk in chunks]
+    return {
+        "chunks": len(chunks),
+        "mean_tokens": statistics.mean(token_counts) if token_counts else 0,
+        "max_tokens": max(token_counts, default=0),
+    }
+
+
+def measure_peak(function) -> tuple:
+    """Run function under tracemalloc; returns (result, peak MB, seconds)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak / 1e6, elapsed
+
+
+def compare_memory(processor: DocumentProcessor, text: str):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "corpus.txt")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(text)
+
+        def whole_file():
+            chunks = processor.split_text(processor.extract_text_from_file(path, "txt"))
+            return len(chunks)
+
+        def streamed():
+            stream = processor.stream_document(path, "corpus.txt", "txt", "bench", datetime.now())
+            count = 0
+            while True:
+                batch = list(islice(stream, settings.INGEST_BATCH_CHUNKS))
+                if not batch:
+                    return count
+                count += len(batch)
+
+        print(f"\nPeak memory ({len(text) / 1e6:.1f} MB file):")
+        for name, function in (("whole file", whole_file), ("streamed", streamed)):
+            count, peak, elapsed = measure_peak(function)
+            print(f"  {name:>10}: {peak:,.1f} MB peak, {count} chunks in {elapsed:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=1000, help="Number of copies of the sample corpus")
+    parser.add_argument("--chunk-size", type=int, default=settings.CHUNK_SIZE)
+    parser.add_argument("--overlap", type=int, default=settings.CHUNK_OVERLAP)
+    parser.add_argument("--compare-legacy", action="store_true", help="Compare against the original chunker")
+    parser.add_argument("--legacy-scale", type=int, default=20, help="Corpus scale for the legacy comparison")
+    parser.add_argument("--memory", action="store_true", help="Compare peak memory of whole-file and streamed chunking")
+    args = parser.parse_args()
+
+    processor = DocumentProcessor()
+    text = load_corpus(args.scale)
+    total_tokens = processor.count_tokens(text)
+
+    start = time.perf_counter()
+    chunks = processor.split_text(text, args.chunk_size, args.overlap)
+    elapsed = time.perf_counter() - start
+
+    print(f"Corpus: {len(text) / 1e6:.1f} MB, {total_tokens} tokens (scale {args.scale})")
+    print(f"split_text: {len(chunks)} chunks in {elapsed:.2f}s "
+          f"({total_tokens / elapsed:,.0f} tokens/sec)")
+
+    if args.compare_legacy:
+        small_text = load_corpus(args.legacy_scale)
+        small_tokens = processor.count_tokens(small_text)
+
+        start = time.perf_counter()
+        legacy_chunks = legacy_chunk_text(processor, small_text, args.chunk_size, args.overlap)
+        legacy_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        new_chunks = processor.chunk_text(small_text, args.chunk_size, args.overlap)
+        new_elapsed = time.perf_counter() - start
+
+        print(f"\nLegacy comparison (scale {args.legacy_scale}, {small_tokens} tokens):")
+        print(f"  legacy:     {legacy_elapsed:.2f}s ({small_tokens / legacy_elapsed:,.0f} tokens/sec) "
+              f"{describe(processor, legacy_chunks)}")
+        print(f"  split_text: {new_elapsed:.2f}s ({small_tokens / new_elapsed:,.0f} tokens/sec) "
+              f"{describe(processor, new_chunks)}")
+
+    if args.memory:
+        compare_memory(processor, text)
+
+
+if __name__ == "__main__":
+    main()
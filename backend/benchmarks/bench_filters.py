@@ -0,0 +1,125 @@
+"""
+Benchmark filtered vector queries against unfiltered ones.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_filters --documents 500 --chunks-per-document 100
+
+Fills a temporary Chroma collection and document catalog with random unit
+vectors spread over documents of four file types uploaded over a year, then
+times top-k queries without filters and with filters resolved through the
+catalog as the query path does (VectorDatabase.filtered_search). The same
+filters passed straight to Chroma as a where clause are timed for reference.
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.document_catalog import DocumentCatalog
+from app.models import Document, QueryFilters
+from app.query_filters import build_where
+from app.vector_db import VectorDatabase
+from benchmarks.common import PrecomputedEmbeddings, vector_index_only
+
+FILE_TYPES = ["pdf", "docx", "txt", "md"]
+
+
+def time_queries(search, queries):
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        search(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--chunks-per-document", type=int, default=100)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-results", type=int, default=5)
+    args = parser.parse_args()
+
+    vector_index_only()
+    rng = np.random.default_rng(3)
+    start_date = datetime(2026, 1, 1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = VectorDatabase(
+            embedding_provider=PrecomputedEmbeddings("benchmark", args.dimension),
+            persist_directory=directory
+        )
+        catalog = DocumentCatalog(f"{directory}/catalog.db")
+        started = time.perf_counter()
+        texts, metadatas, ids = [], [], []
+        for document in range(args.documents):
+            uploaded_at = start_date + timedelta(days=int(rng.integers(365)))
+            file_type = FILE_TYPES[document % 4]
+            catalog.upsert(Document(
+                id=f"doc{document}", filename=f"file{document}.{file_type}",
+                original_filename=f"file{document}.{file_type}", file_type=file_type,
+                upload_date=uploaded_at, chunk_count=args.chunks_per_document, size_bytes=0
+            ))
+            for i in range(args.chunks_per_document):
+                texts.append(f"chunk {i} of document {document}")
+                ids.append(f"doc{document}_{i}")
+                metadatas.append({
+                    "document_id": f"doc{document}",
+                    "filename": f"file{document}.{file_type}",
+                    "file_type": file_type,
+                    "chunk_index": i,
+                    "upload_timestamp": uploaded_at.timestamp(),
+                })
+            if len(ids) >= 5000 or document == args.documents - 1:
+                vectors = rng.standard_normal((len(ids), args.dimension)).astype(np.float32)
+                vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                db.add_documents(texts, metadatas, ids, embeddings=vectors.tolist())
+                texts, metadatas, ids = [], [], []
+        print(f"Stored {db.get_document_count():,} chunks in {time.perf_counter() - started:.1f}s")
+
+        queries = rng.standard_normal((args.queries, args.dimension)).astype(np.float32).tolist()
+        scoped_document = f"doc{args.documents // 2}"
+        filters = {
+            "file type": QueryFilters(file_types=["pdf"]),
+            "date range": QueryFilters(
+                uploaded_after=start_date + timedelta(days=30),
+                uploaded_before=start_date + timedelta(days=60)
+            ),
+            "one document": QueryFilters(document_ids=[scoped_document]),
+        }
+
+        def filtered(query_filters):
+            def search(query):
+                documents = catalog.find_documents(query_filters)
+                return db.filtered_search(query, args.n_results, query_filters, documents, catalog.total_chunks())
+            return search
+
+        def chroma_where(query_filters):
+            return lambda query: db.similarity_search(
+                query_embedding=query, n_results=args.n_results, where=build_where(query_filters)
+            )
+
+        cases = {"unfiltered": lambda q: db.similarity_search(query_embedding=q, n_results=args.n_results)}
+        for name, query_filters in filters.items():
+            cases[name] = filtered(query_filters)
+        for name, query_filters in filters.items():
+            cases[f"{name} (where)"] = chroma_where(query_filters)
+        for name, search in cases.items():
+            # One warm-up query loads caches, as a long-running server would have
+            search(queries[0])
+            print(f"{name:>20}: {time_queries(search, queries)}")
+
+
+if __name__ == "__main__":
+    main()
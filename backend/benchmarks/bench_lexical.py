@@ -0,0 +1,100 @@
+"""
+Benchmark lexical (BM25) index query latency at scale.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_lexical --chunks 1000000
+
+Builds an index over synthetic chunks (Zipf-distributed vocabulary plus
+error codes, SKUs and API paths), merges it into a snapshot, then times
+identifier lookups and natural-language queries that mix rare and very
+common terms.
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from app.lexical_index import LexicalIndex
+
+VOCABULARY_SIZE = 50_000
+STOPWORDS = ["the", "a", "of", "to", "and", "is", "in", "for", "on", "with"]
+
+
+def make_chunks(count: int, words_per_chunk: int, seed: int = 7):
+    """Synthetic chunk texts, generated in batches of 10,000"""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array([f"w{i}" for i in range(VOCABULARY_SIZE)])
+    for start in range(0, count, 10_000):
+        size = min(10_000, count - start)
+        words = vocabulary[np.minimum(rng.zipf(1.3, size=(size, words_per_chunk)) - 1, VOCABULARY_SIZE - 1)]
+        stopwords = rng.choice(STOPWORDS, size=(size, words_per_chunk // 3))
+        texts = []
+        for i in range(size):
+            chunk = start + i
+            identifiers = f"ERR-{chunk % 5000} SKU-{chunk:07d} /api/v1/resource{chunk % 997}"
+            texts.append(" ".join(words[i]) + " " + " ".join(stopwords[i]) + " " + identifiers)
+        yield [f"chunk_{start + i}" for i in range(size)], texts
+
+
+def time_queries(index: LexicalIndex, queries, n_results: int):
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, n_results)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--words", type=int, default=60, help="Words per chunk")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--n-results", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = LexicalIndex(directory)
+        started = time.perf_counter()
+        for ids, texts in make_chunks(args.chunks, args.words):
+            index.add(ids, texts, merge=False)
+        index.save()
+        build_seconds = time.perf_counter() - started
+        stats = index.get_stats()
+        print(f"Indexed {stats['chunks']:,} chunks in {build_seconds:.1f}s: "
+              f"{stats['terms']:,} terms, {stats['base_postings']:,} postings")
+
+        rng = np.random.default_rng(11)
+        identifier_queries = [
+            f"what does ERR-{rng.integers(5000)} mean" for _ in range(args.queries // 2)
+        ] + [f"SKU-{rng.integers(args.chunks):07d}" for _ in range(args.queries // 2)]
+        mixed_queries = [
+            f"the w{rng.integers(1, 20)} of w{rng.integers(100, 5000)} and w{rng.integers(5000, 50000)}"
+            for _ in range(args.queries)
+        ]
+        common_queries = [f"the w0 and w1 of w2" for _ in range(args.queries // 5)]
+
+        for name, queries in [
+            ("identifier", identifier_queries),
+            ("mixed", mixed_queries),
+            ("common-only", common_queries),
+        ]:
+            print(f"{name:>12}: {time_queries(index, queries, args.n_results)}")
+
+        # Incremental updates: a fresh upload lands in the delta segment
+        ids, texts = next(make_chunks(1000, args.words, seed=99))
+        index.add([f"new_{chunk_id}" for chunk_id in ids], texts)
+        print(f"{'after add':>12}: {time_queries(index, mixed_queries, args.n_results)}")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark the overhead of the stage instrumentation.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_metrics --iterations 200000
+
+Times an empty loop, then the same loop with a stage timer, and separately
+the cost of recording a finished request's trace into the histograms. A
+query times about ten stages and records them once at the end, so its
+instrumentation cost is ten stage timers plus one record. The contended case
+records from several threads at once into the same histograms.
+"""
+import argparse
+import threading
+import time
+
+from app.metrics import Metrics, RequestTrace
+
+
+def per_call_ns(function, iterations: int) -> float:
+    started = time.perf_counter()
+    function(iterations)
+    return (time.perf_counter() - started) / iterations * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200_000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--stages-per-query", type=int, default=10)
+    args = parser.parse_args()
+
+    metrics = Metrics()
+
+    def empty(n):
+        for _ in range(n):
+            pass
+
+    stages = [f"stage{i}" for i in range(args.stages_per_query)]
+    finished = RequestTrace()
+    for stage in stages:
+        finished.add(stage, 0.003)
+
+    def stage_timer(n):
+        trace = RequestTrace()
+        for _ in range(n):
+            with trace.stage("search"):
+                pass
+
+    def record(n):
+        for _ in range(n):
+            metrics.record("query", finished)
+
+    baseline = per_call_ns(empty, args.iterations)
+    timer_ns = per_call_ns(stage_timer, args.iterations) - baseline
+    record_ns = per_call_ns(record, args.iterations // args.stages_per_query) - baseline
+
+    per_thread = args.iterations // args.stages_per_query // args.threads
+    threads = [threading.Thread(target=record, args=(per_thread,)) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    contended_ns = (time.perf_counter() - started) / (per_thread * args.threads) * 1e9 - baseline
+
+    print(f"{'stage timer':>28}: {timer_ns:,.0f} ns")
+    print(f"{'record (' + str(args.stages_per_query) + ' stages)':>28}: {record_ns:,.0f} ns")
+    print(f"{'record, ' + str(args.threads) + ' threads':>28}: {contended_ns:,.0f} ns")
+    per_query_us = (timer_ns * args.stages_per_query + record_ns) / 1000
+    print(f"\nInstrumentation per query ({args.stages_per_query} stages): {per_query_us:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark serial against parallel PDF text extraction.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_pdf_extraction --pages 400 --processes 2 4 8
+
+Writes a synthetic text-heavy PDF (`--lines-per-page` lines of random words
+on every page) and extracts it with DocumentProcessor.extract_segments, first
+serially and then with the page ranges spread over each number of worker
+processes. Worker start-up is excluded: the pool is warmed on a small file
+first, as a running server would have it. The speedup is bounded by the
+number of cores, reported alongside.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from app import concurrency
+from app.config import settings
+from app.document_processor import DocumentProcessor
+
+WORDS = (
+    "policy employee request approval manager quarterly budget travel expense "
+    "report system access security training review schedule benefit leave "
+    "vacation remote office equipment contract vendor invoice payment customer"
+).split()
+
+
+def write_synthetic_pdf(path: str, pages: int, lines_per_page: int = 60, seed: int = 0):
+    """Write a PDF of `pages` pages, each with lines_per_page sentences of random words"""
+    rng = random.Random(seed)
+    page_ids = [4 + 2 * i for i in range(pages)]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {pages} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for page_id in page_ids:
+        lines = ["BT /F1 8 Tf 10 TL 30 820 Td"]
+        for _ in range(lines_per_page):
+            sentence = " ".join(rng.choice(WORDS) for _ in range(16)).capitalize()
+            lines.append(f"({sentence}.) '")
+        lines.append("ET")
+        content = "\n".join(lines).encode()
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as file:
+        file.write(output)
+
+
+def extract(processor: DocumentProcessor, path: str) -> tuple:
+    """Extract a PDF; returns (seconds, page count, characters)"""
+    start = time.perf_counter()
+    pages = characters = 0
+    for _, text in processor.extract_segments(path, "pdf"):
+        pages += 1
+        characters += len(text)
+    return time.perf_counter() - start, pages, characters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--lines-per-page", type=int, default=60)
+    parser.add_argument("--processes", type=int, nargs="+", default=[2, 4])
+    args = parser.parse_args()
+
+    processor = DocumentProcessor()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "synthetic.pdf")
+        warmup_path = os.path.join(directory, "warmup.pdf")
+        write_synthetic_pdf(path, args.pages, args.lines_per_page)
+        print(f"PDF: {args.pages} pages, {os.path.getsize(path) / 1e6:.1f} MB; {os.cpu_count()} cores")
+
+        settings.EXTRACTION_PROCESSES = 1
+        serial, pages, characters = extract(processor, path)
+        print(f"  serial:      {serial:.2f}s ({pages / serial:,.0f} pages/sec, {characters:,} chars)")
+
+        for processes in args.processes:
+            if processes < 2:
+                continue
+            settings.EXTRACTION_PROCESSES = processes
+            settings.PDF_PARALLEL_MIN_PAGES = 1
+            concurrency.shutdown_process_pool()
+            write_synthetic_pdf(warmup_path, processes * 8)
+            extract(processor, warmup_path)
+            elapsed, parallel_pages, parallel_characters = extract(processor, path)
+            assert (parallel_pages, parallel_characters) == (pages, characters)
+            print(f"  {processes} processes: {elapsed:.2f}s ({parallel_pages / elapsed:,.0f} pages/sec, "
+                  f"{serial / elapsed:.2f}x)")
+        concurrency.shutdown_process_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark recall, memory and latency of the flat and quantized vector backends against Chroma.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_quantized --vectors 100000 --dimension 384
+
+Stores the same clustered random unit vectors in a Chroma collection
+(VectorDatabase) and in QuantizedVectorDatabase without quantization (flat)
+and with int8 and pq codes, then runs the same queries against each.
+Recall@k is measured against an exact brute-force search of the vectors.
+Memory is each backend's memory_bytes estimate of what stays resident for
+searching; disk is the size of its directory. open_ms is the time to reopen
+the database and answer a first query. batch_ms is the time per query of
+searching all queries with one batch_similarity_search. pq codebooks are
+trained once `--pq-training-vectors` vectors are stored.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.quantized_vector_db import QuantizedVectorDatabase
+from app.vector_db import create_vector_database
+from benchmarks.common import PrecomputedEmbeddings, vector_index_only
+
+
+def clustered_vectors(rng, count, dimension, centers):
+    vectors = centers[rng.integers(len(centers), size=count)] + 0.5 * rng.standard_normal((count, dimension))
+    vectors = vectors.astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def directory_mb(path):
+    total = sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path) for name in names
+    )
+    return round(total / 1e6, 1)
+
+
+def measure(db, queries, exact, k):
+    latencies, found = [], 0
+    db.similarity_search(query_embedding=queries[0], n_results=k)
+    for query, expected in zip(queries, exact):
+        started = time.perf_counter()
+        results = db.similarity_search(query_embedding=query, n_results=k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found += len({int(chunk_id) for chunk_id in results["ids"][0]} & set(expected))
+    latencies.sort()
+    started = time.perf_counter()
+    db.batch_similarity_search(queries, n_results=k)
+    batch_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    return {
+        f"recall@{k}": round(found / (k * len(queries)), 4),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 3),
+        "batch_ms": round(batch_ms, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=settings.QUANTIZED_RESCORE_FACTOR)
+    parser.add_argument("--pq-training-vectors", type=int, default=settings.PQ_TRAINING_VECTORS)
+    parser.add_argument("--backends", nargs="+", default=["chroma", "flat", "int8", "pq"])
+    args = parser.parse_args()
+
+    vector_index_only()
+    settings.QUANTIZED_RESCORE_FACTOR = args.rescore_factor
+    settings.PQ_TRAINING_VECTORS = args.pq_training_vectors
+    rng = np.random.default_rng(5)
+    centers = rng.standard_normal((args.clusters, args.dimension))
+    vectors = clustered_vectors(rng, args.vectors, args.dimension, centers)
+    queries = clustered_vectors(rng, args.queries, args.dimension, centers)
+    exact = [list(np.argsort(-(vectors @ query))[:args.k]) for query in queries]
+    queries = queries.tolist()
+    print(f"{args.vectors:,} vectors of {args.dimension} dimensions, float32 size {vectors.nbytes / 1e6:.1f} MB")
+
+    for backend in args.backends:
+        with tempfile.TemporaryDirectory() as directory:
+            provider = PrecomputedEmbeddings("benchmark", args.dimension)
+
+            def open_database():
+                if backend in ("int8", "pq"):
+                    settings.QUANTIZATION = backend
+                    return QuantizedVectorDatabase(embedding_provider=provider, persist_directory=directory)
+                return create_vector_database(provider, directory, backend)
+
+            db = open_database()
+            started = time.perf_counter()
+            for start in range(0, args.vectors, db.max_batch_size):
+                end = min(start + db.max_batch_size, args.vectors)
+                db.add_documents(
+                    [""] * (end - start),
+                    [{"document_id": "d", "chunk_index": i} for i in range(start, end)],
+                    [str(i) for i in range(start, end)],
+                    embeddings=vectors[start:end].tolist()
+                )
+            build_seconds = time.perf_counter() - started
+            db.close()
+            started = time.perf_counter()
+            db = open_database()
+            db.similarity_search(query_embedding=queries[0], n_results=args.k)
+            open_ms = (time.perf_counter() - started) * 1000
+            result = {
+                "open_ms": round(open_ms, 1),
+                "build_s": round(build_seconds, 1),
+                "memory_mb": round(db.memory_bytes() / 1e6, 1),
+                "disk_mb": directory_mb(directory),
+                **measure(db, queries, exact, args.k),
+            }
+            db.close()
+            print(f"{backend:>7}: {result}")
+
+
+if __name__ == "__main__":
+    main()
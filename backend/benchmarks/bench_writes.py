@@ -0,0 +1,126 @@
+"""
+Benchmark sustained ingest throughput with and without the write coordinator.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_writes --writers 8 --documents 400 --chunks 8
+
+Each of `--writers` threads adds `--documents` small documents of `--chunks`
+chunks with precomputed embeddings, deleting every `--delete-every`th one
+again, as concurrent uploads and deletions do through the API. The same
+writes go once straight to the vector database, one call per write as
+today, and once through WriteCoordinator, which logs them durably and
+applies them in batches. A final get_document_count checks that every
+acknowledged write is visible. chunks_per_s counts added chunks over the
+whole run including that read; ack_ms is the time a writer waits for each
+write; db_calls is the number of vector database write calls made.
+"""
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.vector_db import create_vector_database
+from app.write_coordinator import WriteCoordinator
+from benchmarks.common import PrecomputedEmbeddings, vector_index_only
+
+
+class CountingDatabase:
+    """Counts the write calls reaching the wrapped database"""
+
+    def __init__(self, db):
+        self.db = db
+        self.calls = 0
+
+    def __getattr__(self, name):
+        attribute = getattr(self.db, name)
+        if name in ("add_documents", "delete_chunks", "delete_documents", "update_metadatas"):
+            def write(*args, **kwargs):
+                self.calls += 1
+                return attribute(*args, **kwargs)
+            return write
+        return attribute
+
+
+def writer(db, vectors, writer_id, args, latencies):
+    for document in range(args.documents):
+        document_id = f"w{writer_id}_d{document}"
+        start = (writer_id * args.documents + document) * args.chunks
+        started = time.perf_counter()
+        db.add_documents(
+            [f"chunk {i} of {document_id}" for i in range(args.chunks)],
+            [{"document_id": document_id, "chunk_index": i} for i in range(args.chunks)],
+            [f"{document_id}_{i}" for i in range(args.chunks)],
+            embeddings=vectors[start:start + args.chunks].tolist()
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        if document % args.delete_every == args.delete_every - 1:
+            started = time.perf_counter()
+            db.delete_documents(document_id)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+
+def run(backend, coordinated, vectors, args):
+    with tempfile.TemporaryDirectory() as directory:
+        counting = CountingDatabase(
+            create_vector_database(PrecomputedEmbeddings("benchmark", args.dimension), directory, backend)
+        )
+        db = WriteCoordinator(counting, directory) if coordinated else counting
+        latencies = []
+        threads = [
+            threading.Thread(target=writer, args=(db, vectors, writer_id, args, latencies))
+            for writer_id in range(args.writers)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stored = db.get_document_count()
+        seconds = time.perf_counter() - started
+        db.close()
+
+    deleted = args.writers * (args.documents // args.delete_every) * args.chunks
+    assert stored == len(vectors) - deleted, f"{stored} chunks stored"
+    latencies.sort()
+    return {
+        "chunks_per_s": round(len(vectors) / seconds),
+        "ack_p50_ms": round(statistics.median(latencies), 2),
+        "ack_p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 2),
+        "db_calls": counting.calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--documents", type=int, default=400)
+    parser.add_argument("--chunks", type=int, default=8)
+    parser.add_argument("--delete-every", type=int, default=4)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--backends", nargs="+", default=["chroma", "flat"])
+    args = parser.parse_args()
+
+    vector_index_only()
+    settings.WRITE_COORDINATOR_ENABLED = False
+    rng = np.random.default_rng(5)
+    vectors = rng.standard_normal((args.writers * args.documents * args.chunks, args.dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    print(
+        f"{args.writers} writers x {args.documents} documents x {args.chunks} chunks, "
+        f"fsync={settings.WRITE_LOG_FSYNC}, batch {settings.WRITE_BATCH_MAX_CHUNKS} chunks / "
+        f"{settings.WRITE_BATCH_MAX_DELAY_MS} ms"
+    )
+
+    for backend in args.backends:
+        for coordinated in (False, True):
+            name = f"{backend}+coordinator" if coordinated else backend
+            print(f"{name:>18}: {run(backend, coordinated, vectors, args)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+"""
+Helpers shared by the vector database benchmarks.
+"""
+from app.config import settings
+from app.embeddings import EmbeddingProvider
+
+
+class PrecomputedEmbeddings(EmbeddingProvider):
+    """Embedding provider for benchmarks that pass every vector in precomputed"""
+    name = "benchmark"
+
+    def embed(self, texts):
+        raise RuntimeError("The benchmark passes precomputed embeddings")
+
+
+def vector_index_only():
+    """Turn off the lexical index, so a benchmark times the vector index alone"""
+    settings.HYBRID_SEARCH_ENABLED = False
@@ -0,0 +1,136 @@
+"""
+Load test: /api/health latency while the backend serves many /api/query calls.
+
+    python -m benchmarks.load_test_health --queries 200 --completion-latency 1.0
+
+Starts the OpenAI stub server and the backend as subprocesses with a
+throwaway data directory, uploads data/sample_documents, then fires
+`--queries` concurrent /api/query requests while polling /api/health. A
+backend that blocks its event loop on upstream calls shows health-check
+latencies close to the completion latency; a non-blocking one stays in the
+low milliseconds.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+SAMPLE_DIRECTORY = os.path.join(os.path.dirname(__file__), "..", "..", "data", "sample_documents")
+BACKEND_DIRECTORY = os.path.join(os.path.dirname(__file__), "..")
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def start_processes(args, data_directory):
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_openai", "--port", str(args.stub_port),
+         "--completion-latency", str(args.completion_latency)],
+        cwd=BACKEND_DIRECTORY
+    )
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="stub",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{args.stub_port}/v1",
+        EMBEDDING_PROVIDER="openai",
+        EMBEDDING_MODEL="stub-embedding",
+        CHROMA_PERSIST_DIRECTORY=os.path.join(data_directory, "chroma_db"),
+        EMBEDDING_CACHE_DIRECTORY=os.path.join(data_directory, "embedding_cache"),
+        UPLOAD_DIRECTORY=os.path.join(data_directory, "uploads"),
+    )
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=BACKEND_DIRECTORY,
+        env=env
+    )
+    return stub, backend
+
+
+async def wait_until_ready(client: httpx.AsyncClient, url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready")
+
+
+async def run_load(args):
+    base_url = f"http://127.0.0.1:{args.port}/api"
+    limits = httpx.Limits(max_connections=args.queries + 10)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300) as client:
+        await wait_until_ready(client, "/health")
+        await wait_until_ready(httpx.AsyncClient(), f"http://127.0.0.1:{args.stub_port}/docs")
+
+        for name in sorted(os.listdir(SAMPLE_DIRECTORY)):
+            with open(os.path.join(SAMPLE_DIRECTORY, name), "rb") as file:
+                response = await client.post("/upload", files={"file": (name, file.read())})
+            response.raise_for_status()
+
+        health_latencies = []
+        query_latencies = []
+        done = asyncio.Event()
+
+        async def poll_health():
+            while not done.is_set():
+                start = time.perf_counter()
+                (await client.get("/health")).raise_for_status()
+                health_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(args.health_interval)
+
+        async def query(i):
+            start = time.perf_counter()
+            response = await client.post("/query", json={"query": f"What is the vacation policy? ({i})"})
+            response.raise_for_status()
+            query_latencies.append(time.perf_counter() - start)
+
+        poller = asyncio.create_task(poll_health())
+        start = time.perf_counter()
+        await asyncio.gather(*(query(i) for i in range(args.queries)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await poller
+
+    print(f"{args.queries} concurrent /api/query calls finished in {elapsed:.2f}s "
+          f"(completion latency {args.completion_latency}s)")
+    print(f"/api/query  p50={percentile(query_latencies, 0.5) * 1000:.0f}ms "
+          f"p99={percentile(query_latencies, 0.99) * 1000:.0f}ms")
+    print(f"/api/health samples={len(health_latencies)} "
+          f"p50={statistics.median(health_latencies) * 1000:.1f}ms "
+          f"p99={percentile(health_latencies, 0.99) * 1000:.1f}ms "
+          f"max={max(health_latencies) * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--completion-latency", type=float, default=1.0)
+    parser.add_argument("--health-interval", type=float, default=0.01)
+    parser.add_argument("--port", type=int, default=8912)
+    parser.add_argument("--stub-port", type=int, default=8911)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_directory:
+        stub, backend = start_processes(args, data_directory)
+        try:
+            asyncio.run(run_load(args))
+        finally:
+            backend.terminate()
+            stub.terminate()
+            backend.wait()
+            stub.wait()
+
+
+if __name__ == "__main__":
+    main()
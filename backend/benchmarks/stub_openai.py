@@ -0,0 +1,106 @@
+"""
+Minimal OpenAI-compatible stub server for offline benchmarks.
+
+    python -m benchmarks.stub_openai --port 8911 --completion-latency 1.0
+
+Serves /v1/embeddings with deterministic bag-of-words vectors and
+/v1/chat/completions with a canned answer after a configurable delay.
+Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:8911/v1.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+EMBEDDING_DIMENSION = 64
+STUB_ANSWER = "Stub answer based on Source 1."
+
+
+def stub_embedding(text: str, dimension: int = EMBEDDING_DIMENSION):
+    """Deterministic, roughly semantic vector: hashed word counts"""
+    vector = [0.0] * dimension
+    for word in text.lower().split():
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % dimension] += 1.0
+    return vector
+
+
+def create_app(completion_latency: float, embedding_latency: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(embedding_latency)
+        return {
+            "object": "list",
+            "model": body["model"],
+            "data": [
+                {"object": "embedding", "index": i, "embedding": stub_embedding(text)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if body.get("stream"):
+            return StreamingResponse(stream_completion(body["model"]), media_type="text/event-stream")
+        await asyncio.sleep(completion_latency)
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": STUB_ANSWER},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    async def stream_completion(model: str):
+        # Spread the completion latency over the streamed words
+        words = STUB_ANSWER.split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(completion_latency / len(words))
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": word if i == 0 else " " + word},
+                    "finish_reason": None,
+                }],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8911)
+    parser.add_argument("--completion-latency", type=float, default=1.0, help="Seconds per chat completion")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Seconds per embeddings call")
+    args = parser.parse_args()
+    uvicorn.run(
+        create_app(args.completion_latency, args.embedding_latency),
+        host="127.0.0.1",
+        port=args.port,
+        log_level="warning"
+    )
+
+
+if __name__ == "__main__":
+    main()
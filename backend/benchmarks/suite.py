@@ -0,0 +1,443 @@
+"""
+Reproducible offline benchmark suite: ingestion, queries, memory and index build.
+
+Run from the backend directory:
+
+    python -m benchmarks.suite --sizes 1000 10000 --output results.json
+    python -m benchmarks.suite --sizes 1000 100000 1000000 --output full.json
+    python -m benchmarks.suite --sizes 1000 --compare results.json
+
+For every corpus size (in chunks) a synthetic corpus is generated from the
+sentences of data/sample_documents with a fixed seed, then run through the
+real RAGService in a fresh process with a throwaway data directory:
+
+- ingest: every document goes through upload_document (extract, chunk,
+  embed, store), INGESTION_WORKERS at a time. Reports throughput and the
+  time summed per stage.
+- index: the time to merge the lexical index and to reopen and warm the
+  vector database, and the size on disk.
+- query: `--queries` queries made of word runs taken from the corpus, in each
+  of `--modes`: answered by the stub LLM (stub_llm), by ExtractiveGenerator
+  (extractive), or not answered (retrieval_only). Reports percentiles of the
+  total and of every stage.
+- memory: peak resident set size of the process after ingestion and at the
+  end. Each size runs in its own process, so the peaks do not carry over.
+
+The vector database is the VECTOR_BACKEND one, so
+`VECTOR_BACKEND=quantized python -m benchmarks.suite ...` measures the
+quantized backend.
+
+OpenAIService and the query embedding provider are replaced by deterministic
+local fakes that sleep `--embedding-latency` per embedding request and
+`--completion-latency` per answer. No network access is needed.
+
+Results go to `--output` as JSON with the commit and machine they came from.
+`--compare OLD.json` prints the change of every metric against an earlier run
+of the same sizes. The 1M-chunk corpus takes around an hour and about 1 GB of
+disk, so it is opt-in.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+SAMPLE_DIRECTORY = os.path.join(os.path.dirname(__file__), "..", "..", "data", "sample_documents")
+STUB_ANSWER = "Stub answer based on Source 1."
+
+
+def load_sentences() -> List[str]:
+    """Sentences of the sample documents, the templates of the synthetic corpus"""
+    sentences = []
+    for name in sorted(os.listdir(SAMPLE_DIRECTORY)):
+        with open(os.path.join(SAMPLE_DIRECTORY, name), "r", encoding="utf-8") as file:
+            text = re.sub(r"\s+", " ", file.read())
+        sentences.extend(sentence.strip() for sentence in text.split(". ") if len(sentence.split()) >= 4)
+    return sentences
+
+
+def generate_corpus(directory: str, document_count: int, sentences_per_document: int, seed: int) -> List[str]:
+    """Write document_count text files of template sentences; returns their paths.
+
+    Sentences get a document-specific reference and random figures, so
+    documents differ from each other as real ones would.
+    """
+    rng = random.Random(seed)
+    templates = load_sentences()
+    paths = []
+    for document in range(document_count):
+        sentences = []
+        for i in range(sentences_per_document):
+            sentence = re.sub(r"\d+", lambda _: str(rng.randint(1, 500)), rng.choice(templates))
+            if rng.random() < 0.2:
+                sentence += f" (see section {document}.{i})"
+            sentences.append(sentence)
+        path = os.path.join(directory, f"document_{document:07d}.txt")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(". ".join(sentences) + ".")
+        paths.append(path)
+    return paths
+
+
+def generate_queries(count: int, seed: int) -> List[str]:
+    """Runs of 4-8 words from the template sentences"""
+    rng = random.Random(seed + 1)
+    templates = load_sentences()
+    queries = []
+    for _ in range(count):
+        words = rng.choice(templates).split()
+        length = min(len(words), rng.randint(4, 8))
+        start = rng.randint(0, len(words) - length)
+        queries.append(" ".join(words[start:start + length]))
+    return queries
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        "p50_ms": round(at(0.5) * 1000, 3),
+        "p95_ms": round(at(0.95) * 1000, 3),
+        "p99_ms": round(at(0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(values) * 1000, 3),
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def directory_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return round(total / 1e6, 1)
+
+
+def run_size(chunks: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Benchmark one corpus size; runs in a fresh process"""
+    data_directory = tempfile.mkdtemp(prefix="rag-bench-")
+    # Settings are read when app modules are imported, so point every data
+    # path at the throwaway directory first
+    os.environ.update({
+        "CHROMA_PERSIST_DIRECTORY": os.path.join(data_directory, "chroma"),
+        "DOCUMENT_CATALOG_PATH": os.path.join(data_directory, "catalog.db"),
+        "EMBEDDING_CACHE_DIRECTORY": os.path.join(data_directory, "embedding_cache"),
+        "UPLOAD_DIRECTORY": os.path.join(data_directory, "uploads"),
+        "TENANTS_DIRECTORY": os.path.join(data_directory, "tenants"),
+        "CHUNK_SIZE": str(options["chunk_size"]),
+        "CHUNK_OVERLAP": str(options["chunk_overlap"]),
+        "ANSWER_CACHE_ENABLED": "false",
+    })
+    try:
+        return asyncio.run(_run_size(chunks, options, data_directory))
+    finally:
+        shutil.rmtree(data_directory, ignore_errors=True)
+
+
+async def _run_size(chunks: int, options: Dict[str, Any], data_directory: str) -> Dict[str, Any]:
+    from app import rag_service as rag_module
+    from app.config import settings
+    from app.document_catalog import DocumentCatalog
+    from app.document_processor import document_processor
+    from app.embeddings import EmbeddingProvider
+    from app.generators import ExtractiveGenerator, Generator
+    from app.rag_service import RAGService
+    from app.tenants import TenantManager, TenantStore
+    from app.vector_db import create_vector_database
+    from benchmarks.stub_openai import stub_embedding
+
+    class StubEmbeddingProvider(EmbeddingProvider):
+        """Deterministic bag-of-words query embeddings after a fixed delay"""
+        name = "stub"
+
+        def embed(self, texts):
+            return [stub_embedding(text, self.dimension) for text in texts]
+
+        async def aembed(self, texts):
+            await asyncio.sleep(options["embedding_latency"])
+            return self.embed(texts)
+
+    class StubGenerator(Generator):
+        """A canned answer after the simulated completion latency"""
+        name = "stub"
+
+        async def generate(self, query, context_chunks, conversation_history=None) -> str:
+            await asyncio.sleep(options["completion_latency"])
+            return STUB_ANSWER
+
+        async def stream(self, query, context_chunks, conversation_history=None) -> AsyncIterator[str]:
+            words = STUB_ANSWER.split(" ")
+            for i, word in enumerate(words):
+                await asyncio.sleep(options["completion_latency"] / len(words))
+                yield word if i == 0 else " " + word
+
+    class StubOpenAIService:
+        """Stands in for OpenAIService: stub embeddings, answers from the current generator"""
+
+        def __init__(self, provider: EmbeddingProvider):
+            self.provider = provider
+            self.generator: Generator = StubGenerator()
+
+        async def generate_embeddings(self, texts, token_counts=None, progress_callback=None):
+            if not texts:
+                return []
+            # Batches are sent concurrently, so a request costs about one round trip
+            await asyncio.sleep(options["embedding_latency"])
+            embeddings = self.provider.embed(texts)
+            if progress_callback:
+                progress_callback(len(texts), len(texts))
+            return embeddings
+
+        async def generate_response(self, query, context_chunks, conversation_history=None) -> str:
+            return await self.generator.generate(query, context_chunks, conversation_history)
+
+        def stream_response(self, query, context_chunks, conversation_history=None) -> AsyncIterator[str]:
+            return self.generator.stream(query, context_chunks, conversation_history)
+
+    provider = StubEmbeddingProvider("stub", options["dimension"])
+    openai_service = StubOpenAIService(provider)
+    rag_module.openai_service = openai_service
+    rag_module.embedding_provider = provider
+
+    # Size documents so that each gives about chunks_per_document chunks,
+    # measured on a probe document since chunks end on sentence boundaries
+    corpus_directory = os.path.join(data_directory, "corpus")
+    os.makedirs(corpus_directory)
+    probe_sentences = 50 * options["chunks_per_document"]
+    probe, = generate_corpus(corpus_directory, 1, probe_sentences, options["seed"])
+    with open(probe, "r", encoding="utf-8") as file:
+        probe_chunks = len(document_processor.split_text(file.read()))
+    os.remove(probe)
+    sentences_per_document = max(1, round(probe_sentences * options["chunks_per_document"] / probe_chunks))
+    document_count = max(1, math.ceil(chunks / options["chunks_per_document"]))
+
+    started = time.perf_counter()
+    paths = generate_corpus(corpus_directory, document_count, sentences_per_document, options["seed"])
+    generation_seconds = time.perf_counter() - started
+    corpus_mb = directory_mb(corpus_directory)
+
+    # Not CHROMA_PERSIST_DIRECTORY: the module-level database already holds
+    # that one with the configured embedding model
+    chroma_directory = os.path.join(data_directory, "index")
+    db = create_vector_database(embedding_provider=provider, persist_directory=chroma_directory)
+    catalog = DocumentCatalog(settings.DOCUMENT_CATALOG_PATH)
+    service = RAGService()
+    service.tenants = TenantManager(lambda tenant_id: TenantStore(tenant_id, db, catalog))
+
+    # Ingest
+    stage_seconds: Dict[str, float] = {}
+    stored_chunks = 0
+    semaphore = asyncio.Semaphore(settings.INGESTION_WORKERS)
+
+    async def ingest(path):
+        nonlocal stored_chunks
+        async with semaphore:
+            response = await service.upload_document(path, os.path.basename(path))
+        stored_chunks += response.chunk_count
+        for stage, seconds in (response.timings or {}).items():
+            stage_seconds[stage] = stage_seconds.get(stage, 0.0) + seconds
+
+    started = time.perf_counter()
+    await asyncio.gather(*(ingest(path) for path in paths))
+    ingest_seconds = time.perf_counter() - started
+    ingest_peak_rss_mb = peak_rss_mb()
+
+    # Index build: merge the lexical index, then reopen and warm the vector database
+    lexical_merge_seconds = None
+    if db.lexical_index is not None:
+        started = time.perf_counter()
+        db.lexical_index.save()
+        lexical_merge_seconds = round(time.perf_counter() - started, 3)
+    db.close()
+    started = time.perf_counter()
+    db = create_vector_database(embedding_provider=provider, persist_directory=chroma_directory)
+    db.warm()
+    load_seconds = time.perf_counter() - started
+    service.tenants = TenantManager(lambda tenant_id: TenantStore(tenant_id, db, catalog))
+
+    # Queries, in each mode: generating with the stub LLM, generating
+    # extractively, and retrieval only
+    queries = generate_queries(options["queries"], options["seed"])
+    generators = {"stub_llm": StubGenerator(), "extractive": ExtractiveGenerator(), "retrieval_only": None}
+    query_results = {}
+    for mode in options["modes"]:
+        retrieval_only = generators[mode] is None
+        openai_service.generator = generators[mode] or StubGenerator()
+        for query in queries[:options["warmup_queries"]]:
+            await service.query_knowledge_base(query, retrieval_only=retrieval_only)
+        totals = []
+        stages: Dict[str, List[float]] = {}
+        for query in queries:
+            response = await service.query_knowledge_base(query, include_timings=True, retrieval_only=retrieval_only)
+            totals.append(response.timings["total"])
+            for stage, seconds in response.timings.items():
+                if stage != "total":
+                    stages.setdefault(stage, []).append(seconds)
+        query_results[mode] = {
+            "count": len(totals),
+            "total": percentiles(totals),
+            "stages": {stage: percentiles(values) for stage, values in sorted(stages.items())},
+        }
+    db.close()
+
+    return {
+        "chunks_target": chunks,
+        "corpus": {
+            "documents": document_count,
+            "chunks": stored_chunks,
+            "megabytes": corpus_mb,
+            "generation_seconds": round(generation_seconds, 3),
+        },
+        "ingest": {
+            "seconds": round(ingest_seconds, 3),
+            "documents_per_second": round(document_count / ingest_seconds, 2),
+            "chunks_per_second": round(stored_chunks / ingest_seconds, 1),
+            "megabytes_per_second": round(corpus_mb / ingest_seconds, 3),
+            "stage_seconds": {stage: round(seconds, 3) for stage, seconds in sorted(stage_seconds.items())},
+        },
+        "index": {
+            "lexical_merge_seconds": lexical_merge_seconds,
+            "load_seconds": round(load_seconds, 3),
+            "disk_megabytes": directory_mb(chroma_directory),
+        },
+        "query": query_results,
+        "memory": {
+            "ingest_peak_rss_mb": ingest_peak_rss_mb,
+            "peak_rss_mb": peak_rss_mb(),
+        },
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__)
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(value: Any, prefix: str = "") -> Dict[str, float]:
+    """Numeric leaves of nested dicts, keyed by dotted path"""
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(flatten(item, f"{prefix}.{key}" if prefix else key))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]):
+    """Print every metric of new next to old, for the sizes both runs have"""
+    print(f"\nComparison: {old.get('commit')} -> {new.get('commit')}")
+    old_results = {result["chunks_target"]: result for result in old["results"]}
+    for result in new["results"]:
+        previous = old_results.get(result["chunks_target"])
+        if previous is None:
+            continue
+        print(f"\n{result['chunks_target']} chunks:")
+        old_flat = flatten(previous)
+        for key, value in flatten(result).items():
+            if key not in old_flat or key == "chunks_target":
+                continue
+            before = old_flat[key]
+            change = f"{(value - before) / before * 100:+.1f}%" if before else "n/a"
+            print(f"  {key:<45} {before:>12} -> {value:<12} {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Corpus sizes in chunks")
+    parser.add_argument("--chunks-per-document", type=int, default=20)
+    parser.add_argument("--chunk-size", type=int, default=256, help="Tokens per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=32)
+    parser.add_argument("--dimension", type=int, default=64, help="Embedding dimension")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--warmup-queries", type=int, default=10)
+    parser.add_argument(
+        "--modes", nargs="+", choices=["stub_llm", "extractive", "retrieval_only"],
+        default=["stub_llm", "extractive", "retrieval_only"], help="Query modes to measure"
+    )
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Seconds per embedding request")
+    parser.add_argument("--completion-latency", type=float, default=0.0, help="Seconds per answer")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare against the results in this JSON file")
+    args = parser.parse_args()
+
+    options = {
+        "chunks_per_document": args.chunks_per_document,
+        "chunk_size": args.chunk_size,
+        "chunk_overlap": args.chunk_overlap,
+        "dimension": args.dimension,
+        "queries": args.queries,
+        "warmup_queries": args.warmup_queries,
+        "modes": args.modes,
+        "embedding_latency": args.embedding_latency,
+        "completion_latency": args.completion_latency,
+        "seed": args.seed,
+    }
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "options": options,
+        "results": [],
+    }
+
+    context = multiprocessing.get_context("spawn")
+    for size in args.sizes:
+        print(f"Running {size:,} chunks...", flush=True)
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            result = pool.submit(run_size, size, options).result()
+        report["results"].append(result)
+        ingest = result["ingest"]
+        print(
+            f"  ingest {result['corpus']['chunks']:,} chunks in {ingest['seconds']}s "
+            f"({ingest['chunks_per_second']} chunks/s); index load {result['index']['load_seconds']}s; "
+            f"peak RSS {result['memory']['peak_rss_mb']} MB",
+            flush=True
+        )
+        for mode, query in result["query"].items():
+            print(f"  query ({mode}): p50 {query['total'].get('p50_ms')} ms, p99 {query['total'].get('p99_ms')} ms")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# The app opens its global stores on import, before any fixture runs; keep them out of the working directory
+SCRATCH_DIRECTORY = tempfile.mkdtemp(prefix="rag-tests-")
+for name, path in {
+    "CHROMA_PERSIST_DIRECTORY": "chroma_db",
+    "DOCUMENT_CATALOG_PATH": "document_catalog.db",
+    "EMBEDDING_CACHE_DIRECTORY": "embedding_cache",
+    "TENANTS_DIRECTORY": "tenants",
+}.items():
+    os.environ[name] = os.path.join(SCRATCH_DIRECTORY, path)
+
+from app.config import settings
+
+@pytest.fixture(autouse=True)
+def isolated_storage(tmp_path, monkeypatch):
+    """Point stores opened from settings during a test at its tmp_path"""
+    monkeypatch.setattr(settings, "CHROMA_PERSIST_DIRECTORY", str(tmp_path / "chroma_db"))
+    monkeypatch.setattr(settings, "DOCUMENT_CATALOG_PATH", str(tmp_path / "document_catalog.db"))
+    monkeypatch.setattr(settings, "EMBEDDING_CACHE_DIRECTORY", str(tmp_path / "embedding_cache"))
+    monkeypatch.setattr(settings, "TENANTS_DIRECTORY", str(tmp_path / "tenants"))
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(SCRATCH_DIRECTORY, ignore_errors=True)
@@ -0,0 +1,40 @@
+import hashlib
+
+from app.embeddings import EmbeddingProvider
+from app.tenants import TenantManager, TenantStore
+
+class FakeEmbeddingProvider(EmbeddingProvider):
+    """Deterministic bag-of-words embeddings for tests"""
+    name = "fake"
+
+    def __init__(self, model_name: str = "fake-model", dimension: int = 16):
+        super().__init__(model_name, dimension)
+        self.calls = 0
+        self.embedded_texts = 0
+
+    def embed(self, texts):
+        self.calls += 1
+        self.embedded_texts += len(texts)
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dimension
+            for word in text.lower().split():
+                vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dimension] += 1.0
+            vectors.append(vector)
+        return vectors
+
+class FakeOpenAIService:
+    """Stands in for openai_service: embeds with a fake provider and echoes the query as the answer"""
+
+    def __init__(self, provider):
+        self.provider = provider
+
+    async def generate_embeddings(self, texts, token_counts=None, progress_callback=None):
+        return self.provider.embed(texts) if texts else []
+
+    async def generate_response(self, query, context_chunks, conversation_history=None):
+        return f"Answer to {query}"
+
+def single_tenant(db, catalog) -> TenantManager:
+    """Tenant manager whose every tenant uses the given vector database and catalog"""
+    return TenantManager(lambda tenant_id: TenantStore(tenant_id, db, catalog, owned=False))
@@ -0,0 +1,50 @@
+import time
+
+from app.answer_cache import AnswerCache
+from app.models import DocumentChunk, QueryResponse
+
+def make_response(query, chunk_ids, document_id="doc-1"):
+    sources = [
+        DocumentChunk(id=chunk_id, document_id=document_id, content="text", metadata={}, chunk_index=i)
+        for i, chunk_id in enumerate(chunk_ids)
+    ]
+    return QueryResponse(query=query, answer=f"answer to {query}", sources=sources, processing_time=1.0)
+
+def test_exact_lookup_normalizes_query():
+    """Case, whitespace and trailing punctuation do not defeat the exact lookup"""
+    cache = AnswerCache(max_entries=10, ttl_seconds=60, similarity_threshold=0.95)
+    cache.store("How do I reset my password?", 5, [1.0, 0.0], make_response("q", ["c1"]))
+
+    assert cache.lookup_exact("how do I  reset my password", 5) is not None
+    assert cache.lookup_exact("how do I reset my password", 3) is None
+
+def test_similar_lookup_requires_matching_sources():
+    """A near-identical embedding only hits when the retrieved chunks match"""
+    cache = AnswerCache(max_entries=10, ttl_seconds=60, similarity_threshold=0.95)
+    cache.store("reset password", 5, [1.0, 0.0], make_response("q", ["c1", "c2"]))
+
+    assert cache.lookup_similar([0.99, 0.05], ["c1", "c2"], 5) is not None
+    assert cache.lookup_similar([0.99, 0.05], ["c1", "c3"], 5) is None
+    assert cache.lookup_similar([0.5, 0.5], ["c1", "c2"], 5) is None
+
+def test_document_change_invalidates_answers():
+    """Answers built from a changed document are dropped"""
+    cache = AnswerCache(max_entries=10, ttl_seconds=60, similarity_threshold=0.95)
+    cache.store("first", 5, [1.0, 0.0], make_response("first", ["a_0"], document_id="a"))
+    cache.store("second", 5, [0.0, 1.0], make_response("second", ["b_0"], document_id="b"))
+
+    assert cache.invalidate_documents(["a"]) == 1
+    assert cache.lookup_exact("first", 5) is None
+    assert cache.lookup_exact("second", 5) is not None
+
+def test_ttl_and_size_eviction():
+    """Entries expire after the TTL and the oldest are evicted over max_entries"""
+    cache = AnswerCache(max_entries=2, ttl_seconds=0.05, similarity_threshold=0.95)
+    for name in ["one", "two", "three"]:
+        cache.store(name, 5, [1.0, 0.0], make_response(name, [name]))
+    assert cache.lookup_exact("one", 5) is None
+    assert cache.get_stats()["evictions"] == 1
+
+    time.sleep(0.06)
+    assert cache.lookup_exact("three", 5) is None
+    assert cache.get_stats()["expirations"] == 1
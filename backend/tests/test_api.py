@@ -1,6 +1,7 @@
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
+from app.config import settings
 
 client = TestClient(app)
 
@@ -48,6 +49,15 @@ def test_query_without_documents():
     assert "sources" in data
     assert len(data["sources"]) == 0
 
+def test_query_retrieval_only():
+    """Retrieval-only queries return sources and no answer, and are not streamed"""
+    response = client.post("/api/query", json={"query": "What is the company policy?", "retrieval_only": True})
+    assert response.status_code == 200
+    assert response.json()["answer"] is None
+
+    response = client.post("/api/query/stream", json={"query": "What is the company policy?", "retrieval_only": True})
+    assert response.status_code == 400
+
 def test_query_empty_string():
     """Test querying with empty string"""
     response = client.post("/api/query", json={
@@ -55,10 +65,53 @@ def test_query_empty_string():
     })
     assert response.status_code == 400
 
+def test_query_stream_without_documents():
+    """Test the streaming query endpoint with no documents uploaded"""
+    response = client.post("/api/query/stream", json={
+        "query": "What is the company policy?"
+    })
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [line.split(": ", 1)[1] for line in response.text.splitlines() if line.startswith("event: ")]
+    assert events == ["sources", "token", "done"]
+
+def test_query_timings_and_metrics():
+    """A query can return its stage breakdown, and stages show up in /api/metrics"""
+    response = client.post("/api/query", json={"query": "What is the company policy?", "include_timings": True})
+    assert response.status_code == 200
+    assert response.json()["timings"]["total"] >= 0
+
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'rag_stage_duration_seconds_count{operation="query",stage="total"}' in response.text
+
+def test_query_batch_without_documents():
+    """Every query of a batch gets its own result, in order"""
+    response = client.post("/api/query/batch", json={
+        "queries": ["What is the company policy?", "Who approves expenses?"]
+    })
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["query"] for result in results] == ["What is the company policy?", "Who approves expenses?"]
+    assert all(result["response"]["sources"] == [] for result in results)
+
+def test_query_batch_limits():
+    """Empty and oversized batches are rejected"""
+    assert client.post("/api/query/batch", json={"queries": []}).status_code == 400
+    too_many = ["question"] * (settings.BATCH_QUERY_MAX_QUERIES + 1)
+    assert client.post("/api/query/batch", json={"queries": too_many}).status_code == 400
+
 def test_upload_invalid_file_type():
     """Test uploading an unsupported file type"""
-    # This would need a mock file for a complete test
-    pass
+    response = client.post("/api/upload", files={"file": ("malware.exe", b"MZ", "application/octet-stream")})
+    assert response.status_code == 400
+    assert "not supported" in response.json()["detail"]
+
+def test_get_unknown_job():
+    """Test polling a job that does not exist"""
+    response = client.get("/api/jobs/does-not-exist")
+    assert response.status_code == 404
 
 # Note: Full integration tests would require OpenAI API key
 # and actual file uploads, which should be in a separate test suite
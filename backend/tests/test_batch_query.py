@@ -0,0 +1,82 @@
+import asyncio
+
+from app import rag_service as rag_module
+from app.document_catalog import DocumentCatalog
+from app.rag_service import RAGService
+from app.vector_db import VectorDatabase
+from fakes import FakeEmbeddingProvider, FakeOpenAIService, single_tenant
+
+async def answer_unless_refund(query, context_chunks, conversation_history=None):
+    if "refund" in query:
+        raise RuntimeError("upstream timeout")
+    return f"Answer to {query}"
+
+def test_batch_shares_embedding_and_reports_errors_per_query(tmp_path, monkeypatch):
+    """Queries are embedded in one call, match single queries, and failures stay per query"""
+    provider = FakeEmbeddingProvider()
+    service_fake = FakeOpenAIService(provider)
+    service_fake.generate_response = answer_unless_refund
+    monkeypatch.setattr(rag_module, "openai_service", service_fake)
+    monkeypatch.setattr(rag_module, "embedding_provider", provider)
+    db = VectorDatabase(embedding_provider=provider, persist_directory=str(tmp_path / "chroma"))
+    catalog = DocumentCatalog(str(tmp_path / "catalog.db"))
+    service = RAGService()
+    service.tenants = single_tenant(db, catalog)
+
+    handbook = tmp_path / "handbook.txt"
+    handbook.write_text(
+        "Vacation days accrue monthly for every employee. " * 20
+        + "Expense reports are approved by the finance team. " * 20
+        + "Refund requests are handled within ten days. " * 20
+    )
+    queries = ["How do vacation days accrue?", "Who approves expense reports?", "When is a refund paid?", " "]
+
+    async def scenario():
+        await service.upload_document(str(handbook), "handbook.txt")
+        calls = provider.calls
+        batch = await service.query_knowledge_base_batch(queries, max_chunks=3, include_timings=True)
+        batch_calls = provider.calls - calls
+        single = await service.query_knowledge_base(queries[0], max_chunks=3)
+        return batch, batch_calls, single
+
+    batch, batch_calls, single = asyncio.run(scenario())
+
+    assert batch_calls == 1
+    assert [result.query for result in batch.results] == queries
+    vacation, expenses, refund, blank = batch.results
+    assert vacation.response.answer == f"Answer to {queries[0]}"
+    assert [chunk.id for chunk in vacation.response.sources] == [chunk.id for chunk in single.sources]
+    assert vacation.response.timings["generate"] >= 0
+    assert expenses.response.sources and expenses.error is None
+    assert refund.response is None and refund.error == "upstream timeout"
+    assert blank.error == "Query cannot be empty"
+    assert {"embed_query", "search", "answer", "total"} <= set(batch.timings)
+
+def test_retrieval_only_returns_ranked_sources_without_generating(tmp_path, monkeypatch):
+    provider = FakeEmbeddingProvider()
+    service_fake = FakeOpenAIService(provider)
+    monkeypatch.setattr(rag_module, "openai_service", service_fake)
+    monkeypatch.setattr(rag_module, "embedding_provider", provider)
+    db = VectorDatabase(embedding_provider=provider, persist_directory=str(tmp_path / "chroma"))
+    catalog = DocumentCatalog(str(tmp_path / "catalog.db"))
+    service = RAGService()
+    service.tenants = single_tenant(db, catalog)
+
+    handbook = tmp_path / "handbook.txt"
+    handbook.write_text("Vacation days accrue monthly for every employee. " * 40)
+
+    async def generate_response(query, context_chunks, conversation_history=None):
+        raise AssertionError("retrieval-only queries must not generate")
+
+    async def scenario():
+        await service.upload_document(str(handbook), "handbook.txt")
+        service_fake.generate_response = generate_response
+        single = await service.query_knowledge_base("vacation days", max_chunks=2, retrieval_only=True)
+        batch = await service.query_knowledge_base_batch(["vacation days"], max_chunks=2, retrieval_only=True)
+        return single, batch
+
+    single, batch = asyncio.run(scenario())
+
+    assert single.answer is None
+    assert single.sources and single.sources[0].distance is not None
+    assert [chunk.id for chunk in batch.results[0].response.sources] == [chunk.id for chunk in single.sources]
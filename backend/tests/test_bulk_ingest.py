@@ -0,0 +1,52 @@
+import asyncio
+
+from app.bulk_ingest import ingest_directory
+from app.document_catalog import DocumentCatalog
+from app.tenants import TenantStore
+from app.vector_db import VectorDatabase
+from fakes import FakeEmbeddingProvider
+
+def make_store(tmp_path):
+    provider = FakeEmbeddingProvider()
+    db = VectorDatabase(embedding_provider=provider, persist_directory=str(tmp_path / "chroma"))
+    store = TenantStore("default", db, DocumentCatalog(str(tmp_path / "catalog.db")))
+    embedded = []
+
+    async def embed(texts, token_counts):
+        embedded.append(len(texts))
+        return provider.embed(texts)
+
+    return store, embed, embedded
+
+def write_corpus(directory):
+    (directory / "nested").mkdir(parents=True)
+    (directory / "policy.txt").write_text(". ".join(f"Policy rule {i} applies to team {i % 7}" for i in range(300)))
+    (directory / "faq.md").write_text("# FAQ\n\nHow do I reset my password? Use the portal.")
+    (directory / "nested" / "notes.txt").write_text("Meeting notes about the quarterly roadmap.")
+    (directory / "nested" / "policy-copy.txt").write_text((directory / "policy.txt").read_text())
+    (directory / "image.png").write_bytes(b"not a document")
+
+def test_bulk_ingest_stores_each_file_once_and_resumes(tmp_path):
+    """Files are chunked in worker processes, stored in batches and skipped on a rerun"""
+    corpus = tmp_path / "corpus"
+    write_corpus(corpus)
+    store, embed, embedded = make_store(tmp_path)
+    manifest = str(tmp_path / "manifest.jsonl")
+
+    summary = asyncio.run(ingest_directory(str(corpus), store, embed, manifest, workers=1, batch_chunks=5))
+    report = summary.report()
+
+    assert (report["documents"], report["duplicates"], report["failed"]) == (3, 1, 0)
+    assert store.vector_db.chunk_count == store.catalog.total_chunks() == report["chunks"]
+    assert report["chunks_per_sec"] > 0 and report["mb_per_sec"] > 0
+    assert store.vector_db.lexical_search("quarterly roadmap", 1)
+
+    again = asyncio.run(ingest_directory(str(corpus), store, embed, manifest, workers=1))
+    assert (again.documents, again.skipped) == (0, 4)
+
+    # Without the manifest, chunks already stored are not embedded or added again
+    embedded.clear()
+    rebuilt = asyncio.run(ingest_directory(str(corpus), store, embed, str(tmp_path / "new.jsonl"), workers=1))
+    assert rebuilt.documents == 3
+    assert sum(embedded) == 0
+    assert store.vector_db.get_document_count() == report["chunks"]
@@ -0,0 +1,60 @@
+from app.context_builder import ContextBuilder
+from app.document_processor import DocumentProcessor
+from app.models import DocumentChunk
+
+def chunks_of(text, document_id="doc", chunk_size=60, overlap=20):
+    """Chunk text with the real chunker, as stored at ingestion"""
+    processor = DocumentProcessor()
+    return [
+        DocumentChunk(
+            id=f"{document_id}_{i}",
+            document_id=document_id,
+            content=chunk.text,
+            metadata={
+                "token_count": chunk.token_count,
+                "start_char": chunk.start_char,
+                "end_char": chunk.end_char,
+            },
+            chunk_index=i
+        )
+        for i, chunk in enumerate(processor.split_text(text, chunk_size=chunk_size, overlap=overlap))
+    ]
+
+TEXT = " ".join(f"Sentence number {i} talks about topic {i * 7 % 13}." for i in range(40))
+
+def test_adjacent_chunks_merge_without_overlap():
+    """Consecutive chunks become one passage that reads like the source text"""
+    chunks = chunks_of(TEXT)
+    assert len(chunks) > 3
+
+    context = ContextBuilder(token_budget=10_000, duplicate_threshold=0.9).build([chunks[2], chunks[1], chunks[3]])
+
+    assert len(context.passages) == 1
+    source_span = TEXT[chunks[1].metadata["start_char"]:chunks[3].metadata["end_char"]]
+    assert context.passages[0] == source_span
+    assert [chunk.id for chunk in context.sources] == [chunks[1].id, chunks[2].id, chunks[3].id]
+    assert context.token_count < sum(chunk.metadata["token_count"] for chunk in chunks[1:4])
+
+def test_near_duplicates_are_dropped():
+    """A passage repeating one already in the context is skipped"""
+    original = chunks_of(TEXT, "a")[0]
+    copy = original.model_copy(update={"id": "b_0", "document_id": "b"})
+    other = chunks_of("Completely different words about databases and indexes.", "c")[0]
+
+    context = ContextBuilder(token_budget=10_000, duplicate_threshold=0.8).build([original, copy, other])
+
+    assert [chunk.id for chunk in context.sources] == [original.id, other.id]
+
+def test_token_budget_is_respected_in_relevance_order():
+    """Passages are packed best first and those that do not fit are left out"""
+    chunks = [chunks_of(TEXT, f"doc{i}")[i] for i in range(4)]
+    budget = chunks[0].metadata["token_count"] + chunks[1].metadata["token_count"]
+
+    context = ContextBuilder(token_budget=budget, duplicate_threshold=0.9).build(chunks)
+
+    assert [chunk.id for chunk in context.sources] == [chunks[0].id, chunks[1].id]
+    assert context.token_count <= budget
+
+    oversized = ContextBuilder(token_budget=10, duplicate_threshold=0.9).build(chunks[:1])
+    assert oversized.token_count == 10
+    assert len(oversized.passages[0]) < len(chunks[0].content)
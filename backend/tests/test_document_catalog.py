@@ -0,0 +1,87 @@
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.document_catalog import DocumentCatalog
+from app.models import Document
+
+def make_document(i, file_type="pdf", days_ago=0):
+    return Document(
+        id=f"doc-{i}",
+        filename=f"file-{i}.{file_type}",
+        original_filename=f"file-{i}.{file_type}",
+        file_type=file_type,
+        upload_date=datetime(2024, 1, 31) - timedelta(days=days_ago),
+        chunk_count=i + 1,
+        size_bytes=100 * i,
+        content_hash=f"hash-{i}"
+    )
+
+def test_catalog_pagination_and_filters(tmp_path):
+    """list pages newest first and filters by type and upload date"""
+    catalog = DocumentCatalog(str(tmp_path / "catalog.db"))
+    for i in range(10):
+        catalog.upsert(make_document(i, "pdf" if i % 2 else "md", days_ago=i))
+
+    page, total = catalog.list(limit=3, offset=0)
+    assert total == 10
+    assert [document.id for document in page] == ["doc-0", "doc-1", "doc-2"]
+
+    page, total = catalog.list(limit=3, offset=3, file_type="pdf")
+    assert total == 5
+    assert [document.id for document in page] == ["doc-7", "doc-9"]
+
+    page, total = catalog.list(uploaded_after=datetime(2024, 1, 29))
+    assert total == 3
+
+def test_catalog_list_converts_aware_dates_to_local_time(tmp_path, monkeypatch):
+    """Timezone-aware bounds are compared in local time, as upload dates are stored"""
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        catalog = DocumentCatalog(str(tmp_path / "catalog.db"))
+        for i in range(10):
+            catalog.upsert(make_document(i, days_ago=i))
+        # Midnight on January 29th in New York
+        _, total = catalog.list(uploaded_after=datetime(2024, 1, 29, 5, tzinfo=timezone.utc))
+        assert total == 3
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+def test_catalog_persists_and_deletes(tmp_path):
+    """Rows survive reopening the catalog and can be deleted"""
+    path = str(tmp_path / "catalog.db")
+    DocumentCatalog(path).upsert(make_document(1))
+
+    catalog = DocumentCatalog(path)
+    assert catalog.get("doc-1").content_hash == "hash-1"
+    assert catalog.find_by_hash("hash-1")[0].id == "doc-1"
+    assert catalog.get_stats() == {"total_documents": 1, "total_chunks": 2, "document_types": ["pdf"]}
+
+    assert catalog.delete("doc-1")
+    assert not catalog.delete("doc-1")
+    assert catalog.get("doc-1") is None
+
+def test_catalog_replace_all(tmp_path):
+    """replace_all swaps the catalog contents in one transaction"""
+    catalog = DocumentCatalog(str(tmp_path / "catalog.db"))
+    catalog.upsert(make_document(1))
+    catalog.replace_all([make_document(2), make_document(3)])
+    assert sorted(document.id for document in catalog.list()[0]) == ["doc-2", "doc-3"]
+
+def test_catalog_upsert_many_is_all_or_nothing(tmp_path, monkeypatch):
+    """A batch with a bad row leaves none of its rows behind"""
+    catalog = DocumentCatalog(str(tmp_path / "catalog.db"))
+    catalog.upsert_many([make_document(1), make_document(2)])
+    assert catalog.list()[1] == 2
+
+    to_row = DocumentCatalog._to_row
+    monkeypatch.setattr(DocumentCatalog, "_to_row", staticmethod(
+        lambda document: (document.id, None) + to_row(document)[2:] if document.id == "doc-4" else to_row(document)
+    ))
+    with pytest.raises(sqlite3.IntegrityError):
+        catalog.upsert_many([make_document(3), make_document(4)])
+    assert catalog.get("doc-3") is None and catalog.list()[1] == 2
@@ -0,0 +1,87 @@
+import random
+
+from app import concurrency
+from app.config import settings
+from app.document_processor import DocumentProcessor
+from benchmarks.bench_pdf_extraction import write_synthetic_pdf
+
+processor = DocumentProcessor()
+
+SAMPLE_TEXT = " ".join(
+    f"Sentence number {i} describes a policy detail about topic {i % 7}." for i in range(300)
+)
+
+def test_chunks_respect_chunk_size():
+    """Every chunk fits in the token budget"""
+    chunks = processor.split_text(SAMPLE_TEXT, chunk_size=100, overlap=20)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.token_count <= 100
+        assert abs(processor.count_tokens(chunk.text) - chunk.token_count) <= 2
+
+def test_chunk_offsets_match_source():
+    """Character offsets point back at the chunk text in the source"""
+    for chunk in processor.split_text(SAMPLE_TEXT, chunk_size=100, overlap=20):
+        assert SAMPLE_TEXT[chunk.start_char:chunk.end_char] == chunk.text
+
+def test_chunks_overlap_and_cover_text():
+    """Consecutive chunks overlap and together cover the whole text"""
+    chunks = processor.split_text(SAMPLE_TEXT, chunk_size=100, overlap=20)
+    assert chunks[0].start_char == 0
+    assert chunks[-1].end_char == len(SAMPLE_TEXT)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.start_char < previous.end_char
+        assert current.start_char > previous.start_char
+
+def test_long_sentence_is_split():
+    """A sentence longer than the chunk size is split on token boundaries"""
+    text = "word " * 500
+    chunks = processor.split_text(text, chunk_size=100, overlap=10)
+    assert len(chunks) > 1
+    assert all(chunk.token_count <= 100 for chunk in chunks)
+
+def test_chunk_text_returns_strings():
+    """chunk_text keeps its original list-of-strings interface"""
+    chunks = processor.chunk_text("First sentence. Second sentence. Third sentence.")
+    assert chunks == ["First sentence. Second sentence. Third sentence."]
+    assert processor.chunk_text("   ") == []
+
+def test_streamed_segments_chunk_like_the_whole_text():
+    """Chunking text in segments gives the chunks of the concatenated text, whatever the cuts"""
+    expected = processor.split_text(SAMPLE_TEXT, chunk_size=60, overlap=15)
+    rng = random.Random(7)
+    for _ in range(5):
+        cuts = sorted(rng.sample(range(len(SAMPLE_TEXT)), 40))
+        # Also cut between the period and the space of a sentence delimiter
+        cuts.append(SAMPLE_TEXT.index(". ", 5000) + 1)
+        edges = [0] + sorted(set(cuts)) + [len(SAMPLE_TEXT)]
+        segments = [(None, SAMPLE_TEXT[a:b]) for a, b in zip(edges, edges[1:])]
+        assert list(processor.split_segments(segments, chunk_size=60, overlap=15)) == expected
+
+def test_chunks_record_their_pages():
+    """Chunks from paged sources carry the pages of their first and last characters"""
+    pages = [(page, f"Page {page} opens here. It says something about topic {page}. ") for page in range(1, 6)]
+    chunks = list(processor.split_segments(pages, chunk_size=20, overlap=0))
+    page_length = len(pages[0][1])
+    for chunk in chunks:
+        assert chunk.page_start == chunk.start_char // page_length + 1
+        assert chunk.page_end == (chunk.end_char - 1) // page_length + 1
+    assert any(chunk.page_start != chunk.page_end for chunk in chunks)
+    assert chunks[0].page_start == 1 and chunks[-1].page_end == 5
+
+def test_parallel_pdf_extraction_matches_serial(tmp_path, monkeypatch):
+    """Pages extracted across worker processes come back complete and in order"""
+    path = str(tmp_path / "manual.pdf")
+    write_synthetic_pdf(path, pages=20, lines_per_page=5)
+    monkeypatch.setattr(settings, "EXTRACTION_PROCESSES", 1)
+    serial = list(processor.extract_segments(path, "pdf"))
+
+    monkeypatch.setattr(settings, "EXTRACTION_PROCESSES", 2)
+    monkeypatch.setattr(settings, "PDF_PARALLEL_MIN_PAGES", 10)
+    try:
+        parallel = list(processor.extract_segments(path, "pdf"))
+    finally:
+        concurrency.shutdown_process_pool()
+
+    assert [page for page, _ in serial] == list(range(1, 21))
+    assert parallel == serial
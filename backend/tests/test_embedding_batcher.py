@@ -0,0 +1,41 @@
+import asyncio
+
+from app.embedding_batcher import EmbeddingBatcher
+from fakes import FakeEmbeddingProvider
+
+class TransientError(Exception):
+    pass
+
+class FlakyProvider(FakeEmbeddingProvider):
+    """Fails the first call of every batch with a retryable error"""
+    retryable_errors = (TransientError,)
+
+    def __init__(self):
+        super().__init__()
+        self.seen = set()
+
+    async def aembed(self, texts):
+        if texts[0] not in self.seen:
+            self.seen.add(texts[0])
+            raise TransientError("rate limited")
+        await asyncio.sleep(0.001 * len(texts))
+        return self.embed(texts)
+
+def test_pack_respects_token_and_item_budgets():
+    """Batches stay within the token budget and keep input order"""
+    batcher = EmbeddingBatcher(FakeEmbeddingProvider(), max_batch_tokens=100, max_batch_items=3)
+    batches = batcher.pack([40, 40, 40, 10, 10, 10, 10, 250, 5])
+    assert batches == [[0, 1], [2, 3, 4], [5, 6], [7], [8]]
+
+def test_embed_reassembles_in_order_with_retries():
+    """Concurrent, retried batches come back in input order with progress reports"""
+    provider = FlakyProvider()
+    batcher = EmbeddingBatcher(provider, max_batch_tokens=30, max_parallel=3, retry_backoff=0.001)
+    texts = [f"text number {i}" for i in range(20)]
+    progress = []
+
+    embeddings = asyncio.run(batcher.embed(texts, [10] * 20, lambda done, total: progress.append((done, total))))
+
+    assert embeddings == FakeEmbeddingProvider().embed(texts)
+    assert progress[-1] == (20, 20)
+    assert len(progress) == 7
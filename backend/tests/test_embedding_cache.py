@@ -0,0 +1,59 @@
+import asyncio
+import threading
+
+from app.embedding_cache import EmbeddingCache
+from app.embeddings import CachedEmbeddingProvider
+from fakes import FakeEmbeddingProvider
+
+def test_cached_provider_embeds_each_text_once(tmp_path):
+    """Repeated and whitespace-variant texts are served from the cache"""
+    provider = FakeEmbeddingProvider()
+    cached = CachedEmbeddingProvider(provider, EmbeddingCache(str(tmp_path), "fake-model", 1 << 20))
+
+    first = cached.embed(["alpha beta", "gamma", "alpha beta"])
+    assert provider.embedded_texts == 2
+
+    second = cached.embed(["alpha  beta\n", "gamma", "delta"])
+    assert provider.embedded_texts == 3
+    assert second[:2] == first[:2]
+
+    stats = cached.cache.get_stats()
+    assert stats["misses"] == 4
+    assert stats["memory_hits"] == 2
+
+def test_lru_tier_respects_byte_budget(tmp_path):
+    """The in-memory tier evicts least recently used vectors over budget"""
+    cache = EmbeddingCache(str(tmp_path), "fake-model", 3 * (16 * 4 + 200))
+    cache.put_many([f"text {i}" for i in range(5)], [[float(i)] * 16 for i in range(5)])
+
+    stats = cache.get_stats()
+    assert stats["memory_entries"] == 3
+    assert stats["evictions"] == 2
+    assert stats["disk_entries"] == 5
+
+    # Evicted entries are still served from the disk tier
+    assert cache.get_many(["text 0"])[0] == [0.0] * 16
+    assert cache.get_stats()["disk_hits"] == 1
+
+def test_disk_tier_survives_restart(tmp_path):
+    """Vectors written by one cache instance are read back by the next"""
+    EmbeddingCache(str(tmp_path), "fake-model", 1 << 20).put_many(["persisted"], [[1.5] * 16])
+
+    reopened = EmbeddingCache(str(tmp_path), "fake-model", 1 << 20)
+    assert reopened.get_many(["persisted", "unknown"]) == [[1.5] * 16, None]
+
+def test_async_embedding_keeps_cache_io_off_the_event_loop(tmp_path, monkeypatch):
+    """Cache lookups and stores of aembed run in the worker pool, not on the event loop thread"""
+    cached = CachedEmbeddingProvider(FakeEmbeddingProvider(), EmbeddingCache(str(tmp_path), "fake-model", 1 << 20))
+    threads = []
+    for name in ("get_many", "put_many"):
+        method = getattr(cached.cache, name)
+        monkeypatch.setattr(cached.cache, name, lambda *args, method=method: threads.append(
+            threading.get_ident()) or method(*args))
+
+    async def embed_twice():
+        return await cached.aembed(["alpha", "beta"]), await cached.aembed(["alpha"]), threading.get_ident()
+
+    first, second, loop_thread = asyncio.run(embed_twice())
+    assert second == first[:1]
+    assert len(threads) == 3 and loop_thread not in threads
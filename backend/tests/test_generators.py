@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from app.generators import ExtractiveGenerator, OpenAIGenerator, create_generator
+
+PASSAGES = [
+    "Employees accrue 1.5 vacation days per month. Unused days expire in March.",
+    "Expense reports are approved by the finance team within five business days.",
+]
+
+def test_extractive_generator_cites_the_best_matching_sentences():
+    generator = ExtractiveGenerator(max_sentences=1)
+    answer = asyncio.run(generator.generate("Who approves expense reports?", PASSAGES))
+    assert answer == "Expense reports are approved by the finance team within five business days. (Source 2)"
+
+    # Sentences are returned in context order
+    answer = ExtractiveGenerator(max_sentences=2).extract("When do vacation days expire?", PASSAGES)
+    assert answer == (
+        "Employees accrue 1.5 vacation days per month. (Source 1) Unused days expire in March. (Source 1)"
+    )
+
+def test_extractive_generator_falls_back_to_the_top_passage():
+    answer = ExtractiveGenerator().extract("What is the parking policy?", PASSAGES)
+    assert answer == "Employees accrue 1.5 vacation days per month. (Source 1)"
+    assert ExtractiveGenerator().extract("anything", []) == ""
+
+def test_create_generator():
+    assert isinstance(create_generator("extractive"), ExtractiveGenerator)
+    assert isinstance(create_generator("openai"), OpenAIGenerator)
+    with pytest.raises(ValueError):
+        create_generator("gpt-local")
+
+def test_extractive_generator_splits_paragraphs():
+    passage = "## Remote Work\n\nEmployees may work remotely two days a week\n\n## Equipment\n\nLaptops are provided"
+    answer = ExtractiveGenerator(max_sentences=1).extract("How often can I work remotely?", [passage])
+    assert answer == "Employees may work remotely two days a week (Source 1)"
@@ -0,0 +1,71 @@
+import asyncio
+
+from app import rag_service as rag_module
+from app.config import settings
+from app.document_catalog import DocumentCatalog
+from app.document_processor import chunk_ids
+from app.rag_service import RAGService
+from app.vector_db import VectorDatabase
+from fakes import FakeEmbeddingProvider, FakeOpenAIService, single_tenant
+
+def make_service(tmp_path, monkeypatch):
+    provider = FakeEmbeddingProvider()
+    db = VectorDatabase(embedding_provider=provider, persist_directory=str(tmp_path / "chroma"))
+    monkeypatch.setattr(rag_module, "openai_service", FakeOpenAIService(provider))
+    catalog = DocumentCatalog(str(tmp_path / "catalog.db"))
+    service = RAGService()
+    service.tenants = single_tenant(db, catalog)
+    return service, provider, db, catalog
+
+def write_manual(path, edited_section=None):
+    sections = []
+    for section in range(40):
+        words = f"edited wording for section {section}" if section == edited_section else f"section {section}"
+        sections.append(". ".join(f"{words} sentence {i} about topic {section * 7 + i}" for i in range(60)))
+    path.write_text(". ".join(sections))
+
+def test_chunk_ids_are_stable_and_unique():
+    """IDs come from content hashes, with occurrence numbers for repeats"""
+    metadatas = [{"chunk_hash": "a" * 64}, {"chunk_hash": "b" * 64}, {"chunk_hash": "a" * 64}]
+    assert chunk_ids("doc", metadatas) == [f"doc_{'a' * 16}", f"doc_{'b' * 16}", f"doc_{'a' * 16}_1"]
+
+def test_replacing_a_document_only_embeds_changed_chunks(tmp_path, monkeypatch):
+    """Editing one section re-embeds a few chunks and keeps the document identity"""
+    service, provider, db, catalog = make_service(tmp_path, monkeypatch)
+    # Read the file in several batches
+    monkeypatch.setattr(settings, "INGEST_BATCH_CHUNKS", 4)
+    manual = tmp_path / "manual.txt"
+    write_manual(manual)
+    first = asyncio.run(service.upload_document(str(manual), "manual.txt"))
+    assert first.chunks_added == first.chunk_count > 10
+    assert {"extract", "chunk", "embed", "store", "total"} <= set(first.timings)
+    upload_date = catalog.get(first.document_id).upload_date
+
+    write_manual(manual, edited_section=20)
+    embedded = provider.embedded_texts
+    second = asyncio.run(service.upload_document(str(manual), "manual.txt", document_id=first.document_id))
+
+    assert second.document_id == first.document_id
+    assert 0 < second.chunks_added <= 5
+    assert second.chunks_removed == second.chunks_added
+    assert provider.embedded_texts - embedded == second.chunks_added
+    assert db.get_document_count() == second.chunk_count
+
+    document = catalog.get(first.document_id)
+    assert document.upload_date == upload_date
+    stored = db.get_document_chunks(first.document_id)
+    assert sorted(metadata["chunk_index"] for metadata in stored.values()) == list(range(second.chunk_count))
+    first_chunk = next(metadata for metadata in stored.values() if metadata["chunk_index"] == 0)
+    assert first_chunk["chunk_count"] == second.chunk_count
+
+def test_reuploading_identical_content_is_a_no_op(tmp_path, monkeypatch):
+    """The same file under the same document ID is skipped by its content hash"""
+    service, provider, db, catalog = make_service(tmp_path, monkeypatch)
+    manual = tmp_path / "manual.txt"
+    write_manual(manual)
+    first = asyncio.run(service.upload_document(str(manual), "manual.txt"))
+    embedded = provider.embedded_texts
+
+    again = asyncio.run(service.upload_document(str(manual), "manual.txt", document_id=first.document_id))
+    assert again.message == "Document unchanged"
+    assert provider.embedded_texts == embedded
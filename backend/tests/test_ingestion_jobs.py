@@ -0,0 +1,112 @@
+import os
+import asyncio
+from datetime import datetime
+
+from app import ingestion_jobs as jobs_module
+from app.ingestion_jobs import IngestionJobManager, JobStore
+from app.models import IngestionJob, UploadResponse
+from app.tenants import current_tenant
+from app.upload_spool import SpooledUpload
+
+class FakeRAGService:
+    """Records calls and reports stages and progress like RAGService.upload_document"""
+
+    def __init__(self):
+        self.uploads = []
+        self.tenants = []
+
+    async def upload_document(self, file_path, filename, progress_callback=None,
+                              content_hash=None, document_id=None, stage_callback=None):
+        self.uploads.append(document_id)
+        self.tenants.append(current_tenant.get())
+        stage_callback("embedding")
+        progress_callback(2, 4)
+        progress_callback(4, 4)
+        stage_callback("storing")
+        return UploadResponse(document_id=document_id, filename=filename, chunk_count=4, message="ok")
+
+def spool(tmp_path, name="notes.txt"):
+    path = tmp_path / f"upload-1.{name.split('.')[-1]}"
+    path.write_text("some text")
+    return SpooledUpload("upload-1", name, "txt", str(path), 9, "hash")
+
+async def run_until_idle(manager, action=None):
+    await manager.start()
+    result = await action() if action else None
+    await manager._queue.join()
+    await manager.stop()
+    return result
+
+def test_job_runs_to_completion(tmp_path, monkeypatch):
+    """A submitted job reports completion, full progress and removes its spool file"""
+    rag = FakeRAGService()
+    monkeypatch.setattr(jobs_module, "rag_service", rag)
+    manager = IngestionJobManager(JobStore(str(tmp_path / "jobs.db")), max_workers=2)
+    upload = spool(tmp_path)
+
+    job = asyncio.run(run_until_idle(manager, lambda: manager.submit(upload)))
+
+    stored = manager.store.get(job.id)
+    assert stored.stage == "completed"
+    assert stored.progress == 1.0 and stored.chunks_embedded == stored.chunks_total == 4
+    assert rag.uploads == [job.document_id]
+    assert not os.path.exists(upload.path)
+
+def test_unfinished_job_resumes_idempotently(tmp_path, monkeypatch):
+    """A job interrupted mid-run is re-queued on start under the same document ID"""
+    rag = FakeRAGService()
+    monkeypatch.setattr(jobs_module, "rag_service", rag)
+    store = JobStore(str(tmp_path / "jobs.db"))
+    upload = spool(tmp_path)
+    now = datetime.now()
+    store.save(IngestionJob(
+        id="upload-1", document_id="doc-1", filename=upload.filename, file_path=upload.path,
+        stage="embedding", size_bytes=9, content_hash="hash", attempts=1,
+        created_at=now, updated_at=now
+    ))
+
+    manager = IngestionJobManager(store, max_workers=1)
+    asyncio.run(run_until_idle(manager))
+
+    assert rag.uploads == ["doc-1"]
+    job = store.get("upload-1")
+    assert job.stage == "completed" and job.attempts == 2
+
+def test_job_gives_up_after_max_attempts(tmp_path, monkeypatch):
+    """A job that keeps interrupting the process is failed instead of retried forever"""
+    rag = FakeRAGService()
+    monkeypatch.setattr(jobs_module, "rag_service", rag)
+    store = JobStore(str(tmp_path / "jobs.db"))
+    upload = spool(tmp_path)
+    now = datetime.now()
+    store.save(IngestionJob(
+        id="upload-1", document_id="doc-1", filename=upload.filename, file_path=upload.path,
+        stage="processing", size_bytes=9, content_hash="hash", attempts=3,
+        created_at=now, updated_at=now
+    ))
+
+    manager = IngestionJobManager(store, max_workers=1, max_attempts=3)
+    asyncio.run(run_until_idle(manager))
+
+    assert rag.uploads == []
+    assert store.get("upload-1").stage == "failed"
+
+def test_jobs_run_as_their_tenant(tmp_path, monkeypatch):
+    """A job ingests into the tenant that submitted it and is only visible to that tenant"""
+    rag = FakeRAGService()
+    monkeypatch.setattr(jobs_module, "rag_service", rag)
+    manager = IngestionJobManager(JobStore(str(tmp_path / "jobs.db")), max_workers=1)
+
+    async def scenario():
+        token = current_tenant.set("acme")
+        try:
+            job = await manager.submit(spool(tmp_path))
+        finally:
+            current_tenant.reset(token)
+        return job, await manager.get(job.id)
+
+    job, seen_by_default = asyncio.run(run_until_idle(manager, scenario))
+
+    assert rag.tenants == ["acme"]
+    assert manager.store.get(job.id).tenant_id == "acme"
+    assert seen_by_default is None
@@ -0,0 +1,72 @@
+import shutil
+
+from app.lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+from app.vector_db import VectorDatabase, LEXICAL_INDEX_DIRECTORY
+from fakes import FakeEmbeddingProvider
+
+CHUNKS = {
+    "c1": "POST /api/query answers a question from the knowledge base",
+    "c2": "Error ERR-404 means the document was not found",
+    "c3": "The vacation policy grants twenty days of paid leave",
+    "c4": "Remote work is allowed two days a week under the policy",
+}
+
+def build(directory, **kwargs):
+    index = LexicalIndex(str(directory), **kwargs)
+    index.add(list(CHUNKS), list(CHUNKS.values()))
+    return index
+
+def test_tokenize_keeps_identifiers():
+    """Identifiers are indexed whole and by their parts"""
+    terms = tokenize("Call POST /api/query or see ERR-404 for user_id")
+    assert "api/query" in terms and "api" in terms and "query" in terms
+    assert "err-404" in terms and "404" in terms
+    assert "user_id" in terms and "user" in terms
+
+def test_search_ranks_exact_identifiers_first(tmp_path):
+    """BM25 puts the chunk containing the identifier first"""
+    index = build(tmp_path)
+    assert index.search("what does ERR-404 mean", 2)[0][0] == "c2"
+    assert index.search("/api/query", 1)[0][0] == "c1"
+    assert [chunk_id for chunk_id, _ in index.search("policy days", 2)] in (["c3", "c4"], ["c4", "c3"])
+
+def test_common_terms_only_rescore_candidates(tmp_path):
+    """Terms over the scan limit are probed for existing candidates instead of scanned"""
+    index = build(tmp_path, max_scan_postings=1)
+    hits = index.search("the vacation policy", 4)
+    assert hits[0][0] == "c3"
+    assert {chunk_id for chunk_id, _ in hits} <= {"c3", "c4"}
+
+def test_deletes_and_persistence(tmp_path):
+    """Deleted chunks disappear and the index reloads from its snapshot and log"""
+    index = build(tmp_path, merge_min_postings=1)
+    index.delete(["c2"])
+    index.add(["c5"], ["Rate limits return ERR-429 after 100 requests"])
+    assert "c2" not in [chunk_id for chunk_id, _ in index.search("ERR-404", 5)]
+    index.close()
+
+    reloaded = LexicalIndex(str(tmp_path))
+    assert reloaded.live_count == 4
+    assert "c2" not in [chunk_id for chunk_id, _ in reloaded.search("ERR-404", 5)]
+    assert reloaded.search("ERR-429", 5)[0][0] == "c5"
+    assert reloaded.get_stats()["tombstones"] == 0
+    # Saving with nothing new to merge rewrites the same snapshot
+    reloaded.save()
+    assert reloaded.search("ERR-429", 5)[0][0] == "c5"
+
+def test_reciprocal_rank_fusion_weights():
+    """Items ranked well by both lists win; weights tilt the ties"""
+    assert reciprocal_rank_fusion([["a", "b"], ["b", "c"]], [1.0, 1.0])[0] == "b"
+    assert reciprocal_rank_fusion([["a"], ["c"]], [1.0, 2.0]) == ["c", "a"]
+
+def test_vector_db_rebuilds_missing_lexical_index(tmp_path):
+    """A lexical index out of step with the collection is rebuilt on startup"""
+    provider = FakeEmbeddingProvider()
+    db = VectorDatabase(embedding_provider=provider, persist_directory=str(tmp_path))
+    db.add_documents(list(CHUNKS.values()), [{"document_id": "d"}] * 4, list(CHUNKS))
+    db.lexical_index.close()
+    shutil.rmtree(tmp_path / LEXICAL_INDEX_DIRECTORY)
+
+    reopened = VectorDatabase(embedding_provider=provider, persist_directory=str(tmp_path))
+    assert reopened.lexical_index.live_count == 4
+    assert reopened.lexical_search("ERR-404", 1)[0][0] == "c2"
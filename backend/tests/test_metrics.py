@@ -0,0 +1,38 @@
+from app.metrics import Histogram, Metrics, RequestTrace, timed_iter
+
+def test_histogram_buckets_are_inclusive_upper_bounds():
+    """Values land in the first bucket whose bound is at least the value"""
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    counts, total, count = histogram.snapshot()
+    assert counts == [2, 1, 1]
+    assert count == 4 and abs(total - 3.65) < 1e-9
+
+def test_traces_are_recorded_once_per_request():
+    """A stage timed several times in a request adds up to one observation"""
+    metrics = Metrics()
+    trace = RequestTrace()
+    with trace.stage("search"):
+        pass
+    trace.add("search", 0.2)
+    metrics.record("query", trace)
+    metrics.record("query", RequestTrace())
+    metrics.observe("upload", "embed", 1.5)
+
+    assert set(trace.as_dict()) == {"search"}
+    assert trace.stages["search"] >= 0.2
+
+    text = metrics.render_prometheus()
+    assert "# TYPE rag_stage_duration_seconds histogram" in text
+    assert 'rag_stage_duration_seconds_bucket{operation="query",stage="search",le="0.25"} 1' in text
+    assert 'rag_stage_duration_seconds_count{operation="query",stage="search"} 1' in text
+    assert 'rag_stage_duration_seconds_bucket{operation="upload",stage="embed",le="1.0"} 0' in text
+    assert 'rag_stage_duration_seconds_bucket{operation="upload",stage="embed",le="+Inf"} 1' in text
+    assert 'rag_stage_duration_seconds_count{operation="upload",stage="embed"} 1' in text
+
+def test_timed_iter_accumulates_production_time():
+    """timed_iter passes items through and adds up the time spent producing them"""
+    timings = {}
+    assert list(timed_iter(range(3), timings, "extract")) == [0, 1, 2]
+    assert timings["extract"] >= 0
@@ -0,0 +1,193 @@
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.embeddings import EmbeddingConfigurationError
+from app.models import QueryFilters
+from app.quantized_index import QuantizedIndex
+from app.quantized_vector_db import QuantizedVectorDatabase
+from fakes import FakeEmbeddingProvider
+
+def clustered_vectors(count, dimension=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension))
+    vectors = centers[rng.integers(clusters, size=count)] + 0.4 * rng.normal(size=(count, dimension))
+    return vectors.astype(np.float32)
+
+def exact_top(vectors, query, n):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return list(np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:n])
+
+def recall(index, vectors, queries, n=10):
+    found = sum(
+        len({row for row, _ in index.search(query, n)} & set(exact_top(vectors, query, n)))
+        for query in queries
+    )
+    return found / (n * len(queries))
+
+@pytest.mark.parametrize("quantization", ["int8", "pq"])
+def test_rescored_search_recalls_the_exact_neighbours(tmp_path, quantization):
+    """Scanning codes and rescoring candidates finds most of the exact top 10"""
+    vectors = clustered_vectors(3000)
+    queries = clustered_vectors(20, seed=1)
+    index = QuantizedIndex(str(tmp_path), quantization=quantization, pq_training_vectors=2000)
+    index.append(vectors[:2500])
+    index.append(vectors[2500:])
+
+    assert index.codebooks is not None or quantization == "int8"
+    assert recall(index, vectors, queries) >= 0.9
+    row, distance = index.search(vectors[7], 1)[0]
+    assert row == 7 and distance == pytest.approx(0.0, abs=1e-5)
+    assert index.memory_bytes() < vectors.nbytes / 3
+
+def test_untrained_pq_searches_exactly_and_deletes_are_skipped(tmp_path):
+    vectors = clustered_vectors(200)
+    index = QuantizedIndex(str(tmp_path), quantization="pq", pq_training_vectors=1000)
+    index.append(vectors)
+
+    assert index.codebooks is None
+    assert [row for row, _ in index.search(vectors[3], 5)] == exact_top(vectors, vectors[3], 5)
+    index.delete([3])
+    assert 3 not in [row for row, _ in index.search(vectors[3], 5)]
+    assert index.live_count() == 199
+
+def test_reopened_index_drops_rows_past_the_recorded_count(tmp_path):
+    """Bytes appended after the last saved row count, e.g. by a crash, are ignored"""
+    vectors = clustered_vectors(50)
+    index = QuantizedIndex(str(tmp_path))
+    index.append(vectors)
+    with open(tmp_path / "vectors.f32", "ab") as file:
+        file.write(b"\0" * 100)
+
+    reopened = QuantizedIndex(str(tmp_path))
+    assert reopened.rows == 50 and reopened.dimension == 32
+    assert reopened.search(vectors[10], 1)[0][0] == 10
+
+def make_db(tmp_path, provider=None):
+    return QuantizedVectorDatabase(
+        embedding_provider=provider or FakeEmbeddingProvider(), persist_directory=str(tmp_path)
+    )
+
+def test_quantized_database_stores_searches_and_deletes(tmp_path):
+    provider = FakeEmbeddingProvider()
+    db = make_db(tmp_path, provider)
+    texts = ["vacation policy days", "vacation carry over rules", "api rate limits"]
+    metadatas = [
+        {"document_id": "a", "chunk_index": 0, "file_type": "pdf"},
+        {"document_id": "a", "chunk_index": 1, "file_type": "pdf"},
+        {"document_id": "b", "chunk_index": 0, "file_type": "md"},
+    ]
+    assert db.add_documents(texts, metadatas, ["a_0", "a_1", "b_0"])
+    assert db.add_documents(texts[:1], metadatas[:1], ["a_0"])
+    assert db.get_document_count() == 3
+
+    results = db.similarity_search(query_embedding=provider.embed_query("api rate limits"), n_results=2)
+    assert results["ids"][0][0] == "b_0"
+    assert results["metadatas"][0][0]["file_type"] == "md"
+    assert [r["ids"][0][0] for r in db.batch_similarity_search(provider.embed(texts), n_results=1)] == [
+        "a_0", "a_1", "b_0"
+    ]
+
+    db.update_metadatas(["a_1"], [{"document_name": "handbook.pdf"}])
+    assert db.get_chunks(["a_1"])["metadatas"][0] == {
+        "document_id": "a", "chunk_index": 1, "file_type": "pdf", "document_name": "handbook.pdf"
+    }
+    assert sorted(db.list_documents()) == ["a", "b"]
+    assert len(db.get_document_summaries()) == 2
+
+    query = provider.embed_query("vacation")
+    filtered = db.filtered_search(query, 5, QueryFilters(file_types=["pdf"]), {"a": 2}, 3)
+    assert set(filtered["ids"][0]) == {"a_0", "a_1"}
+
+    assert db.delete_documents("a")
+    assert db.get_document_count() == 1
+    assert db.similarity_search(query_embedding=query, n_results=5)["ids"][0] == ["b_0"]
+
+def test_filtered_search_strategies_agree(tmp_path, monkeypatch):
+    """The exact per-document path and the masked scan return the same chunks"""
+    provider = FakeEmbeddingProvider()
+    db = make_db(tmp_path, provider)
+    texts = [f"policy section {i} about topic {i % 7}" for i in range(60)]
+    metadatas = [{"document_id": f"d{i % 6}", "chunk_index": i // 6} for i in range(60)]
+    db.add_documents(texts, metadatas, [f"c{i}" for i in range(60)])
+    query = provider.embed_query("policy topic 3")
+    documents = {"d1": 10, "d4": 10}
+
+    scoped = db.filtered_search(query, 5, QueryFilters(), documents, 60)
+    monkeypatch.setattr(settings, "SCOPED_SEARCH_MAX_CHUNKS", 0)
+    masked = db.filtered_search(query, 5, QueryFilters(), documents, 60)
+
+    assert scoped["ids"][0] == masked["ids"][0]
+    assert {metadata["document_id"] for metadata in masked["metadatas"][0]} <= set(documents)
+
+def test_reopen_reconciles_vectors_without_records(tmp_path):
+    """Vectors appended without their chunk records are not returned after a restart"""
+    provider = FakeEmbeddingProvider()
+    db = make_db(tmp_path, provider)
+    db.add_documents(["vacation policy days"], [{"document_id": "a", "chunk_index": 0}], ["a_0"])
+    db.index.append(provider.embed(["orphaned vector"]))
+    db.close()
+
+    reopened = make_db(tmp_path, provider)
+    assert reopened.index.live_count() == reopened.get_document_count() == 1
+    results = reopened.similarity_search(query_embedding=provider.embed_query("orphaned vector"), n_results=5)
+    assert results["ids"][0] == ["a_0"]
+
+    reopened.close()
+    with pytest.raises(EmbeddingConfigurationError):
+        make_db(tmp_path, FakeEmbeddingProvider(model_name="other-model", dimension=8))
+
+@pytest.mark.parametrize("quantization", ["none", "int8", "pq"])
+def test_batched_search_matches_single_searches(tmp_path, quantization):
+    vectors = clustered_vectors(1500)
+    queries = clustered_vectors(7, seed=2)
+    index = QuantizedIndex(str(tmp_path), quantization=quantization, pq_training_vectors=1000)
+    index.append(vectors)
+    allowed = np.arange(len(vectors)) % 3 == 0
+
+    for mask in (None, allowed):
+        batched = index.search_batch(queries, 5, mask)
+        single = [index.search(query, 5, mask) for query in queries]
+        assert [[row for row, _ in hits] for hits in batched] == [[row for row, _ in hits] for hits in single]
+        assert np.allclose([[d for _, d in hits] for hits in batched], [[d for _, d in hits] for hits in single])
+    if quantization == "none":
+        assert [[row for row, _ in hits] for hits in index.search_batch(queries, 5)] == [
+            exact_top(vectors, query, 5) for query in queries
+        ]
+
+def test_deletes_compact_the_flat_index(tmp_path, monkeypatch):
+    """Enough deletes rewrite the index without them; searches and reopening see renumbered rows"""
+    monkeypatch.setattr(settings, "COMPACTION_MIN_TOMBSTONES", 10)
+    monkeypatch.setattr(settings, "COMPACTION_TOMBSTONE_FRACTION", 0.5)
+    provider = FakeEmbeddingProvider()
+    db = QuantizedVectorDatabase(embedding_provider=provider, persist_directory=str(tmp_path), quantization="none")
+    texts = [f"policy section {i} about topic {i % 7}" for i in range(60)]
+    db.add_documents(texts, [{"document_id": f"d{i % 3}", "chunk_index": i // 3} for i in range(60)],
+                     [f"c{i}" for i in range(60)])
+    query = provider.embed_query(texts[59])
+
+    db.delete_documents("d0")
+    assert db.index.rows == 60 and db.index.generation == 0
+    db.delete_documents("d1")
+    assert db.index.rows == db.get_document_count() == 20
+    assert db.index.generation == 1
+    assert db.similarity_search(query_embedding=query, n_results=1)["ids"][0] == ["c59"]
+    db.close()
+
+    reopened = QuantizedVectorDatabase(embedding_provider=provider, persist_directory=str(tmp_path))
+    assert reopened.index.quantization == "none" and reopened.index.rows == 20
+    assert reopened.similarity_search(query_embedding=query, n_results=1)["ids"][0] == ["c59"]
+
+def test_interrupted_compaction_is_discarded_or_finished(tmp_path):
+    """A compaction whose rows were not committed is dropped on open; a committed one is completed"""
+    vectors = clustered_vectors(30)
+    index = QuantizedIndex(str(tmp_path), quantization="none")
+    index.append(vectors)
+    index.delete(range(10))
+    index.prepare_compaction()
+
+    assert QuantizedIndex(str(tmp_path), generation=0).rows == 30
+    index.prepare_compaction()
+    reopened = QuantizedIndex(str(tmp_path), generation=1)
+    assert reopened.rows == 20 and reopened.live_count() == 20
+    assert reopened.search(vectors[15], 1)[0][0] == 5
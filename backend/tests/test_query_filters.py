@@ -0,0 +1,107 @@
+from datetime import datetime
+
+from app import vector_db as vector_db_module
+from app.config import settings
+from app.models import QueryFilters
+from app.quantized_vector_db import QuantizedVectorDatabase
+from app.query_filters import build_where, matches, matches_where
+from app.vector_db import VectorDatabase
+from fakes import FakeEmbeddingProvider
+
+JAN = datetime(2026, 1, 15).timestamp()
+MAR = datetime(2026, 3, 15).timestamp()
+
+def make_db(tmp_path, backend=VectorDatabase, **options):
+    provider = FakeEmbeddingProvider()
+    db = backend(embedding_provider=provider, persist_directory=str(tmp_path), **options)
+    rows = [
+        ("a_0", "vacation policy days", "a", "pdf", "handbook.pdf", JAN),
+        ("a_1", "vacation carry over rules", "a", "pdf", "handbook.pdf", JAN),
+        ("b_0", "vacation request form", "b", "docx", "forms.docx", MAR),
+        ("c_0", "api rate limits", "c", "md", "api.md", MAR),
+    ]
+    metadatas = [
+        {"document_id": doc, "file_type": file_type, "filename": filename, "upload_timestamp": timestamp}
+        for _, _, doc, file_type, filename, timestamp in rows
+    ]
+    texts = [row[1] for row in rows]
+    db.add_documents(texts, metadatas, [row[0] for row in rows], embeddings=provider.embed(texts))
+    return db, provider
+
+def test_build_where_and_matches_agree():
+    """The Chroma clause and the in-memory predicate express the same filters"""
+    filters = QueryFilters(file_types=["PDF", "docx"], uploaded_after=datetime(2026, 2, 1))
+    assert build_where(filters) == {"$and": [
+        {"file_type": {"$in": ["pdf", "docx"]}},
+        {"upload_timestamp": {"$gte": datetime(2026, 2, 1).timestamp()}},
+    ]}
+    assert build_where(QueryFilters(document_ids=["a"])) == {"document_id": "a"}
+    assert build_where(QueryFilters()) is None
+
+    assert matches(filters, {"file_type": "docx", "upload_timestamp": MAR})
+    assert not matches(filters, {"file_type": "pdf", "upload_timestamp": JAN})
+    assert not matches(filters, {"file_type": "docx"})
+
+def test_filters_are_pushed_into_the_vector_search(tmp_path):
+    """Filtered searches only return matching chunks, even when better matches exist elsewhere"""
+    db, provider = make_db(tmp_path)
+    query = provider.embed_query("vacation policy")
+
+    results = db.similarity_search(
+        query_embedding=query, n_results=3, where=build_where(QueryFilters(file_types=["docx", "md"]))
+    )
+    assert results["ids"][0] == ["b_0", "c_0"]
+
+    results = db.similarity_search(
+        query_embedding=query, n_results=3, where=build_where(QueryFilters(uploaded_before=datetime(2026, 2, 1)))
+    )
+    assert set(results["ids"][0]) == {"a_0", "a_1"}
+
+def test_flat_backend_applies_where_clauses_like_chroma(tmp_path):
+    """Where clauses given to the flat backend select the same chunks as in Chroma"""
+    chroma, provider = make_db(tmp_path / "chroma")
+    flat, _ = make_db(tmp_path / "flat", QuantizedVectorDatabase, quantization="none")
+    query = provider.embed_query("vacation policy")
+    for where in [
+        build_where(QueryFilters(file_types=["docx", "md"])),
+        build_where(QueryFilters(document_ids=["a", "c"], uploaded_after=datetime(2026, 1, 1))),
+        {"$or": [{"filename": "api.md"}, {"upload_timestamp": {"$lt": MAR}}]},
+        {"document_id": {"$nin": ["a"]}},
+    ]:
+        expected = chroma.similarity_search(query_embedding=query, n_results=3, where=where)["ids"][0]
+        assert flat.similarity_search(query_embedding=query, n_results=3, where=where)["ids"][0] == expected
+
+    assert matches_where({"$and": [{"file_type": "pdf"}, {"upload_timestamp": {"$gte": JAN}}]},
+                         {"file_type": "pdf", "upload_timestamp": JAN})
+    assert not matches_where({"missing": {"$ne": "x"}}, {"file_type": "pdf"})
+    assert flat.similarity_search(query_embedding=query, where={"file_type": {"$like": "p%"}})["ids"] == [[]]
+
+def test_scoped_search_matches_filtered_search(tmp_path):
+    """The per-document fast path ranks like Chroma and sees later changes"""
+    db, provider = make_db(tmp_path)
+    query = provider.embed_query("vacation rules")
+
+    chroma = db.similarity_search(query_embedding=query, n_results=5, where={"document_id": "a"})
+    scoped = db.scoped_search(["a"], query, n_results=5)
+    assert scoped["ids"][0] == chroma["ids"][0]
+    assert [round(d, 4) for d in scoped["distances"][0]] == [round(d, 4) for d in chroma["distances"][0]]
+
+    db.delete_chunks(["a_1"])
+    assert db.scoped_search(["a"], query, n_results=5)["ids"][0] == ["a_0"]
+
+def test_filtered_search_strategies_agree(tmp_path, monkeypatch):
+    """Scoped, over-fetch and where-clause searches return the same filtered top-k"""
+    db, provider = make_db(tmp_path)
+    query = provider.embed_query("vacation")
+    filters = QueryFilters(file_types=["pdf", "docx"])
+    documents = {"a": 2, "b": 1}
+
+    scoped = db.filtered_search(query, 2, filters, documents, 4)
+    monkeypatch.setattr(settings, "SCOPED_SEARCH_MAX_CHUNKS", 0)
+    overfetched = db.filtered_search(query, 2, filters, documents, 4)
+    monkeypatch.setattr(vector_db_module, "FILTER_OVERFETCH_MAX_RESULTS", 0)
+    where = db.filtered_search(query, 2, filters, documents, 4)
+
+    assert scoped["ids"][0] == overfetched["ids"][0] == where["ids"][0]
+    assert overfetched["metadatas"][0][0]["document_id"] in documents
+    assert db.filtered_search(query, 2, filters, {}, 4)["ids"] == [[]]
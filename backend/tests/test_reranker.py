@@ -0,0 +1,58 @@
+import pytest
+
+from app.models import DocumentChunk
+from app.reranker import Reranker, CrossEncoderReranker
+
+class WordOverlapReranker(Reranker):
+    """Scores texts by the number of query words they contain"""
+    name = "word-overlap"
+
+    def __init__(self, cache_max_entries: int = 100):
+        super().__init__(cache_max_entries)
+        self.batches = []
+
+    def score(self, query, texts):
+        self.batches.append(len(texts))
+        words = set(query.lower().split())
+        return [float(len(words & set(text.lower().split()))) for text in texts]
+
+def make_chunks(texts, token_count=100):
+    return [
+        DocumentChunk(
+            id=f"doc_{i}", document_id="doc", content=text,
+            metadata={"token_count": token_count}, chunk_index=i
+        )
+        for i, text in enumerate(texts)
+    ]
+
+def test_rerank_keeps_best_chunks_in_one_batch():
+    """All candidates are scored in a single call and the top_k are kept in score order"""
+    reranker = WordOverlapReranker()
+    chunks = make_chunks(["nothing here", "reset the password", "password", "unrelated text"])
+
+    kept = reranker.rerank("how to reset password", chunks, top_k=2)
+
+    assert [chunk.id for chunk in kept] == ["doc_1", "doc_2"]
+    assert kept[0].metadata["rerank_score"] == 2.0
+    assert reranker.batches == [4]
+    assert reranker.get_stats()["prompt_tokens_saved"] == 200
+
+def test_scores_are_cached_per_query_and_chunk():
+    """A repeated query only scores chunks it has not seen, and the cache is bounded"""
+    reranker = WordOverlapReranker(cache_max_entries=4)
+    chunks = make_chunks(["a b", "b c", "c d"])
+
+    reranker.rerank("B", chunks, top_k=1)
+    reranker.rerank("b?", chunks, top_k=1)
+    assert reranker.batches == [3]
+
+    reranker.rerank("b", make_chunks(["a b", "b c", "c d", "d e"]), top_k=1)
+    stats = reranker.get_stats()
+    assert reranker.batches == [3, 1]
+    assert stats["cache_hits"] == 6
+    assert stats["cache_entries"] == 4
+
+def test_cross_encoder_requires_model_files(tmp_path):
+    """A missing model directory is reported when the reranker is created"""
+    with pytest.raises(ValueError, match="model.onnx"):
+        CrossEncoderReranker(model_path=str(tmp_path))
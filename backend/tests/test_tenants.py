@@ -0,0 +1,101 @@
+import asyncio
+
+from app import rag_service as rag_module
+from app.document_catalog import DocumentCatalog
+from app.rag_service import RAGService
+from app.tenants import TenantManager, TenantStore, current_tenant, validate_tenant_id
+from app.vector_db import VectorDatabase
+from fakes import FakeEmbeddingProvider, FakeOpenAIService
+
+import pytest
+
+class SizedVectorDatabase:
+    """Stands in for a tenant's vector database with a fixed memory estimate"""
+
+    def __init__(self, memory):
+        self.memory = memory
+        self.closed = False
+
+    def memory_bytes(self):
+        return self.memory
+
+    def close(self):
+        self.closed = True
+
+def test_tenant_ids_are_validated():
+    assert validate_tenant_id("acme-corp_2") == "acme-corp_2"
+    for invalid in ["", "../etc", "a b", "-leading", "x" * 49]:
+        with pytest.raises(ValueError):
+            validate_tenant_id(invalid)
+
+def test_idle_tenants_are_evicted_least_recently_used_first():
+    """Loads beyond the budget close the least recently used idle, unpinned stores"""
+    opened = []
+
+    def open_store(tenant_id):
+        opened.append(tenant_id)
+        return TenantStore(tenant_id, SizedVectorDatabase(100), None)
+
+    manager = TenantManager(open_store, memory_budget_bytes=250, pinned=("default",))
+    stores = {}
+    for tenant_id in ["default", "a", "b"]:
+        stores[tenant_id] = manager.acquire(tenant_id)
+        manager.release(stores[tenant_id])
+    assert manager.loaded_tenants() == ["default", "b"]
+    assert stores["a"].vector_db.closed
+
+    # A store in use is kept even over budget, and a loaded one is not reopened
+    busy = manager.acquire("b")
+    manager.acquire("c")
+    assert manager.loaded_tenants() == ["default", "b", "c"]
+    assert manager.acquire("b") is busy
+    assert opened == ["default", "a", "b", "c"]
+    stats = manager.get_stats()
+    assert stats["evictions"] == 1
+    assert stats["resident_bytes"] == 300
+    assert stats["loaded"]["b"]["active_requests"] == 2
+
+def test_tenants_are_isolated_and_reload_after_eviction(tmp_path, monkeypatch):
+    """Each tenant sees only its own documents, including after being unloaded and loaded again"""
+    provider = FakeEmbeddingProvider()
+    monkeypatch.setattr(rag_module, "openai_service", FakeOpenAIService(provider))
+
+    def open_store(tenant_id):
+        directory = tmp_path / tenant_id
+        return TenantStore(
+            tenant_id,
+            VectorDatabase(embedding_provider=provider, persist_directory=str(directory / "chroma")),
+            DocumentCatalog(str(directory / "catalog.db"))
+        )
+
+    service = RAGService()
+    # Every load evicts the other idle tenants
+    service.tenants = TenantManager(open_store, memory_budget_bytes=1, pinned=())
+    notes = tmp_path / "notes.txt"
+    notes.write_text("Quarterly planning notes about the roadmap. " * 20)
+
+    async def as_tenant(tenant_id, action):
+        token = current_tenant.set(tenant_id)
+        try:
+            return await action()
+        finally:
+            current_tenant.reset(token)
+
+    async def scenario():
+        uploaded = await as_tenant("acme", lambda: service.upload_document(str(notes), "notes.txt"))
+        globex_documents, globex_total = await as_tenant("globex", service.list_documents)
+        acme_stats = await as_tenant("acme", service.get_document_stats)
+        return uploaded, globex_total, acme_stats
+
+    uploaded, globex_total, acme_stats = asyncio.run(scenario())
+
+    assert globex_total == 0
+    assert acme_stats["tenant"] == "acme"
+    assert acme_stats["total_documents"] == 1
+    assert acme_stats["total_chunks"] == uploaded.chunk_count
+    tenants = acme_stats["tenants"]
+    assert tenants["loads"] == 3 and tenants["evictions"] == 2
+    assert list(tenants["loaded"]) == ["acme"]
+    assert tenants["loaded"]["acme"]["resident_bytes"] > 0
+    assert tenants["loaded"]["acme"]["load_seconds"] > 0
+    service.tenants.close_all()
@@ -0,0 +1,35 @@
+import pytest
+
+from app.embeddings import EmbeddingConfigurationError
+from app.vector_db import VectorDatabase
+from fakes import FakeEmbeddingProvider
+
+def test_precomputed_embeddings_are_stored(tmp_path):
+    """add_documents stores the caller's vectors instead of embedding again"""
+    provider = FakeEmbeddingProvider()
+    db = VectorDatabase(embedding_provider=provider, persist_directory=str(tmp_path))
+    chunks = ["vacation policy days", "api rate limits"]
+    embeddings = provider.embed(chunks)
+    calls = provider.calls
+
+    assert db.add_documents(chunks, [{"document_id": "d"}] * 2, ["d_0", "d_1"], embeddings=embeddings)
+    assert provider.calls == calls
+
+    results = db.similarity_search(query_embedding=embeddings[1], n_results=1)
+    assert results["ids"][0] == ["d_1"]
+    assert provider.calls == calls
+
+def test_collection_records_embedding_model(tmp_path):
+    """The collection remembers the model and dimension it was built with"""
+    db = VectorDatabase(embedding_provider=FakeEmbeddingProvider(), persist_directory=str(tmp_path))
+    assert db.collection.metadata["embedding_model"] == "fake-model"
+    assert db.collection.metadata["embedding_dimension"] == 16
+
+def test_embedding_model_mismatch_fails_at_startup(tmp_path):
+    """Opening a collection with a different embedding model raises"""
+    VectorDatabase(embedding_provider=FakeEmbeddingProvider(), persist_directory=str(tmp_path))
+    with pytest.raises(EmbeddingConfigurationError):
+        VectorDatabase(
+            embedding_provider=FakeEmbeddingProvider(model_name="other-model", dimension=8),
+            persist_directory=str(tmp_path)
+        )
@@ -0,0 +1,231 @@
+import asyncio
+import random
+import shutil
+import threading
+import time
+
+import pytest
+
+from app import rag_service as rag_module
+from app.config import settings
+from app.document_catalog import DocumentCatalog
+from app.quantized_vector_db import QuantizedVectorDatabase
+from app.rag_service import RAGService
+from app.vector_db import VectorDatabase
+from app import write_coordinator
+from app.write_coordinator import WriteApplyError, WriteCoordinator, WRITE_LOG_FILE
+from fakes import FakeEmbeddingProvider, FakeOpenAIService, single_tenant
+
+def chunk(document, index):
+    return f"{document} section {index}", {"document_id": document, "chunk_index": index}, f"{document}_{index}"
+
+def add(coordinator, provider, document, count):
+    texts, metadatas, ids = zip(*(chunk(document, i) for i in range(count)))
+    assert coordinator.add_documents(list(texts), list(metadatas), list(ids), embeddings=provider.embed(list(texts)))
+
+def test_concurrent_writes_are_coalesced_and_visible_to_reads(tmp_path, monkeypatch):
+    """Writes from many threads are applied in a few calls, and a read sees every acknowledged write"""
+    monkeypatch.setattr(settings, "WRITE_BATCH_MAX_DELAY_MS", 60000)
+    provider = FakeEmbeddingProvider()
+    coordinator = WriteCoordinator(
+        VectorDatabase(embedding_provider=provider, persist_directory=str(tmp_path)), str(tmp_path)
+    )
+    threads = [threading.Thread(target=add, args=(coordinator, provider, f"d{n}", 5)) for n in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert coordinator.db.get_document_count() == 0
+
+    assert coordinator.get_document_count() == 60
+    assert coordinator.writes == 12 and coordinator.applied_calls == 1
+
+    coordinator.delete_documents("d0")
+    coordinator.delete_chunks(["d1_0", "d1_1", "d0_3"])
+    coordinator.update_metadatas(["d2_0"], [{"document_name": "a.pdf"}])
+    coordinator.update_metadatas(["d2_0"], [{"chunk_count": 5}])
+    assert sorted(coordinator.get_document_chunks("d1")) == ["d1_2", "d1_3", "d1_4"]
+    assert coordinator.get_document_count() == 53
+    assert coordinator.get_chunks(["d2_0"])["metadatas"][0] == {
+        "document_id": "d2", "chunk_index": 0, "document_name": "a.pdf", "chunk_count": 5
+    }
+    coordinator.close()
+    assert (tmp_path / WRITE_LOG_FILE).stat().st_size == 0
+
+@pytest.mark.parametrize("seed", range(3))
+def test_merged_writes_match_writes_applied_in_order(tmp_path, monkeypatch, seed):
+    """Interleaved adds, deletes and updates merged into one batch leave the same chunks as applied one by one"""
+    monkeypatch.setattr(settings, "WRITE_BATCH_MAX_DELAY_MS", 60000)
+    provider = FakeEmbeddingProvider()
+    rng = random.Random(seed)
+    direct = QuantizedVectorDatabase(
+        embedding_provider=provider, persist_directory=str(tmp_path / "direct"), quantization="none"
+    )
+    coordinator = WriteCoordinator(
+        QuantizedVectorDatabase(
+            embedding_provider=provider, persist_directory=str(tmp_path / "coordinated"), quantization="none"
+        ),
+        str(tmp_path / "coordinated")
+    )
+    all_ids = [f"d{document}_{index}" for document in range(3) for index in range(4)]
+    for db in (direct, coordinator):
+        db.add_documents([f"stored {chunk_id}" for chunk_id in all_ids[::2]],
+                         [{"document_id": chunk_id[:2], "chunk_index": 0} for chunk_id in all_ids[::2]], all_ids[::2])
+    coordinator.get_document_count()
+
+    for step in range(60):
+        ids = rng.sample(all_ids, 3)
+        operation = rng.choice(["add", "add", "delete_chunks", "delete_documents", "update"])
+        for db in (direct, coordinator):
+            if operation == "add":
+                db.add_documents([f"step {step} {chunk_id}" for chunk_id in ids],
+                                 [{"document_id": chunk_id[:2], "chunk_index": step} for chunk_id in ids], ids)
+            elif operation == "delete_chunks":
+                db.delete_chunks(ids)
+            elif operation == "delete_documents":
+                db.delete_documents(ids[0][:2])
+            else:
+                db.update_metadatas(ids, [{"step": step}] * len(ids))
+
+    assert coordinator.applied_calls < coordinator.writes / 3
+    expected, stored = direct.get_chunks(all_ids), coordinator.get_chunks(all_ids)
+    assert sorted(zip(stored["ids"], stored["documents"], map(str, stored["metadatas"]))) == sorted(
+        zip(expected["ids"], expected["documents"], map(str, expected["metadatas"]))
+    )
+    coordinator.close()
+    direct.close()
+
+def test_logged_writes_are_replayed_on_open(tmp_path, monkeypatch):
+    """Acknowledged writes that were never applied, e.g. after a crash, are applied by the next process"""
+    monkeypatch.setattr(settings, "WRITE_BATCH_MAX_DELAY_MS", 60000)
+    provider = FakeEmbeddingProvider()
+    first = tmp_path / "first"
+    coordinator = WriteCoordinator(
+        QuantizedVectorDatabase(embedding_provider=provider, persist_directory=str(first), quantization="none"),
+        str(first)
+    )
+    add(coordinator, provider, "a", 3)
+    add(coordinator, provider, "b", 2)
+    coordinator.delete_chunks(["a_2"])
+
+    # The log as a crash would leave it: nothing applied, the last record cut short
+    second = tmp_path / "second"
+    second.mkdir()
+    shutil.copy(first / WRITE_LOG_FILE, second / WRITE_LOG_FILE)
+    with open(second / WRITE_LOG_FILE, "ab") as file:
+        file.write(b'{"op": "delete_chunks", "ids": ["a_')
+
+    replayed = WriteCoordinator(
+        QuantizedVectorDatabase(embedding_provider=provider, persist_directory=str(second), quantization="none"),
+        str(second)
+    )
+    assert sorted(replayed.document_chunk_ids(["a", "b"])) == ["a_0", "a_1", "b_0", "b_1"]
+    results = replayed.similarity_search(query_embedding=provider.embed_query("b section 1"), n_results=1)
+    assert results["ids"][0] == ["b_1"]
+    assert (second / WRITE_LOG_FILE).stat().st_size == 0
+    replayed.close()
+    coordinator.close()
+
+class FlakyDatabase:
+    """Fails its adds and deletes while failing is set"""
+
+    def __init__(self, db):
+        self.db = db
+        self.failing = True
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    def add_documents(self, *args, **kwargs):
+        if self.failing:
+            return False
+        return self.db.add_documents(*args, **kwargs)
+
+    def delete_chunks(self, ids):
+        if self.failing:
+            raise OSError("disk full")
+        self.db.delete_chunks(ids)
+
+def test_failed_writes_are_kept_surfaced_and_retried(tmp_path, monkeypatch):
+    """Writes that fail to apply stay logged, make reads and writes raise, and apply once the database recovers"""
+    monkeypatch.setattr(write_coordinator, "APPLY_RETRY_SECONDS", 0.05)
+    provider = FakeEmbeddingProvider()
+    flaky = FlakyDatabase(
+        QuantizedVectorDatabase(embedding_provider=provider, persist_directory=str(tmp_path), quantization="none")
+    )
+    coordinator = WriteCoordinator(flaky, str(tmp_path))
+    add(coordinator, provider, "a", 3)
+    with pytest.raises(WriteApplyError):
+        coordinator.get_document_count()
+    with pytest.raises(WriteApplyError):
+        coordinator.delete_chunks(["a_0"])
+    assert not coordinator.add_documents(["b section 0"], [{"document_id": "b"}], ["b_0"])
+    assert coordinator._thread.is_alive()
+    assert (tmp_path / WRITE_LOG_FILE).stat().st_size > 0
+
+    flaky.failing = False
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            assert coordinator.get_document_count() == 3
+            break
+        except WriteApplyError:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    assert (tmp_path / WRITE_LOG_FILE).stat().st_size == 0
+
+    # Writes still failing at close stay in the log for the next open
+    flaky.failing = True
+    coordinator.delete_documents("a")
+    coordinator.close()
+    assert (tmp_path / WRITE_LOG_FILE).stat().st_size > 0
+    reopened = WriteCoordinator(
+        QuantizedVectorDatabase(embedding_provider=provider, persist_directory=str(tmp_path), quantization="none"),
+        str(tmp_path)
+    )
+    assert reopened.get_document_count() == 0
+    reopened.close()
+
+def test_embeddings_of_the_wrong_size_are_rejected_before_logging(tmp_path):
+    provider = FakeEmbeddingProvider()
+    coordinator = WriteCoordinator(
+        QuantizedVectorDatabase(embedding_provider=provider, persist_directory=str(tmp_path), quantization="none"),
+        str(tmp_path)
+    )
+    add(coordinator, provider, "a", 2)
+    assert not coordinator.add_documents(["short"], [{"document_id": "b"}], ["b_0"], embeddings=[[1.0, 0.0]])
+    assert coordinator.writes == 1 and coordinator.get_document_count() == 2
+    coordinator.close()
+
+def test_uploads_and_deletes_through_the_coordinator(tmp_path, monkeypatch):
+    """Uploading, replacing, querying and deleting behave as without the coordinator"""
+    provider = FakeEmbeddingProvider()
+    monkeypatch.setattr(rag_module, "openai_service", FakeOpenAIService(provider))
+    monkeypatch.setattr(rag_module, "embedding_provider", provider)
+    coordinator = WriteCoordinator(
+        VectorDatabase(embedding_provider=provider, persist_directory=str(tmp_path / "chroma")),
+        str(tmp_path / "chroma")
+    )
+    catalog = DocumentCatalog(str(tmp_path / "catalog.db"))
+    service = RAGService()
+    service.tenants = single_tenant(coordinator, catalog)
+
+    handbook = tmp_path / "handbook.txt"
+    handbook.write_text("Vacation days accrue monthly for every employee. " * 40)
+
+    async def scenario():
+        uploaded = await service.upload_document(str(handbook), "handbook.txt")
+        response = await service.query_knowledge_base("vacation days", max_chunks=2)
+        handbook.write_text("Expense reports are approved by the finance team. " * 40)
+        replaced = await service.upload_document(str(handbook), "handbook.txt", document_id=uploaded.document_id)
+        after = await service.query_knowledge_base("expense reports", max_chunks=2)
+        await service.delete_document(replaced.document_id)
+        return uploaded, response, replaced, after
+
+    uploaded, response, replaced, after = asyncio.run(scenario())
+
+    assert response.sources and response.sources[0].document_id == uploaded.document_id
+    assert replaced.chunks_removed > 0
+    assert "Expense" in after.sources[0].content
+    assert coordinator.get_document_count() == 0
+    coordinator.close()
@@ -43,8 +43,12 @@ const DocumentManager = () => {
     setUploadError(null);
 
     try {
-      const response = await apiService.uploadDocument(file);
-      console.log('Upload successful:', response);
+      const uploadJob = await apiService.uploadDocument(file);
+      const job = await apiService.waitForJob(uploadJob.id);
+      if (job.stage === 'failed') {
+        throw new Error(job.error || 'Document processing failed');
+      }
+      console.log('Upload successful:', job);
       await loadDocuments();
       await loadStats();
     } catch (error) {
@@ -10,7 +10,7 @@ const api = axios.create({
 });
 
 export const apiService = {
-  // Upload document
+  // Upload document; returns an ingestion job
   uploadDocument: async (file) => {
     const formData = new FormData();
     formData.append('file', file);
@@ -23,6 +23,23 @@ export const apiService = {
     return response.data;
   },
 
+  // Get ingestion job status
+  getJob: async (jobId) => {
+    const response = await api.get(`/jobs/${jobId}`);
+    return response.data;
+  },
+
+  // Wait for an ingestion job to finish
+  waitForJob: async (jobId, intervalMs = 1000) => {
+    for (;;) {
+      const job = await apiService.getJob(jobId);
+      if (job.stage === 'completed' || job.stage === 'failed') {
+        return job;
+      }
+      await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
+  },
+
   // Query documents
   queryDocuments: async (query, maxChunks = 5) => {
     const response = await api.post('/query', {